@@ -0,0 +1,17 @@
+# Copyright (C) 2014 Syed Haider Abidi, Nooruddin Ahmed and Christopher Dydula
+#
+# This file is part of traxis.
+#
+# traxis is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# traxis is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with traxis.  If not, see <http://www.gnu.org/licenses/>.
+
@@ -0,0 +1,38 @@
+# Copyright (C) 2014 Syed Haider Abidi, Nooruddin Ahmed and Christopher Dydula
+#
+# This file is part of traxis.
+#
+# traxis is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# traxis is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with traxis.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import numpy as np
+from PyQt5 import QtCore
+from traxis.calc import anglecalc
+
+
+def testAngleToMatchesQLineF():
+    rng = np.random.default_rng(0)
+    for test in range(1000):
+        line = tuple(rng.uniform(-100, 100, 4))
+        otherLine = tuple(rng.uniform(-100, 100, 4))
+        expected = QtCore.QLineF(*line).angleTo(QtCore.QLineF(*otherLine))
+        assert np.isclose(anglecalc._angleTo(line, otherLine), expected,
+                          rtol=0, atol=1e-9)
+
+def testAngleToWrap():
+    # a tiny negative angle difference must not wrap around to exactly 360
+    angles = anglecalc._angleTo((0, 0, 1, np.array([-1e-16, 0, 1e-16])),
+                                (0, 0, 1, 0))
+    assert ((angles >= 0) & (angles < 360)).all()
+    assert 0 <= anglecalc._angleTo((0, 0, 1, -1e-16), (0, 0, 1, 0)) < 360
@@ -0,0 +1,50 @@
+# Copyright (C) 2014 Syed Haider Abidi, Nooruddin Ahmed and Christopher Dydula
+#
+# This file is part of traxis.
+#
+# traxis is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# traxis is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with traxis.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+from traxis import batch
+
+
+def rejectConstant(name):
+    """Raise ValueError for the non-standard JSON constant name."""
+
+    raise ValueError("Invalid JSON constant: {}".format(name))
+
+def testCollinearSessionJsonl(tmp_path):
+    # the infinite errors of a fit to collinear markers must be written as
+    # null, keeping every line valid (strict) JSON
+    points = [{'designation': None, 'x': 100. + 50 * index, 'y': 300.}
+              for index in range(8)]
+    points[0]['designation'] = 'start'
+    points[-1]['designation'] = 'end'
+    sessionFileName = tmp_path / 'collinear.json'
+    sessionFileName.write_text(json.dumps(
+        {'imageFileName': 'missing.png', 'points': points, 'dl': '0',
+         'refInitialPoint': {'x': 100, 'y': 100},
+         'refFinalPoint': {'x': 300, 'y': 150}}))
+    outFileName = tmp_path / 'results.jsonl'
+
+    assert batch.main([str(sessionFileName), '-f', 'jsonl', '-j', '1',
+                       '-o', str(outFileName)]) == 0
+    lines = outFileName.read_text().splitlines()
+    assert len(lines) == 1
+    result = json.loads(lines[0], parse_constant=rejectConstant)
+    assert result['error'] is None
+    assert result['radius'] > 1e6
+    assert result['radiusErr'] is None
+    assert result['momentumStatErr'] is None
+    assert result['points'] == 8
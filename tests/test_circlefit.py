@@ -0,0 +1,337 @@
+# Copyright (C) 2014 Syed Haider Abidi, Nooruddin Ahmed and Christopher Dydula
+#
+# This file is part of traxis.
+#
+# traxis is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# traxis is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with traxis.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import numpy as np
+import pytest
+from traxis.calc import circlefit, measure
+
+
+def arcPoints(radius, count, arcLength, noise=0, seed=0):
+    """Return arrays of the coordinates of count points spread evenly along
+    an arc of the given radius and length, centred on (0, radius) and
+    starting at the origin, smeared by Gaussian noise of the given standard
+    deviation.
+    """
+
+    rng = np.random.default_rng(seed)
+    angles = np.linspace(0, arcLength / radius, count)
+    xArray = radius * np.sin(angles) + noise * rng.standard_normal(count)
+    yArray = radius * (1 - np.cos(angles)) + \
+             noise * rng.standard_normal(count)
+
+    return xArray, yArray
+
+def assertSameFit(fitParams, otherParams, rel=1e-6, errRel=1e-4,
+                  keys=None):
+    """Assert that two dicts of fit parameters (or of arrays of them) are
+    the same. The centre coordinates and radius must agree to within rel
+    times the radius, or to within a thousandth of their errors if that is
+    more (the minimum of the fit of a nearly straight track is very
+    shallow), and the errors to within errRel of each other.
+    """
+
+    for key in keys or ('centerX', 'centerY', 'radius', 'centerXErr',
+                        'centerYErr', 'radiusErr'):
+        expected = np.asarray(otherParams[key])
+        if key.endswith('Err'):
+            tolerance = errRel * np.abs(expected)
+        else:
+            tolerance = rel * np.abs(otherParams['radius'])
+            if key + 'Err' in otherParams:
+                tolerance = np.maximum(tolerance,
+                                       1e-3 * otherParams[key + 'Err'])
+        assert (np.abs(fitParams[key] - expected) <= tolerance).all(), key
+
+@pytest.mark.parametrize('method', circlefit.METHODS)
+def testExactCircle(method):
+    # every method must recover a circle from points exactly on it
+    angles = np.radians(np.linspace(10, 130, 12))
+    xArray = 250 + 400 * np.cos(angles)
+    yArray = 600 - 400 * np.sin(angles)
+    fitParams = circlefit.fitCircle(xArray, yArray, method)
+    assert fitParams['centerX'] == pytest.approx(250, abs=1e-6)
+    assert fitParams['centerY'] == pytest.approx(600, abs=1e-6)
+    assert fitParams['radius'] == pytest.approx(400, abs=1e-6)
+
+@pytest.mark.parametrize('method', circlefit.METHODS)
+def testNoisyArc(method):
+    # on a noisy arc all the methods must agree with the geometric fit well
+    # within its errors
+    xArray, yArray = arcPoints(600, 20, 700, 0.5)
+    geometricParams = circlefit.fitCircle(xArray, yArray)
+    fitParams = circlefit.fitCircle(xArray, yArray, method)
+    assert abs(fitParams['radius'] - geometricParams['radius']) < \
+           0.2 * geometricParams['radiusErr']
+    assert abs(fitParams['radius'] - 600) < 3 * fitParams['radiusErr']
+
+def testUnknownMethod():
+    with pytest.raises(ValueError):
+        circlefit.fitCircle([0, 1, 2], [0, 1, 0], 'circular')
+
+def testDistanceJacobian():
+    # the analytic Jacobian must match central finite differences of the
+    # residuals, with and without weights
+    xArray, yArray = arcPoints(600, 10, 500, 0.5)
+    weights = np.random.default_rng(2).uniform(0.5, 2, len(xArray))
+    center = np.array([30., 580.])
+    for pointWeights in (None, weights):
+        jacobian = circlefit._distanceJacobian(center, xArray, yArray,
+                                               pointWeights)
+        for column, step in enumerate(np.eye(2) * 1e-4):
+            difference = (circlefit._distanceResiduals(
+                center + step, xArray, yArray, pointWeights) - \
+                circlefit._distanceResiduals(
+                center - step, xArray, yArray, pointWeights)) / 2e-4
+            assert np.allclose(jacobian[:, column], difference, atol=1e-8)
+
+@pytest.mark.parametrize('method', circlefit.METHODS)
+@pytest.mark.parametrize('weighted', [False, True])
+def testFitCirclesMatchesFitCircle(method, weighted):
+    # the batched fit of many sets must give the fits of each set
+    rng = np.random.default_rng(5)
+    sets = [arcPoints(10**rng.uniform(2, 5), rng.integers(3, 40),
+                      rng.uniform(50, 1500), 0.5, seed)
+            for seed in range(50)]
+    xArray = np.concatenate([xSet for xSet, ySet in sets])
+    yArray = np.concatenate([ySet for xSet, ySet in sets])
+    offsets = np.concatenate(([0], np.cumsum([len(xSet)
+                                              for xSet, ySet in sets])))
+    weights = rng.uniform(0.2, 5, len(xArray)) if weighted else None
+
+    batchParams = circlefit.fitCircles(xArray, yArray, offsets, method,
+                                       weights=weights)
+    for index in range(len(sets)):
+        part = slice(offsets[index], offsets[index + 1])
+        fitParams = circlefit.fitCircle(
+            xArray[part], yArray[part], method,
+            None if weights is None else weights[part])
+        # sets of 3 points fit exactly and have no errors
+        keys = ('centerX', 'centerY', 'radius') \
+               if offsets[index + 1] - offsets[index] == 3 else None
+        assertSameFit({key: values[index]
+                       for key, values in batchParams.items()},
+                      fitParams, keys=keys)
+
+def testFitCirclesUnweighted():
+    # without weights the batched fit uses unit weights, bit for bit
+    xArray, yArray = arcPoints(800, 30, 900, 0.5)
+    offsets = [0, 12, 30]
+    fitParams = circlefit.fitCircles(xArray, yArray, offsets)
+    weightedParams = circlefit.fitCircles(xArray, yArray, offsets,
+                                          weights=np.ones(30))
+    for key in fitParams:
+        assert np.array_equal(fitParams[key], weightedParams[key])
+
+def testFitCirclesTooFewPoints():
+    with pytest.raises(ValueError):
+        circlefit.fitCircles([0, 1, 2, 3, 4], [0, 1, 0, 1, 2], [0, 2, 5])
+
+@pytest.mark.parametrize('method', circlefit.METHODS)
+def testEqualWeights(method):
+    # only the relative weights matter, so equal weights of any size give
+    # the same fit as no weights
+    xArray, yArray = arcPoints(600, 15, 600, 0.5)
+    fitParams = circlefit.fitCircle(xArray, yArray, method)
+    for weight in (1, 0.04, 250):
+        assertSameFit(circlefit.fitCircle(xArray, yArray, method,
+                                          np.full(15, weight)),
+                      fitParams, rel=1e-9, errRel=1e-9)
+
+def testWeights():
+    # a point with a tiny weight has no influence on the fit, and scaling
+    # all the weights changes nothing
+    xArray, yArray = arcPoints(600, 15, 600, 0.5)
+    cleanParams = circlefit.fitCircle(xArray, yArray)
+    xArray = np.append(xArray, xArray[7] + 40)
+    yArray = np.append(yArray, yArray[7])
+    weights = np.append(np.ones(15), 1e-12)
+    fitParams = circlefit.fitCircle(xArray, yArray, weights=weights)
+    assertSameFit(fitParams,
+                  circlefit.fitCircle(xArray, yArray, weights=weights * 9),
+                  rel=1e-9, errRel=1e-9)
+    assertSameFit(fitParams, cleanParams, rel=1e-6,
+                  keys=('centerX', 'centerY', 'radius'))
+
+@pytest.mark.parametrize('method', ['kasa', 'pratt', 'taubin'])
+def testIncrementalFit(method):
+    # adding, moving and removing points must give the algebraic fit of the
+    # current points
+    xArray, yArray = arcPoints(600, 20, 800, 0.5)
+    incrementalFit = circlefit.IncrementalCircleFit()
+    assert incrementalFit.fit(method) is None
+    for x, y in zip(xArray, yArray):
+        incrementalFit.addPoint(x, y)
+    assert incrementalFit.count() == 20
+    fitParams = circlefit.fitCircle(xArray, yArray, method)
+    assertSameFit(incrementalFit.fit(method), fitParams,
+                  keys=('centerX', 'centerY', 'radius'))
+
+    incrementalFit.movePoint(xArray[4], yArray[4], xArray[4] + 3,
+                             yArray[4] - 2)
+    incrementalFit.removePoint(xArray[10], yArray[10])
+    xArray[4] += 3
+    yArray[4] -= 2
+    xArray, yArray = np.delete(xArray, 10), np.delete(yArray, 10)
+    assert incrementalFit.count() == 19
+    assertSameFit(incrementalFit.fit(method),
+                  circlefit.fitCircle(xArray, yArray, method),
+                  keys=('centerX', 'centerY', 'radius'))
+
+    for x, y in zip(xArray, yArray):
+        incrementalFit.removePoint(x, y)
+    assert incrementalFit.count() == 0
+    assert incrementalFit.origin is None
+
+@pytest.mark.parametrize('windowSize', [3, 5, 12])
+def testFitWindows(windowSize):
+    # the windowed fits must be the algebraic fits of each window
+    xArray, yArray = arcPoints(900, 40, 1500, 0.5)
+    centerX, centerY, radius = circlefit.fitWindows(xArray, yArray,
+                                                    windowSize)
+    assert len(radius) == 40 - windowSize + 1
+    for start in range(len(radius)):
+        fitParams = circlefit.fitCircle(xArray[start:start + windowSize],
+                                        yArray[start:start + windowSize],
+                                        'taubin')
+        assertSameFit({'centerX': centerX[start], 'centerY': centerY[start],
+                       'radius': radius[start]}, fitParams,
+                      keys=('centerX', 'centerY', 'radius'))
+
+@pytest.mark.parametrize('weighted', [False, True])
+def testRobustFit(weighted):
+    # mis-placed markers must be flagged as outliers and not pull the fit
+    xArray, yArray = arcPoints(600, 30, 900, 0.5)
+    weights = np.full(30, 4.) if weighted else None
+    cleanParams = circlefit.fitCircle(xArray, yArray, weights=weights)
+    outliers = [3, 17, 18]
+    yArray[outliers] += [30, -25, 40]
+
+    fitParams, isOutlier = circlefit.fitCircleRobust(xArray, yArray,
+                                                     weights)
+    assert np.array_equal(np.flatnonzero(isOutlier), outliers)
+    assert abs(fitParams['radius'] - cleanParams['radius']) < \
+           cleanParams['radiusErr']
+
+    # without outliers the fit is close to the plain one. Points in the
+    # tails of the noise may still be flagged
+    xArray, yArray = arcPoints(600, 30, 900, 0.5)
+    fitParams, isOutlier = circlefit.fitCircleRobust(xArray, yArray,
+                                                     weights)
+    assert isOutlier.sum() <= 2
+    assert abs(fitParams['radius'] - cleanParams['radius']) < \
+           0.2 * cleanParams['radiusErr']
+
+@pytest.mark.parametrize('method', ['geometric', 'hybrid'])
+def testNearStraightTracks(method):
+    # nearly straight tracks make the fit started from the centroid run off
+    # to a centre ~1e10 px away, where J^T.J is singular. The geometric fit
+    # must notice that and fall back to the Taubin start
+    rng = np.random.default_rng(1)
+    for track in range(200):
+        radius = 10**rng.uniform(4, 7)
+        xArray, yArray = arcPoints(radius, rng.integers(5, 30),
+                                   rng.uniform(200, 2000), 0.5, track)
+        fitParams = circlefit.fitCircle(xArray, yArray, method)
+
+        # the fit must reach the same minimum as the batched fit
+        batchParams = circlefit.fitCircles(xArray, yArray,
+                                           [0, len(xArray)])
+        cost = (circlefit._distanceResiduals(
+            (fitParams['centerX'], fitParams['centerY']),
+            xArray, yArray)**2).sum()
+        batchCost = (circlefit._distanceResiduals(
+            (batchParams['centerX'][0], batchParams['centerY'][0]),
+            xArray, yArray)**2).sum()
+        assert cost <= batchCost * (1 + 1e-6)
+        assert np.isfinite(fitParams['radiusErr'])
+
+def testUnconvergedFit(monkeypatch):
+    # a fit that leastsq reports as not converged must not be passed off as
+    # the optimum
+    xArray, yArray = arcPoints(600, 30, 900, 0.5)
+    def failingLeastsq(func, x0, **kwargs):
+        """Return the starting point and the ier flag of a fit that ran
+        out of function evaluations.
+        """
+
+        return np.asarray(x0, dtype=np.float64), 5
+    monkeypatch.setattr(circlefit.optimize, 'leastsq', failingLeastsq)
+
+    for method in ('geometric', 'hybrid'):
+        fitParams = circlefit.fitCircle(xArray, yArray, method)
+        assert np.isfinite(fitParams['radius'])
+        assert np.isinf(fitParams['radiusErr'])
+        assert np.isinf(fitParams['centerXErr'])
+        assert np.isinf(fitParams['centerYErr'])
+
+    fitParams, isOutlier = circlefit.fitCircleRobust(xArray, yArray)
+    assert np.isinf(fitParams['radiusErr'])
+
+def testCollinearPoints():
+    # exactly collinear points have no best fitting circle. The fit must
+    # still return a (huge) circle through them with infinite errors
+    for xArray, yArray in [(np.arange(10.) * 50, np.full(10, 100.)),
+                           (np.arange(9.) * 50, np.arange(9.) * 50),
+                           (np.arange(10.) * 50, np.arange(10.) * 100 + 3)]:
+        circleParams, startAngle, spanAngle = measure.fitTrack(
+            xArray, yArray, xArray[0], yArray[0], xArray[-1], yArray[-1])
+        assert circleParams['radius'] > 1e6 * np.ptp(xArray) / 10
+        assert np.isinf(circleParams['radiusErr'])
+        assert np.isinf(circleParams['centerXErr'])
+        assert np.isinf(circleParams['centerYErr'])
+        assert np.isfinite(startAngle) and np.isfinite(spanAngle)
+
+        # the robust and batched fits must do the same
+        fitParams, isOutlier = circlefit.fitCircleRobust(xArray, yArray)
+        assert fitParams['radius'] == pytest.approx(circleParams['radius'])
+        assert np.isinf(fitParams['radiusErr']) and not isOutlier.any()
+        batchParams = circlefit.fitCircles(xArray, yArray,
+                                           [0, len(xArray)])
+        assert batchParams['radius'][0] == \
+               pytest.approx(circleParams['radius'])
+        assert np.isinf(batchParams['radiusErr'][0])
+
+def testStraightWindows():
+    # windows of collinear markers have an infinite radius, and are left
+    # out of the extrapolation of the momentum profile
+    xArray = np.arange(10.) * 10
+    yArray = np.where(xArray < 50, 0, (xArray - 40)**2 / 50)
+    centerX, centerY, radius = circlefit.fitWindows(xArray, yArray, 4)
+    assert np.isinf(radius[:2]).all() and np.isfinite(radius[2:]).all()
+    assert np.isfinite(centerX).all() and np.isfinite(centerY).all()
+    assert (abs(centerY[:2]) > 1e6).all()
+
+    # the track goes counter-clockwise from its start point, the last
+    # marker, so the straight windows come last
+    circleParams = circlefit.fitCircle(xArray, yArray)
+    profile = measure.momentumProfile(
+        xArray, yArray, circleParams, xArray[-1], yArray[-1], 4, 0.01, 1e-4,
+        15.5, 0.3)
+    isFinite = np.isfinite(profile['momentum'])
+    assert isFinite.tolist() == [True] * 5 + [False] * 2
+    assert np.isfinite(profile['startMomentum'])
+    assert profile['startMomentum'] == pytest.approx(
+        np.polyval(np.polyfit(profile['arcLength'][:5],
+                              profile['momentum'][:5], 1), 0))
+
+    # with no finite window, the start momentum is unknown
+    profile = measure.momentumProfile(
+        xArray, np.zeros(10), circleParams, xArray[-1], 0, 4, 0.01, 1e-4,
+        15.5, 0.3)
+    assert np.isinf(profile['momentum']).all()
+    assert np.isnan(profile['startMomentum'])
@@ -0,0 +1,161 @@
+# Copyright (C) 2014 Syed Haider Abidi, Nooruddin Ahmed and Christopher Dydula
+#
+# This file is part of traxis.
+#
+# traxis is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# traxis is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with traxis.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import numpy as np
+import pytest
+from traxis.calc import optdensity
+
+
+@pytest.fixture
+def plane():
+    """Return a blackness plane of random pixels."""
+
+    return np.random.default_rng(3).random((600, 800)).astype(np.float32)
+
+@pytest.mark.parametrize('workers', [1, 3])
+def testScanMatchesMeasurement(plane, workers):
+    # the sums of the dL scans must be those of the measurements of each dL,
+    # so that the plateau dL gives the optical density measured at that dL
+    rng = np.random.default_rng(4)
+    for circle in range(20):
+        radius = 10**rng.uniform(1.5, 4)
+        circleParams = {'centerX': rng.uniform(-100, 900),
+                        'centerY': rng.uniform(-100, 700),
+                        'radius': radius}
+        startAngle = rng.uniform(0, 360)
+        spanAngle = rng.uniform(1, 359)
+        blackness, blacknessErr = optdensity.blacknessScan(
+            plane, circleParams, 8, startAngle, spanAngle, workers)
+        coverage, coverageErr = optdensity.blacknessCoverageScan(
+            plane, circleParams, 8, startAngle, spanAngle, workers=workers)
+        for dL in range(9):
+            assert (blackness[dL], blacknessErr[dL]) == pytest.approx(
+                optdensity.calcBlackness(plane, circleParams, dL,
+                                         startAngle, spanAngle),
+                rel=1e-12, abs=1e-9)
+            assert (coverage[dL], coverageErr[dL]) == pytest.approx(
+                optdensity.blacknessCoverage(plane, circleParams, dL,
+                                             startAngle, spanAngle),
+                rel=1e-12, abs=1e-9)
+
+@pytest.mark.parametrize('longWay', [False, True])
+def testNearStraightTrack(longWay, monkeypatch):
+    # a synthetic almost straight track with a radius of 1e6 px running
+    # across a uniformly black image along row 300. The short arc runs from
+    # x = 150.5 to x = 650.5 and the long way round arc covers the rest of
+    # the circle, of which only x < 150.5 and x > 650.5 is in the image
+    plane = np.ones((600, 800), dtype=np.float32)
+    radius = 1e6
+    circleParams = {'centerX': 400.5, 'centerY': 300.3 + radius,
+                    'radius': radius}
+    halfAngle = np.degrees(np.arcsin(250 / radius))
+    if longWay:
+        startAngle, spanAngle = 90 + halfAngle, 360 - 2 * halfAngle
+        # the pixels containing sample points, and the area covered by the
+        # polar rectangles, in each row
+        pointColumns, areaColumns = 151 + 150, 150.5 + 149.5
+    else:
+        startAngle, spanAngle = 90 - halfAngle, 2 * halfAngle
+        pointColumns, areaColumns = 501, 500
+
+    # count the sample points generated, which must be bounded by the part
+    # of the arc in the image rather than by the circumference of the circle
+    sampleCounts = []
+    arcSamples = optdensity._arcSamples
+    def countingArcSamples(*args):
+        """Return the angles of _arcSamples, recording how many there are."""
+
+        angles = arcSamples(*args)
+        sampleCounts.append(len(angles))
+        return angles
+    monkeypatch.setattr(optdensity, '_arcSamples', countingArcSamples)
+
+    # the sag of the arc across the image is less than 0.1 px, so the polar
+    # rectangle covers 2*dL+1 whole rows and each error polar rectangle one
+    blackness, blacknessErr = optdensity.blacknessScan(
+        plane, circleParams, 4, startAngle, spanAngle)
+    for dL in range(5):
+        assert optdensity.calcBlackness(plane, circleParams, dL, startAngle,
+                                        spanAngle) == \
+               ((2 * dL + 1) * pointColumns, 2 * pointColumns)
+        assert (blackness[dL], blacknessErr[dL]) == \
+               ((2 * dL + 1) * pointColumns, 2 * pointColumns)
+        assert optdensity.blacknessCoverage(
+            plane, circleParams, dL, startAngle, spanAngle) == \
+            pytest.approx(((2 * dL + 1) * areaColumns, 2 * areaColumns))
+    assert max(sampleCounts) <= 2 * plane.shape[1] + 10
+
+def testBatchMatchesMeasurement(plane):
+    # the blackness of many arcs measured together must be the one measured
+    # for each arc, including arcs mostly off the plane (the long way round
+    # an almost straight track), which are measured one at a time
+    rng = np.random.default_rng(5)
+    count = 40
+    circleParams = {'centerX': rng.uniform(-100, 900, count),
+                    'centerY': rng.uniform(-100, 700, count),
+                    'radius': 10**rng.uniform(0, 4, count)}
+    startAngles = rng.uniform(0, 360, count)
+    spanAngles = rng.uniform(0, 359, count)
+    dLs = np.maximum(rng.normal(3, 2, count), 0)
+    dLs[:5] = np.arange(5)
+    circleParams['centerX'][-1] = 400.5
+    circleParams['centerY'][-1] = 300.3 + 1e6
+    circleParams['radius'][-1] = 1e6
+    startAngles[-1], spanAngles[-1] = 90.02, 359.96
+
+    blackness, blacknessErr = optdensity.calcBlacknesses(
+        plane, circleParams, dLs, startAngles, spanAngles)
+    for arc in range(count):
+        assert (blackness[arc], blacknessErr[arc]) == pytest.approx(
+            optdensity.calcBlackness(
+                plane, {key: value[arc] for key, value in
+                        circleParams.items()},
+                dLs[arc], startAngles[arc], spanAngles[arc]),
+            rel=1e-12, abs=1e-9)
+
+@pytest.mark.parametrize('supersampling', [1, 2, 4])
+def testCoverageMatchesGrid(supersampling):
+    # only the pixels cut by an edge or an end of the arc are sampled on the
+    # grid, which must give the coverage of sampling every pixel
+    rng = np.random.default_rng(6)
+    offsets = (np.arange(supersampling) + 0.5) / supersampling
+    xOffsets, yOffsets = [grid.ravel() for grid in
+                          np.meshgrid(offsets, offsets)]
+    bandEdges = np.array([1.5, 2.5, 6.5])
+    for circle in range(30):
+        circleParams = {'centerX': rng.uniform(0, 100),
+                        'centerY': rng.uniform(0, 100),
+                        'radius': 10**rng.uniform(-0.5, 3)}
+        startAngle = rng.uniform(-360, 360)
+        spanAngle = rng.uniform(0, 360)
+        yPixels, xPixels = [pixels.ravel() for pixels in
+                            np.mgrid[-20:120, -20:120]]
+
+        coverage = optdensity._bandCoverage(
+            yPixels, xPixels, circleParams, bandEdges, startAngle,
+            spanAngle, supersampling)
+
+        dx = (xPixels[:, np.newaxis] + xOffsets) - circleParams['centerX']
+        dy = circleParams['centerY'] - (yPixels[:, np.newaxis] + yOffsets)
+        bands = np.searchsorted(bandEdges, np.abs(np.hypot(dx, dy) -
+                                                  circleParams['radius']))
+        bands[np.mod(np.degrees(np.arctan2(dy, dx)) - startAngle, 360) >
+              spanAngle] = len(bandEdges)
+        for band in range(len(bandEdges)):
+            assert np.array_equal(coverage[:, band],
+                                  (bands == band).mean(axis=1))
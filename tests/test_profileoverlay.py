@@ -0,0 +1,51 @@
+# Copyright (C) 2014 Syed Haider Abidi, Nooruddin Ahmed and Christopher Dydula
+#
+# This file is part of traxis.
+#
+# traxis is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# traxis is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with traxis.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import numpy as np
+from PyQt5 import QtWidgets
+from traxis.graphics import profileoverlay
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def testInfiniteMomenta(monkeypatch):
+    # windows with an infinite momentum are not drawn and do not take part
+    # in the colour range, which would make every colour nan. The sip of
+    # recent PyQt5 releases no longer converts float angles to int
+    class ArcItem(profileoverlay.ArcItem):
+        def setStartAngle(self, angle):
+            super().setStartAngle(int(angle))
+        def setSpanAngle(self, angle):
+            super().setSpanAngle(int(angle))
+    monkeypatch.setattr(profileoverlay, 'ArcItem', ArcItem)
+
+    profile = {'centerX': [0, 0, 1e7, 0], 'centerY': [0, 0, 1e7, 0],
+               'radius': [100, 120, np.inf, 140],
+               'momentum': [np.inf, 2., np.inf, 3.],
+               'startAngle': [0, 10, 20, 30], 'spanAngle': [10] * 4}
+    scene = QtWidgets.QGraphicsScene()
+    overlay = profileoverlay.MomentumProfileOverlay()
+    overlay.draw(profile, 2, scene)
+    assert len(overlay.arcs) == 2
+    assert len(scene.items()) == 2
+
+    # with no finite momentum there is nothing to draw
+    profile['momentum'] = [np.inf] * 4
+    overlay.draw(profile, 2, scene)
+    assert not overlay.arcs and not scene.items()
@@ -0,0 +1,321 @@
+# Copyright (C) 2014 Syed Haider Abidi, Nooruddin Ahmed and Christopher Dydula
+#
+# This file is part of traxis.
+#
+# traxis is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# traxis is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with traxis.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import csv
+import glob
+import json
+import argparse
+import functools
+import concurrent.futures
+import numpy as np
+from traxis import constants
+from traxis.calc import anglecalc, measure, momentum
+from traxis.imaging import tiles
+
+
+# the fields of each result row, in the order they are written
+FIELDS = ('sessionFileName', 'imageFileName', 'points', 'dl', 'weighting',
+          'background', 'robustFit', 'outliers',
+          'centerX', 'centerXErr', 'centerY', 'centerYErr',
+          'radius', 'radiusErr',
+          'momentum', 'momentumStatErr', 'momentumCalErr',
+          'trackLengthPx', 'trackLengthCm', 'trackLengthCmErr',
+          'optDensity', 'optDensityErr',
+          'angle', 'angleErr', 'angleCovErr',
+          'error')
+
+
+def findSessionFiles(paths):
+    """Given a list of paths, each of which is either a directory (all .json
+    files directly inside it are used) or a file name or glob pattern, return
+    a sorted list of the session file names, without duplicates.
+    """
+
+    sessionFileNames = set()
+    for path in paths:
+        if os.path.isdir(path):
+            sessionFileNames.update(glob.glob(os.path.join(path, '*.json')))
+        else:
+            sessionFileNames.update(glob.glob(path))
+
+    return sorted(sessionFileNames)
+
+def analyseSession(sessionFileName, cmPerPx, errCmPerPx, magneticField, c,
+                   weighting=None, background=None):
+    """Given the file name of a session saved by MainWidget.saveSession, the
+    px to cm calibration cmPerPx and its error errCmPerPx, the magnetic field
+    (in kG) and the speed of light (in giga metres per second), recompute the
+    momentum, track length, optical density and opening angle of the track in
+    the session, as the GUI would. The optical density uses the given
+    weighting ('points' or 'area', see measure.trackDensity), or the one
+    saved in the session if weighting is None, and has the background
+    subtracted if background is True (or, if it is None, if the session
+    says so). The circle is fitted robustly if the session was measured with
+    the robust fit, in which case the number of outlying markers is given
+    under 'outliers'. Return a dictionary with the keys in FIELDS.
+    Quantities that can't be computed from the session are None and the
+    reason is given under 'error'.
+    """
+
+    result = dict.fromkeys(FIELDS)
+    result['sessionFileName'] = sessionFileName
+
+    # report any unexpected failure in the error column rather than letting
+    # it abort the whole run. The quantities computed before the failure are
+    # kept
+    try:
+        _analyseSession(result, sessionFileName, cmPerPx, errCmPerPx,
+                        magneticField, c, weighting, background)
+    except Exception as error:
+        result['error'] = "Analysis failed: {}: {}".format(
+            type(error).__name__, error)
+
+    return result
+
+def _analyseSession(result, sessionFileName, cmPerPx, errCmPerPx,
+                    magneticField, c, weighting, background):
+    """Do the analysis of analyseSession, whose arguments are the same,
+    storing the results in result, a dictionary with the keys in FIELDS.
+    Return result.
+    """
+
+    try:
+        with open(sessionFileName, 'r') as loadFile:
+            loadData = json.load(loadFile)
+    except (OSError, ValueError) as error:
+        result['error'] = "Invalid JSON file: {}".format(error)
+        return result
+
+    # get the image file name. Relative names are taken to be relative to the
+    # session file's directory
+    imageFileName = loadData.get('imageFileName')
+    if imageFileName:
+        imageFileName = os.path.join(
+            os.path.dirname(os.path.abspath(sessionFileName)), imageFileName)
+    result['imageFileName'] = imageFileName
+
+    # get the track marker coordinates, along with the coordinates of the
+    # start and end points
+    points = loadData.get('points') or []
+    result['points'] = len(points)
+    try:
+        xArray = np.array([point['x'] for point in points], dtype=np.float64)
+        yArray = np.array([point['y'] for point in points], dtype=np.float64)
+        startPoint = [(point['x'], point['y']) for point in points
+                      if point.get('designation') == 'start']
+        endPoint = [(point['x'], point['y']) for point in points
+                    if point.get('designation') == 'end']
+        # the positional uncertainties of the markers weight the fit. They
+        # are only used if every marker has one, since sessions saved before
+        # they were recorded have none
+        if points and all('uncertainty' in point for point in points):
+            uncertainties = np.array([point['uncertainty']
+                                      for point in points], dtype=np.float64)
+        else:
+            uncertainties = None
+    except (KeyError, TypeError, ValueError, AttributeError):
+        result['error'] = "Invalid track marker data."
+        return result
+
+    # get the dL, using 0 if it is missing or invalid
+    try:
+        dl = float(loadData.get('dl'))
+    except (ValueError, TypeError):
+        dl = 0
+    result['dl'] = dl
+
+    # get the density weighting, using the one saved in the session unless
+    # it is overridden
+    if weighting is None:
+        weighting = loadData.get('densityWeighting', 'points')
+    if weighting not in ('points', 'area'):
+        result['error'] = "Invalid density weighting: {}".format(weighting)
+        return result
+    result['weighting'] = weighting
+
+    # get whether the background is subtracted in the same way
+    if background is None:
+        background = bool(loadData.get('densityBackground'))
+    result['background'] = background
+
+    # the momentum needs at least 3 markers and the start and end points
+    if len(points) < 3:
+        result['error'] = "Less than 3 points to fit."
+        return result
+    if not startPoint:
+        result['error'] = "Track start point not selected."
+        return result
+    if not endPoint:
+        result['error'] = "Track end point not selected."
+        return result
+
+    # fit a circle to the track markers (robustly if the session was
+    # measured with the robust fit, counting the outlying markers) and
+    # compute the start and span angles of the momentum arc
+    result['robustFit'] = bool(loadData.get('robustFit'))
+    if result['robustFit']:
+        circleParams, startAngle, spanAngle, isOutlier = \
+            measure.fitTrackRobust(xArray, yArray,
+                                   *(startPoint[0] + endPoint[0]),
+                                   uncertainties=uncertainties)
+        result['outliers'] = int(isOutlier.sum())
+    else:
+        circleParams, startAngle, spanAngle = measure.fitTrack(
+            xArray, yArray, *(startPoint[0] + endPoint[0]),
+            uncertainties=uncertainties)
+    for key in ('centerX', 'centerXErr', 'centerY', 'centerYErr', 'radius',
+                'radiusErr'):
+        result[key] = circleParams[key]
+
+    # compute the track momentum and the track length
+    (result['momentum'], result['momentumStatErr'],
+     result['momentumCalErr']) = momentum.trackMomentum(
+        circleParams['radius'], circleParams['radiusErr'], cmPerPx,
+        errCmPerPx, magneticField, c)
+    (result['trackLengthPx'], result['trackLengthCm'],
+     result['trackLengthCmErr']) = momentum.trackLength(
+        circleParams['radius'], spanAngle, cmPerPx, errCmPerPx)
+
+    # compute the opening angle if the reference line was drawn
+    refInitialPoint = loadData.get('refInitialPoint')
+    refFinalPoint = loadData.get('refFinalPoint')
+    if refInitialPoint and refFinalPoint:
+        tangentLine, result['angle'], result['angleErr'] = measure.trackAngle(
+            circleParams, *startPoint[0],
+            (refInitialPoint['x'], refInitialPoint['y'],
+             refFinalPoint['x'], refFinalPoint['y']))
+        # the error on the angle propagated from the covariance of the
+        # circle center, for cross-checking angleErr
+        result['angleCovErr'] = anglecalc.tangentOpeningAngle(
+            circleParams, *startPoint[0],
+            (refInitialPoint['x'], refInitialPoint['y'],
+             refFinalPoint['x'], refFinalPoint['y']))[1]
+
+    # compute the optical density if the dL is non-zero. This needs the image
+    if dl != 0:
+        tiledImage = tiles.openTiledImage(imageFileName or '')
+        if tiledImage is None:
+            result['error'] = "Cannot open file as image: {}.".format(
+                imageFileName)
+            return result
+        result['optDensity'], result['optDensityErr'] = measure.trackDensity(
+            tiledImage.blackness, circleParams, dl, startAngle,
+            spanAngle, cmPerPx, errCmPerPx, weighting,
+            constants.BACKGROUNDWIDTH if background else 0)
+
+    return result
+
+def writeResults(results, outFile, outputFormat):
+    """Write each result dictionary from the iterable results to outFile, a
+    text file, as it arrives. outputFormat is 'csv' (a header line followed by
+    one line per result, with missing values left empty and non-finite values
+    as inf or nan) or 'jsonl' (one JSON object per line, with missing values
+    as null). JSON has no infinities or nans, so non-finite values (e.g. the
+    infinite errors of a circle fitted to collinear markers) are also null in
+    the 'jsonl' format.
+    """
+
+    if outputFormat == 'csv':
+        writer = csv.DictWriter(outFile, FIELDS)
+        writer.writeheader()
+        for result in results:
+            writer.writerow(result)
+            outFile.flush()
+    else:
+        for result in results:
+            outFile.write(json.dumps(
+                {key: None if isinstance(value, float) and
+                 not np.isfinite(value) else value
+                 for key, value in result.items()}, allow_nan=False) + '\n')
+            outFile.flush()
+
+def main(argv=None):
+    """Parse the command line arguments argv (sys.argv[1:] if None), analyse
+    every session file found in parallel and write the results. Return the
+    exit status.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog='traxis-batch',
+        description="Recompute the track momentum, track length, optical "
+                    "density and opening angle of saved traxis sessions.")
+    parser.add_argument(
+        'paths', nargs='+',
+        help="session files, glob patterns or directories of session files")
+    parser.add_argument(
+        '-f', '--format', choices=('csv', 'jsonl'), default='csv',
+        help="output format (default: csv)")
+    parser.add_argument(
+        '-o', '--output', default='-',
+        help="output file (default: standard output)")
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=os.cpu_count(),
+        help="number of worker processes (default: one per core)")
+    parser.add_argument(
+        '--cm-per-px', type=float, default=constants.CMPERPX,
+        help="px to cm calibration (default: {})".format(constants.CMPERPX))
+    parser.add_argument(
+        '--err-cm-per-px', type=float, default=constants.ERRCMPERPX,
+        help="error on the px to cm calibration (default: {})".format(
+            constants.ERRCMPERPX))
+    parser.add_argument(
+        '--magnetic-field', type=float, default=constants.MAGNETICFIELD,
+        help="magnetic field in kG (default: {})".format(
+            constants.MAGNETICFIELD))
+    parser.add_argument(
+        '--weighting', choices=('points', 'area'),
+        help="optical density pixel weighting (default: the one saved in "
+             "each session)")
+    parser.add_argument(
+        '--background', action='store_true', default=None,
+        help="subtract the background measured on either side of each track "
+             "(default: as saved in each session)")
+    parser.add_argument(
+        '--no-background', action='store_false', dest='background',
+        default=None,
+        help="don't subtract the background (default: as saved in each "
+             "session)")
+    args = parser.parse_args(argv)
+
+    sessionFileNames = findSessionFiles(args.paths)
+    if not sessionFileNames:
+        print("traxis-batch: no session files found", file=sys.stderr)
+        return 1
+
+    analyse = functools.partial(
+        analyseSession, cmPerPx=args.cm_per_px,
+        errCmPerPx=args.err_cm_per_px, magneticField=args.magnetic_field,
+        c=constants.C, weighting=args.weighting, background=args.background)
+
+    if args.output == '-':
+        outFile = sys.stdout
+    else:
+        outFile = open(args.output, 'w', newline='')
+
+    # analyse the sessions in a process pool, writing the results in the
+    # order of the session files as soon as they are available
+    try:
+        with concurrent.futures.ProcessPoolExecutor(args.jobs) as executor:
+            writeResults(executor.map(analyse, sessionFileNames), outFile,
+                         args.format)
+    finally:
+        if outFile is not sys.stdout:
+            outFile.close()
+
+    return 0
@@ -15,31 +15,91 @@
 # You should have received a copy of the GNU General Public License
 # along with traxis.  If not, see <http://www.gnu.org/licenses/>.
 
-import math
-from PyQt5 import QtCore
+import numpy as np
 
 
-def tangentCalc(circleParams, point):
+def _lineAngle(line):
+    """Given line, a tuple (x1, y1, x2, y2) containing the coordinates of the
+    initial and final points of a line, return the angle (in degrees, between
+    0 and 360) between the line and the positive x-axis, measured
+    counter-clockwise as seen on the screen (y values increase going down).
+    This is the same angle as QtCore.QLineF(x1, y1, x2, y2).angle(). The
+    coordinates may be numpy arrays, in which case an array of angles is
+    returned.
+    """
+
+    # note: y values increase going down
+    angle = np.degrees(np.arctan2(-(line[3] - line[1]), line[2] - line[0]))
+    angle = np.mod(angle, 360)
+
+    # round-off can make a small negative angle wrap around to exactly 360
+    return angle - 360 * (angle >= 360)
+
+def _angleTo(line, otherLine):
+    """Return the angle (in degrees, between 0 and 360) needed to rotate line
+    counter-clockwise onto otherLine, both tuples as for _lineAngle. This is
+    the same angle as QLineF.angleTo().
+    """
+
+    angle = np.mod(_lineAngle(otherLine) - _lineAngle(line), 360)
+
+    # round-off can make a small negative difference wrap around to exactly
+    # 360, as in _lineAngle
+    return angle - 360 * (angle >= 360)
+
+def pointAngle(origin, pointX, pointY):
+    """Given origin, a tuple whose first element is an x-coordinate and whose
+    second element is a y-coordinate, and pointX and pointY, the coordinates
+    of a point, return the angular coordinate of the point in degrees, where
+    origin is the pole in the polar coordinate system.
+    """
+
+    return _lineAngle((origin[0], origin[1], pointX, pointY))
+
+def arcAngles(circleParams, startX, startY, endX, endY):
+    """Given a circle defined by circleParams (a dict containing the radius
+    and center coordinates of the circle) and the coordinates of the start
+    and end points of a track, return the start angle of the arc of the
+    circle covering the track and its span angle (both in degrees). The arc
+    goes counter-clockwise from the start point to the end point.
+    """
+
+    center = (circleParams['centerX'], circleParams['centerY'])
+
+    # the start angle is the angular coordinate of the start point with
+    # respect to the circle center
+    startAngle = pointAngle(center, startX, startY)
+
+    # the span angle is the angle between the line joining the center to the
+    # start point and the line joining the center to the end point
+    spanAngle = _angleTo((center[0], center[1], startX, startY),
+                         (center[0], center[1], endX, endY))
+
+    return startAngle, spanAngle
+
+def tangentCalc(circleParams, pointX, pointY):
     """Given a circle defined by circleParams (a dict containing the radius
     and center coordinates of the circle along with the errors on these
-    parameters) and point, one of the TrackMarker objects to which
-    the circle was fitted, return three QLineF objects, one being the tangent
-    to the circle at point and the other two being the errors on the
+    parameters) and pointX and pointY, the coordinates of one of the points
+    to which the circle was fitted, return three lines, one being the tangent
+    to the circle at the point and the other two being the errors on the
     tangent line in each direction. The real tangent lies somewhere between
-    the two error lines.
+    the two error lines. Each line is a tuple (x1, y1, x2, y2) containing the
+    coordinates of its initial and final points.
     """
 
     # compute the angular coordinate of the point with respect to the center
     # of the circle
-    pointAngle = point.getAngle((circleParams['centerX'],
-                                 circleParams['centerY']))*math.pi/180
+    pointAngleRad = np.radians(pointAngle((circleParams['centerX'],
+                                           circleParams['centerY']),
+                                          pointX, pointY))
 
     # determine the coordinates of the point that has the same angular
     # coordinate as point but actually lies on the circle
-    tangentPointX = circleParams['radius']*math.cos(pointAngle) + \
+    tangentPointX = circleParams['radius']*np.cos(pointAngleRad) + \
                     circleParams['centerX']
     # note: y values increase going down
-    tangentPointY = -circleParams['radius']*math.sin(pointAngle) + \
+    tangentPointY = -circleParams['radius']*np.sin(pointAngleRad) + \
                     circleParams['centerY']
 
     # determine the coordinates of the tangent point relative to the center of
@@ -49,10 +109,10 @@ def tangentCalc(circleParams, point):
     relativeY = tangentPointY - circleParams['centerY']
 
     # construct the tangent line
-    tangentLine = QtCore.QLineF(tangentPointX + relativeY,
-                                tangentPointY - relativeX,
-                                tangentPointX - relativeY,
-                                tangentPointY + relativeX)
+    tangentLine = (tangentPointX + relativeY,
+                   tangentPointY - relativeX,
+                   tangentPointX - relativeY,
+                   tangentPointY + relativeX)
 
     # construct the two error tangent lines using the error on the circle
     # center. These two lines also pass through the tangent point and the real
@@ -60,47 +120,161 @@ def tangentCalc(circleParams, point):
     # error on the circle radius is not considered when constructing the error
     # tangents because it would only translate the tangent radially without
     # changing the slope
-    tangentLineErrA = QtCore.QLineF(tangentPointX + \
-                                      (relativeY - circleParams['centerYErr']),
-                                    tangentPointY - \
-                                      (relativeX + circleParams['centerXErr']),
-                                    tangentPointX - \
-                                      (relativeY - circleParams['centerYErr']),
-                                    tangentPointY + \
-                                      (relativeX + circleParams['centerXErr']))
-    tangentLineErrB = QtCore.QLineF(tangentPointX + \
-                                      (relativeY + circleParams['centerYErr']),
-                                    tangentPointY - \
-                                      (relativeX - circleParams['centerXErr']),
-                                    tangentPointX - \
-                                      (relativeY + circleParams['centerYErr']),
-                                    tangentPointY + \
-                                      (relativeX - circleParams['centerXErr']))
+    tangentLineErrA = (tangentPointX + \
+                         (relativeY - circleParams['centerYErr']),
+                       tangentPointY - \
+                         (relativeX + circleParams['centerXErr']),
+                       tangentPointX - \
+                         (relativeY - circleParams['centerYErr']),
+                       tangentPointY + \
+                         (relativeX + circleParams['centerXErr']))
+    tangentLineErrB = (tangentPointX + \
+                         (relativeY + circleParams['centerYErr']),
+                       tangentPointY - \
+                         (relativeX - circleParams['centerXErr']),
+                       tangentPointX - \
+                         (relativeY + circleParams['centerYErr']),
+                       tangentPointY + \
+                         (relativeX - circleParams['centerXErr']))
 
     return tangentLine, tangentLineErrA, tangentLineErrB
 
+def tangentAngle(circleParams, pointX, pointY):
+    """Given a circle defined by circleParams (a dict containing the radius
+    and center coordinates of the circle along with the errors on the center
+    coordinates and, optionally, their covariance centerCovXY) and pointX and
+    pointY, the coordinates of one of the points to which the circle was
+    fitted, return the angle (in degrees, between 0 and 360) of the tangent
+    to the circle at the point, i.e. the angle of the tangent line returned
+    by tangentCalc, along with its error. The error is propagated
+    analytically from the covariance of the center coordinates. The circle
+    parameters and the coordinates may be numpy arrays (e.g. as returned by
+    circlefit.fitCircles), in which case arrays are returned.
+    """
+
+    # the tangent is perpendicular to the line joining the center to the
+    # point, which has the same angular coordinate as the tangent point
+    angle = np.mod(pointAngle((circleParams['centerX'],
+                               circleParams['centerY']),
+                              pointX, pointY) - 90, 360)
+    # round-off can make a small negative angle wrap around to exactly 360
+    angle = angle - 360 * (angle >= 360)
+
+    # the angular coordinate phi of the point changes with the center
+    # coordinates (h, k) as dphi/dh = v/rho^2 and dphi/dk = u/rho^2, where
+    # (u, v) is the position of the point relative to the center with v
+    # increasing going up and rho is its distance from the center. The
+    # tangent angle changes by the same amount, so its variance is
+    # J.C.J^T with J = (dphi/dh, dphi/dk) and C the covariance of (h, k)
+    # note: y values increase going down
+    relativeX = pointX - circleParams['centerX']
+    relativeY = circleParams['centerY'] - pointY
+    rhoSquared = relativeX**2 + relativeY**2
+    derivX = relativeY / rhoSquared
+    derivY = relativeX / rhoSquared
+    variance = (derivX * circleParams['centerXErr'])**2 + \
+               (derivY * circleParams['centerYErr'])**2 + \
+               2 * derivX * derivY * circleParams.get('centerCovXY', 0)
+    angleErr = np.degrees(np.sqrt(np.maximum(variance, 0)))
+
+    return angle, angleErr
+
+def tangentOpeningAngle(circleParams, pointX, pointY, refLine):
+    """Given a circle defined by circleParams, the coordinates pointX and
+    pointY of one of the points to which it was fitted and refLine, the angle
+    reference line as a tuple (x1, y1, x2, y2), return the angle (in
+    degrees) between the tangent to the circle at the point and refLine,
+    along with its error. The angle is the same as the one returned by
+    openingAngle for the lines of tangentCalc, but its error is propagated
+    analytically from the covariance of the circle center (see
+    tangentAngle) instead of being taken from the two error tangent lines.
+    Any of the arguments may contain numpy arrays, in which case arrays are
+    returned.
+    """
+
+    tangent, angleErr = tangentAngle(circleParams, pointX, pointY)
+
+    # the reference line is assumed to be exact
+    angle = np.mod(tangent - _lineAngle(refLine), 360)
+
+    return angle, angleErr
+
+def trackDirection(circleParams, startX, startY, endX, endY):
+    """Given a circle defined by circleParams (as for tangentAngle) and the
+    coordinates of the start and end points of a track, return the direction
+    (in degrees, between 0 and 360, measured as for _lineAngle) in which the
+    track leaves its start point along the circle, along with its error (see
+    tangentAngle). The track is taken to go the short way around the circle
+    from its start point to its end point. The arguments may contain numpy
+    arrays, in which case arrays are returned.
+    """
+
+    tangent, directionErr = tangentAngle(circleParams, startX, startY)
+
+    # the tangent angle is that of the clockwise direction along the circle.
+    # The track goes counter-clockwise if its end point lies counter-clockwise
+    # of its start point as seen from the center, i.e. if the cross product of
+    # their positions relative to the center is positive
+    # note: y values increase going down
+    cross = (startX - circleParams['centerX']) * \
+            (circleParams['centerY'] - endY) - \
+            (circleParams['centerY'] - startY) * \
+            (endX - circleParams['centerX'])
+    direction = np.mod(tangent + 180 * (cross > 0), 360)
+
+    return direction, directionErr
+
+def openingAngleMatrix(directions, directionErrs):
+    """Given arrays of N directions (in degrees) and their errors, e.g. of
+    the tracks leaving a common vertex as returned by trackDirection (and the
+    direction of the beam with an error of 0), return N x N arrays of the
+    opening angle (in degrees, between 0 and 180) between every pair of
+    directions and of its error. The errors of different directions are
+    taken to be independent.
+    """
+
+    directions = np.asarray(directions, dtype=np.float64)
+    directionErrs = np.asarray(directionErrs, dtype=np.float64)
+
+    # the difference between every pair of directions, wrapped to between
+    # -180 and 180 degrees
+    differences = np.mod(directions[:, np.newaxis] - directions + 180,
+                         360) - 180
+    angles = np.abs(differences)
+
+    # add the errors of each pair in quadrature. A direction has no error
+    # relative to itself
+    angleErrs = np.hypot(directionErrs[:, np.newaxis], directionErrs)
+    np.fill_diagonal(angleErrs, 0)
+
+    return angles, angleErrs
+
 def openingAngle(tangent, tangentErrA, tangentErrB, refLine):
-    """Return the angle (in degrees) between tangent, a QLineF, and refLine,
-    a ReferenceLine object. Return also the error on the angle using the
-    two tangent error lines tangentErrA and tangentErrB, both QLineF objects.
+    """Return the angle (in degrees) between tangent and refLine, the angle
+    reference line. Return also the error on the angle using the two tangent
+    error lines tangentErrA and tangentErrB. All lines are tuples
+    (x1, y1, x2, y2) containing the coordinates of their initial and final
+    points.
     """
 
     # compute the angle between the reference line and the tangent line
-    angle = refLine.line.line().angleTo(tangent)
+    angle = _angleTo(refLine, tangent)
 
     # compute the differences between the angles between the reference line
     # and the error tangent lines and the angle between the reference line
     # and the tangent estimate. These give the error on the angle in both
     # directions.
-    angleErrA = abs(refLine.line.line().angleTo(tangentErrA) - angle)
-    angleErrB = abs(refLine.line.line().angleTo(tangentErrB) - angle)
+    angleErrA = abs(_angleTo(refLine, tangentErrA) - angle)
+    angleErrB = abs(_angleTo(refLine, tangentErrB) - angle)
 
     # special case: reference line is in between the two error tangents.
-    # one of the two angle errors will be 360 - theta in this case
-    if angleErrA > 180:
-        angleErrA = abs(angleErrA - 360)
-    elif angleErrB > 180:
-        angleErrB = abs(angleErrB - 360)
+    # one of the two angle errors will be 360 - theta in this case, so
+    # replace it by theta (the comparisons are done elementwise so that arrays
+    # of angles are handled too)
+    isWrappedA = angleErrA > 180
+    isWrappedB = ~isWrappedA & (angleErrB > 180)
+    angleErrA = angleErrA + isWrappedA * (360 - 2 * angleErrA)
+    angleErrB = angleErrB + isWrappedB * (360 - 2 * angleErrB)
 
     # take the error on the angle to be the average of the errors in each
     # direction
@@ -15,41 +15,30 @@
 # You should have received a copy of the GNU General Public License
 # along with traxis.  If not, see <http://www.gnu.org/licenses/>.
 
+import itertools
+import math
 import numpy as np
 from scipy import optimize
 
-def _createXYArrays(markerList):
-    """Given markerList, a MarkerList object, return two numpy arrays, one
-    containing the x-coordinates of the markers and the second the
-    corrsponding y-coordinates.
-    """
-
-    # initialize two numpy arrays whose lengths are equal to the number of
-    # markers in markerList
-    xArray = np.zeros(markerList.count())
-    yArray = np.zeros(markerList.count())
-
-    # loop over each marker, setting the x-coordinate of each marker as an
-    # element of xArray and each y-coordinate as an element of yArray
-    for row in range(markerList.count()):
-        marker = markerList.item(row)
-        # using 64 bit floats seems to be necessary to ensure consistent
-        # results across all systems. Some systems get the same results
-        # with or without np.float64() but others don't. When using
-        # float64, results match for all systems tested.
-        xArray[row] = np.float64(marker.ellipse.rect().center().x())
-        yArray[row] = np.float64(marker.ellipse.rect().center().y())
+# the circle fitting methods accepted by fitCircle. 'geometric' minimizes the
+# distance residuals iteratively, 'kasa', 'pratt' and 'taubin' are the
+# non-iterative algebraic fits of the same names and 'hybrid' refines the
+# Taubin fit with the geometric fit. 'geometric' starts from the centroid of
+# the points instead and only falls back to the 'hybrid' start if that fit
+# diverges, so the two give the same circle whenever both converge
+METHODS = ('geometric', 'hybrid', 'kasa', 'pratt', 'taubin')
 
-    return xArray, yArray
-
-def _distanceResiduals(referencePoint, xArray, yArray):
+def _distanceResiduals(referencePoint, xArray, yArray, weights=None):
     """Given referencePoint, a tuple whose first element is the x-coordinate
     and whose second element is the y-coordinate, xArray, an array of
     x-coordinates, and yArray, an array of the corresponding y-coordinates of
     a set of points (xArray and yArray are expected to have the same length),
     return an array containing for each point the difference between the
     distance from that point to the reference point and the mean of the
-    distances.
+    distances. If weights, an array of the weight of each point, is given,
+    the weighted mean is used and each residual is multiplied by the square
+    root of its weight, so that the sum of the squares of the residuals is
+    the weighted sum.
     """
 
     # compute the distance from each point to the reference point
@@ -57,52 +46,349 @@ def _distanceResiduals(referencePoint, xArray, yArray):
                         (yArray - referencePoint[1])**2)
     # compute the difference between the distance from each point to the
     # reference point and the mean of the distances
-    distanceResiduals = distances - distances.mean()
+    if weights is None:
+        distanceResiduals = distances - distances.mean()
+    else:
+        distanceResiduals = np.sqrt(weights) * \
+            (distances - np.average(distances, weights=weights))
 
     return distanceResiduals
 
-def fitCircle(markerList):
-    """Given markerList, a MarkerList object, fit a circle to the markers
-    using the least squares method and return the coordinates of the centre
-    and the radius of the fitted circle along with their errors.
+def _distanceJacobian(referencePoint, xArray, yArray, weights=None):
+    """Given referencePoint, xArray, yArray and weights as for
+    _distanceResiduals, return the Jacobian of the distance residuals with
+    respect to the coordinates of the reference point, an array whose first
+    column contains the derivatives with respect to the x-coordinate and
+    whose second column contains the derivatives with respect to the
+    y-coordinate.
+    """
+
+    # compute the distance from each point to the reference point
+    distances = np.sqrt((xArray - referencePoint[0])**2 + \
+                        (yArray - referencePoint[1])**2)
+    # the derivative of the distance from a point to the reference point with
+    # respect to the coordinates of the reference point is the unit vector
+    # pointing from the point to the reference point
+    unitX = (referencePoint[0] - xArray) / distances
+    unitY = (referencePoint[1] - yArray) / distances
+
+    # the mean of the distances is subtracted from each distance, so subtract
+    # the mean of the derivatives as well
+    if weights is None:
+        return np.column_stack((unitX - unitX.mean(), unitY - unitY.mean()))
+    rootWeights = np.sqrt(weights)
+    return np.column_stack(
+        (rootWeights * (unitX - np.average(unitX, weights=weights)),
+         rootWeights * (unitY - np.average(unitY, weights=weights))))
+
+def _centeredMoments(xArray, yArray, weights=None):
+    """Given xArray and yArray, arrays of the x and y-coordinates of a set of
+    points, return a tuple containing the centroid of the points followed by
+    the second order moments of the points about their centroid and the
+    moments involving z = x^2 + y^2 that are used by the algebraic circle
+    fits: (meanX, meanY, Mxx, Mxy, Myy, Mxz, Myz, Mzz). If weights, an array
+    of the weight of each point, is given, the centroid and the moments are
+    weighted means.
+    """
+
+    # compute the centroid and shift the points so that it lies at the origin
+    meanX = np.average(xArray, weights=weights)
+    meanY = np.average(yArray, weights=weights)
+    xShifted = xArray - meanX
+    yShifted = yArray - meanY
+    zShifted = xShifted**2 + yShifted**2
+
+    return (meanX, meanY,
+            np.average(xShifted * xShifted, weights=weights),
+            np.average(xShifted * yShifted, weights=weights),
+            np.average(yShifted * yShifted, weights=weights),
+            np.average(xShifted * zShifted, weights=weights),
+            np.average(yShifted * zShifted, weights=weights),
+            np.average(zShifted * zShifted, weights=weights))
+
+def _momentsFromPowerSums(powerSums, originX, originY):
+    """Given powerSums, an array whose element [p, q] is the sum over a set of
+    points of (x - originX)^p * (y - originY)^q for all p + q <= 4 (the array
+    may have extra leading dimensions for several sets of points, in which
+    case the moments are computed elementwise), return the same tuple of
+    moments as _centeredMoments.
+    """
+
+    count = powerSums[..., 0, 0]
+    shiftX = powerSums[..., 1, 0] / count
+    shiftY = powerSums[..., 0, 1] / count
+
+    def centralMoment(p, q):
+        """Return the moment of order (p, q) of the points about their
+        centroid, expanding (x - meanX)^p * (y - meanY)^q binomially in terms
+        of the power sums.
+        """
+
+        moment = 0
+        for i in range(p + 1):
+            for j in range(q + 1):
+                moment = moment + math.comb(p, i) * math.comb(q, j) * \
+                         (-shiftX)**(p - i) * (-shiftY)**(q - j) * \
+                         powerSums[..., i, j]
+        return moment / count
+
+    return (shiftX + originX, shiftY + originY,
+            centralMoment(2, 0), centralMoment(1, 1), centralMoment(0, 2),
+            centralMoment(3, 0) + centralMoment(1, 2),
+            centralMoment(2, 1) + centralMoment(0, 3),
+            centralMoment(4, 0) + 2*centralMoment(2, 2) + centralMoment(0, 4))
+
+def _smallestRoot(coefficients):
+    """Given coefficients, a list of the coefficients of a polynomial ordered
+    from the constant term to the leading term (each coefficient may be a
+    numpy array, in which case the polynomials are solved elementwise),
+    return the smallest non-negative real root of the polynomial, or 0 if
+    there is none. The roots are computed as the eigenvalues of the companion
+    matrix of the polynomial.
+    """
+
+    coefficients = np.broadcast_arrays(*[np.asarray(c, dtype=np.float64)
+                                         for c in coefficients])
+    degree = len(coefficients) - 1
+    shape = coefficients[0].shape
+
+    # build the companion matrix of the monic polynomial. Its last column
+    # contains the negated coefficients divided by the leading coefficient
+    companion = np.zeros(shape + (degree, degree))
+    companion[..., np.arange(1, degree), np.arange(degree - 1)] = 1
+    for power in range(degree):
+        companion[..., power, -1] = -coefficients[power] / coefficients[-1]
+    roots = np.linalg.eigvals(companion)
+
+    # keep only the real roots. Allow for round-off error which can make a
+    # root of zero (exactly circular points) slightly negative
+    isCandidate = (abs(roots.imag) <= 1e-9 * (1 + abs(roots.real))) & \
+                  (roots.real >= -1e-12)
+    candidates = np.where(isCandidate, roots.real, np.inf).min(axis=-1)
+
+    return np.where(np.isfinite(candidates), np.maximum(candidates, 0), 0)
+
+def _algebraicCircle(moments, method):
+    """Given moments, a tuple as returned by _centeredMoments (each element
+    may also be a numpy array of moments of different sets of points, in which
+    case the fits are done elementwise), return the x and y-coordinates of the
+    center and the radius of the circle fitted using the algebraic fit method,
+    one of 'kasa', 'pratt' or 'taubin'.
+    """
+
+    meanX, meanY, Mxx, Mxy, Myy, Mxz, Myz, Mzz = moments
+
+    # rescale the coordinates so that the mean of z is 1. This keeps all the
+    # terms below of order unity regardless of the size of the circle
+    scale = np.sqrt(Mxx + Myy)
+    Mxx, Mxy, Myy = Mxx / scale**2, Mxy / scale**2, Myy / scale**2
+    Mxz, Myz = Mxz / scale**3, Myz / scale**3
+    Mzz = Mzz / scale**4
+    covXY = Mxx*Myy - Mxy*Mxy
+    varZ = Mzz - 1
+
+    # each of the algebraic fits reduces to finding the smallest non-negative
+    # root, eta, of its characteristic polynomial (see N. Chernov, "Circular
+    # and Linear Regression: Fitting Circles and Lines by Least Squares").
+    # The Kasa fit corresponds to eta = 0
+    if method == 'kasa':
+        eta = 0
+    elif method == 'pratt':
+        eta = _smallestRoot(
+            [Mxz*Mxz*Myy + Myz*Myz*Mxx - Mzz*covXY - 2*Mxz*Myz*Mxy + covXY,
+             Mzz + 4*covXY - Mxz*Mxz - Myz*Myz - 1,
+             4*covXY - 3 - Mzz,
+             0,
+             4])
+    elif method == 'taubin':
+        eta = _smallestRoot(
+            [Mxz*(Mxz*Myy - Myz*Mxy) + Myz*(Myz*Mxx - Mxz*Mxy) - varZ*covXY,
+             varZ + 4*covXY - Mxz*Mxz - Myz*Myz,
+             -3 - Mzz,
+             4])
+    else:
+        raise ValueError("Unknown algebraic fit method: {}".format(method))
+
+    # solve the linear equations for the center given eta
+    det = eta*eta - eta + covXY
+    centerX = (Mxz*(Myy - eta) - Myz*Mxy) / det / 2
+    centerY = (Myz*(Mxx - eta) - Mxz*Mxy) / det / 2
+
+    # the Pratt constraint leads to a radius that is larger by 2*eta
+    radiusSquared = centerX*centerX + centerY*centerY + 1
+    if method == 'pratt':
+        radiusSquared = radiusSquared + 2*eta
+
+    # undo the rescaling and the shift to the centroid
+    return centerX * scale + meanX, centerY * scale + meanY, \
+           np.sqrt(radiusSquared) * scale
+
+def _collinearCenter(moments):
+    """Given moments, a tuple as returned by _centeredMoments (each element
+    may also be an array of the moments of different sets of points) of
+    exactly collinear points, whose best fitting circle is infinitely large,
+    return the x and y-coordinates of a centre for their circle. It lies on
+    the normal to their line through their centroid, a million times further
+    away than the points are from each other.
     """
 
-    # convert the list of track markers to arrays of the x-coordinates and
-    # y-coordinates of the markers
-    xArray, yArray = _createXYArrays(markerList)
+    meanX, meanY, Mxx, Mxy, Myy = moments[:5]
+    lineAngle = np.arctan2(2 * Mxy, Mxx - Myy) / 2
+    distance = 1e6 * np.sqrt(Mxx + Myy)
 
-    # use the mean of the x-coordinates of the markers as an initial guess for
-    # x-coordinate of the circle center. Similarly for y-coordinates.
-    centerEstimate = (xArray.mean(), yArray.mean())
+    return meanX - distance * np.sin(lineAngle), \
+           meanY + distance * np.cos(lineAngle)
+
+def _infiniteErrors(fitParams):
+    """Given fitParams, a dictionary of fit parameters as described in
+    fitCircle, make the errors of the centre and the radius and the
+    covariance of the centre coordinates infinite and return fitParams.
+    """
+
+    fitParams['centerXErr'] = fitParams['centerYErr'] = \
+        fitParams['radiusErr'] = fitParams['centerCovXY'] = np.inf
+    return fitParams
+
+def fitCircle(xArray, yArray, method='geometric', weights=None):
+    """Given xArray and yArray, arrays of the x and y-coordinates of a set of
+    points (e.g. track markers), fit a circle to the points and return the
+    coordinates of the centre and the radius of the fitted
+    circle along with their errors and the covariance of the centre
+    coordinates (centerCovXY). method, one of the names in METHODS,
+    selects how the centre is found: 'geometric' uses the least squares
+    method started from the centroid of the points, 'hybrid' uses the same
+    method started from the Taubin fit and 'kasa', 'pratt' and 'taubin' use
+    the algebraic fits of the same names. If the 'geometric' fit diverges
+    (e.g. runs off along a nearly straight track) it is redone as the
+    'hybrid' fit. For collinear points, whose best fitting circle is
+    infinitely large, and if the least squares fit doesn't converge, the
+    errors are infinite.
+
+    weights is an optional array of the weight of each point, normally the
+    inverse square of the uncertainty of its position. The fit then
+    minimizes chi-squared, the weighted sum of the squared distance
+    residuals, and the covariance of the centre is the inverse of the
+    weighted J^T.J scaled by chi-squared per degree of freedom. Only the
+    relative weights of the points affect the results, and equal weights
+    give the same fit as no weights.
+    """
+
+    if method not in METHODS:
+        raise ValueError("Unknown circle fit method: {}".format(method))
+
+    # using 64 bit floats seems to be necessary to ensure consistent results
+    # across all systems. Some systems get the same results with or without
+    # float64 but others don't. When using float64, results match for all
+    # systems tested.
+    xArray = np.asarray(xArray, dtype=np.float64)
+    yArray = np.asarray(yArray, dtype=np.float64)
+    if weights is not None:
+        weights = np.asarray(weights, dtype=np.float64)
+
+    if method in ('kasa', 'pratt', 'taubin'):
+        # the algebraic fits give the centre directly
+        centerLsq = np.array(_algebraicCircle(
+                        _centeredMoments(xArray, yArray, weights), method)[:2])
+    else:
+        # the hybrid fit starts from the Taubin fit, which is already very
+        # close to the optimum
+        moments = _centeredMoments(xArray, yArray, weights)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            centerEstimate = _algebraicCircle(moments, 'taubin')[:2]
+
+        # the Taubin fit has no solution for exactly collinear points, whose
+        # best fitting circle is infinitely large. The least squares method
+        # has no solution either, so put the centre far away (see
+        # _collinearCenter) and make the errors infinite
+        if not np.isfinite(centerEstimate).all():
+            return _infiniteErrors(_fitParams(_collinearCenter(moments),
+                                              xArray, yArray, weights))
+
+        def leastSquaresFit(startCenter):
+            """Given startCenter, the coordinates of the centre to start
+            from, return the optimal centre coordinates for the fitted
+            circle, such that the squares of the residuals of the distances
+            from each point to the centre are minimized, and the ier flag
+            returned by leastsq (1 to 4 if the fit converged).
+            """
+
+            # pass the analytic Jacobian of the residuals as Dfun so that it
+            # doesn't have to be estimated by finite differences. Decrease
+            # the desired error in the results by passing explicit values for
+            # ftol and xtol (the default value is 1.49012e-8)
+            return optimize.leastsq(_distanceResiduals, startCenter,
+                                    args=(xArray, yArray, weights),
+                                    Dfun=_distanceJacobian,
+                                    ftol=1e-15, xtol=1e-15)
+
+        def cost(center):
+            """Given center, the coordinates of a centre, return the sum of
+            the squares of the distance residuals of the points.
+            """
+
+            return (_distanceResiduals(center, xArray, yArray,
+                                       weights)**2).sum()
+
+        # start the geometric fit from the centroid of the points. The fit of
+        # a nearly straight track can then run off along the poorly
+        # constrained direction to a centre millions of times further away
+        # than the true one, where the residuals are larger than at the
+        # Taubin centre. In that case, or if the fit fails, redo it from the
+        # Taubin centre like the hybrid fit
+        isDiverged = True
+        if method == 'geometric':
+            centerLsq, ier = leastSquaresFit(moments[:2])
+            isDiverged = ier not in (1, 2, 3, 4) or \
+                         not np.isfinite(centerLsq).all() or \
+                         cost(centerLsq) > cost(centerEstimate)
+        if isDiverged:
+            centerLsq, ier = leastSquaresFit(centerEstimate)
+
+        # a centre at which the fit didn't converge is not the optimum, so
+        # make its errors infinite rather than pass it off as one
+        if ier not in (1, 2, 3, 4):
+            return _infiniteErrors(_fitParams(centerLsq, xArray, yArray,
+                                              weights))
+
+    return _fitParams(centerLsq, xArray, yArray, weights)
+
+def _fitParams(centerLsq, xArray, yArray, weights=None):
+    """Given centerLsq, the coordinates of the centre of a circle fitted to
+    the points whose coordinates are in xArray and yArray, and optionally
+    weights, an array of the weight of each point in the fit, return the
+    dictionary of fit parameters described in fitCircle.
+    """
 
     # initialize the dictionary containing the parameters of the fitted circle
     # to be returned by this function
     fitParams = {}
 
-    # calculate the optimal centre coordinates for the fitted circle, such
-    # that the squares of the residuals of the distances from each point to
-    # the centre are minimized. Store the optimal coordinates in the variable
-    # centerLsq. Pass full_output=True to the leastsq function so that the
-    # covariance matrix of the optimized coordinates is returned. This also
-    # makes the function return infodict, mesg and ier which are not used.
-    # Decrease the desired error in the results by passing explicit values
-    # for ftol and xtol (the default value is 1.49012e-8)
-    centerLsq, covMatrix, infodict, mesg, ier = optimize.leastsq(
-                                                    _distanceResiduals,
-                                                    centerEstimate, 
-                                                    args=(xArray, yArray), 
-                                                    full_output=True, 
-                                                    ftol=1e-15, xtol=1e-15)
+    # compute the covariance matrix of the optimized coordinates as the
+    # inverse of J^T.J, where J is the Jacobian of the distance residuals at
+    # the optimal centre. This is what leastsq returns as its covariance
+    # matrix but computed here from the exact Jacobian. If J^T.J is singular
+    # (e.g. for collinear points, whose fitted centre is arbitrarily far
+    # away) the centre is unconstrained and its errors are infinite
+    jacobian = _distanceJacobian(centerLsq, xArray, yArray, weights)
+    try:
+        covMatrix = np.linalg.inv(jacobian.T.dot(jacobian))
+    except np.linalg.LinAlgError:
+        covMatrix = np.full((2, 2), np.inf)
 
     # note from the documentation for scipy.optimize.leastsq regarding the
-    # covariance matrix it returns: "This matrix must be multiplied by the
-    # residual variance to get the covariance of the parameter estimates"
+    # covariance matrix: "This matrix must be multiplied by the residual
+    # variance to get the covariance of the parameter estimates"
     # The 'residual variance' is just chi-squared/degrees of freedom
-    dof = len(yArray)-len(centerEstimate)
-    chi2Dof = (_distanceResiduals(centerLsq, xArray, yArray)**2).sum()/dof
+    dof = len(yArray)-len(centerLsq)
+    chi2Dof = (_distanceResiduals(centerLsq, xArray, yArray,
+                                  weights)**2).sum()/dof
     # multiply covMatrix by the 'residual variance' to get the covariance
-    # of the parameter estimates
-    parameterCov = covMatrix * chi2Dof
+    # of the parameter estimates, keeping the errors of an unconstrained
+    # centre infinite even if the residuals vanish
+    if np.isfinite(covMatrix).all():
+        parameterCov = covMatrix * chi2Dof
+    else:
+        parameterCov = covMatrix
 
     # store the optimal centre coordinates in the fitParams dict
     fitParams['centerX'], fitParams['centerY'] = centerLsq
@@ -110,12 +396,17 @@ def fitCircle(markerList):
     # the errors are the square roots of the diagonal elements of the parameter
     # covariance
     fitParams['centerXErr'], fitParams['centerYErr'] = np.sqrt(np.diag(parameterCov))
+    # store the covariance of the centre coordinates too, so that errors on
+    # quantities depending on both of them can be propagated
+    fitParams['centerCovXY'] = parameterCov[0, 1]
 
-    # store the radius of the fitted circle in the fitParams dict. Based on
-    # how the lsq fit was performed, this is the mean of the distances from
-    # each point to the optimal circle centre
-    fitParams['radius'] = np.sqrt((xArray - fitParams['centerX'])**2 + \
-                                  (yArray - fitParams['centerY'])**2).mean()
+    # store the radius of the fitted circle in the fitParams dict. This is the
+    # mean of the distances from each point to the optimal circle centre,
+    # which is the radius that minimizes the distance residuals for that
+    # centre (and so exactly how the lsq fit determines the radius)
+    fitParams['radius'] = np.average(
+        np.sqrt((xArray - fitParams['centerX'])**2 + \
+                (yArray - fitParams['centerY'])**2), weights=weights)
 
     # store the error on the radius in the fitParams dict. Given radius R,
     # centre coordinates (h, k) with error dh, dk and a point (x, y) assumed
@@ -123,9 +414,494 @@ def fitCircle(markerList):
     # dR^2 = ((x-h)/R * dh)^2 + ((y-k)/R * dk)^2
     # Compute this dR for each point individually and then take the mean
     fitParams['radiusErr'] = np.sqrt(
-        ((fitParams['centerX']-xArray).mean()/ \
+        (np.average(fitParams['centerX']-xArray, weights=weights)/ \
          fitParams['radius']*fitParams['centerXErr'])**2 + \
-        ((fitParams['centerY']-yArray).mean()/ \
+        (np.average(fitParams['centerY']-yArray, weights=weights)/ \
          fitParams['radius']*fitParams['centerYErr'])**2)
 
     return fitParams
+
+def _threePointCircles(xArray, yArray, triples):
+    """Given xArray and yArray, arrays of the coordinates of a set of points,
+    and triples, an N x 3 array of the indices of N triples of the points,
+    return arrays of the coordinates of the centre and the radius of the
+    circle through each triple. The centre and radius of a circle through
+    three (nearly) collinear points are nan.
+    """
+
+    # shift each triple so that its first point is at the origin
+    x1, y1 = xArray[triples[:, 0]], yArray[triples[:, 0]]
+    x2, y2 = xArray[triples[:, 1]] - x1, yArray[triples[:, 1]] - y1
+    x3, y3 = xArray[triples[:, 2]] - x1, yArray[triples[:, 2]] - y1
+
+    # the centre of the circle through the origin, (x2, y2) and (x3, y3)
+    # solves the linear equations 2*x*xi + 2*y*yi = xi^2 + yi^2. Discard
+    # triples whose determinant is negligible compared to the size of the
+    # triangle
+    det = 2 * (x2*y3 - x3*y2)
+    isDegenerate = abs(det) <= 1e-12 * (x2*x2 + y2*y2 + x3*x3 + y3*y3)
+    det = np.where(isDegenerate, np.nan, det)
+    centerX = (y3*(x2*x2 + y2*y2) - y2*(x3*x3 + y3*y3)) / det
+    centerY = (x2*(x3*x3 + y3*y3) - x3*(x2*x2 + y2*y2)) / det
+
+    return centerX + x1, centerY + y1, np.hypot(centerX, centerY)
+
+def fitCircleRobust(xArray, yArray, weights=None, hypotheses=500,
+                    huberK=1.345, outlierCut=2.5, maxIterations=50, seed=0):
+    """Given xArray and yArray, arrays of the x and y-coordinates of a set of
+    points (e.g. track markers), some of which may be outliers (e.g.
+    mis-placed markers), fit a circle to the points robustly and return the
+    dictionary of fit parameters described in fitCircle along with a boolean
+    array which is True for the points flagged as outliers.
+
+    Up to hypotheses circles through three of the points (all of them if
+    there are fewer, otherwise a random sample drawn with seed) are
+    evaluated at once, and the one with the least median of squared distance
+    residuals is taken as the consensus. Starting from the least squares fit
+    of the points within outlierCut robust standard deviations of it, the
+    fit is then refined by iteratively reweighted least squares with the
+    Huber loss, which down-weights points whose residuals exceed huberK
+    standard deviations. Points whose final residuals exceed outlierCut
+    standard deviations are flagged as outliers. If a refining fit doesn't
+    converge, the refinement stops and the errors are infinite. weights is
+    an optional array of the weight of each point as for fitCircle. The
+    residuals are then measured in units of the uncertainty of each point
+    and the Huber weights multiply the given weights.
+    """
+
+    xArray = np.asarray(xArray, dtype=np.float64)
+    yArray = np.asarray(yArray, dtype=np.float64)
+    count = len(xArray)
+
+    # with too few points to tell outliers apart, do a plain fit
+    if count < 5:
+        return fitCircle(xArray, yArray, weights=weights), \
+               np.zeros(count, dtype=bool)
+
+    # the given weights, relative to which the Huber weights are applied
+    if weights is None:
+        priorWeights = np.ones(count)
+    else:
+        priorWeights = np.asarray(weights, dtype=np.float64)
+
+    # choose the triples of points defining the circle hypotheses. Take all
+    # of them if there are few enough, otherwise draw random triples of
+    # distinct points
+    if math.comb(count, 3) <= hypotheses:
+        triples = np.array(list(itertools.combinations(range(count), 3)))
+    else:
+        rng = np.random.default_rng(seed)
+        triples = rng.random((hypotheses, count)).argpartition(
+            3, axis=1)[:, :3]
+
+    # compute the distance residual of every point with respect to every
+    # hypothesis at once and find the hypothesis with the least median of
+    # squared residuals
+    centerX, centerY, radius = _threePointCircles(xArray, yArray, triples)
+    residuals = (np.hypot(xArray - centerX[:, np.newaxis],
+                          yArray - centerY[:, np.newaxis]) - \
+                 radius[:, np.newaxis]) * np.sqrt(priorWeights)
+    medians = np.median(residuals**2, axis=1)
+    best = np.argmin(np.where(np.isnan(medians), np.inf, medians))
+
+    # if every triple is collinear, there is no circle to find
+    if np.isnan(medians[best]):
+        return fitCircle(xArray, yArray, weights=weights), \
+               np.zeros(count, dtype=bool)
+
+    # estimate the standard deviation of the residuals of the inliers from
+    # the least median of squares, correcting for the small sample size
+    # (see P. J. Rousseeuw and A. M. Leroy, "Robust Regression and Outlier
+    # Detection"), and fit the points consistent with the consensus circle
+    scale = 1.4826 * (1 + 5 / (count - 3)) * np.sqrt(medians[best])
+    isInlier = abs(residuals[best]) <= outlierCut * scale
+    if isInlier.sum() >= 3:
+        inlierFit = fitCircle(xArray[isInlier], yArray[isInlier], 'hybrid',
+                              priorWeights[isInlier])
+        center = np.array([inlierFit['centerX'], inlierFit['centerY']])
+    else:
+        center = np.array([centerX[best], centerY[best]])
+
+    # refine the fit using all the points with Huber weights, recomputing
+    # the weights from the residuals of the previous fit each time
+    weights = priorWeights
+    ier = 1
+    for iteration in range(maxIterations):
+        distanceResiduals = _distanceResiduals(center, xArray, yArray,
+                                               weights) / \
+                            np.sqrt(weights / priorWeights)
+        # the robust standard deviation of the residuals, from their median
+        # absolute deviation. The residuals are in px (or in units of the
+        # uncertainties of the points), so residuals of less than a
+        # millionth are only round-off error
+        scale = max(1.4826 * np.median(abs(distanceResiduals)), 1e-6)
+        weights = priorWeights * np.minimum(
+            1, huberK * scale / np.maximum(abs(distanceResiduals), 1e-300))
+
+        newCenter, ier = optimize.leastsq(_distanceResiduals, center,
+                                          args=(xArray, yArray, weights),
+                                          Dfun=_distanceJacobian,
+                                          ftol=1e-15, xtol=1e-15)
+        # if the fit itself didn't converge, keep the previous centre, stop
+        # refining it and make its errors infinite (see fitCircle)
+        if ier not in (1, 2, 3, 4):
+            break
+        converged = np.hypot(*(newCenter - center)) <= \
+                    1e-9 * (1 + np.hypot(*newCenter))
+        center = newCenter
+        if converged:
+            break
+
+    # flag the points far from the refined circle
+    distanceResiduals = _distanceResiduals(center, xArray, yArray,
+                                           weights) / \
+                        np.sqrt(weights / priorWeights)
+    isOutlier = abs(distanceResiduals) > outlierCut * scale
+
+    fitParams = _fitParams(center, xArray, yArray, weights)
+    if ier not in (1, 2, 3, 4):
+        _infiniteErrors(fitParams)
+    return fitParams, isOutlier
+
+def _segmentSums(values, offsets):
+    """Given values, an array, and offsets, an array of the indices at which
+    each segment of values starts followed by the total length of values,
+    return an array containing the sum of the elements of each segment.
+    """
+
+    return np.add.reduceat(values, offsets[:-1])
+
+def _batchResiduals(centerX, centerY, xArray, yArray, offsets, weights):
+    """Given the centre coordinates of a number of sets of points and the
+    coordinates, offsets and weights of the points as for fitCircles (with
+    weights of 1 if there are none), return the weighted distance residuals
+    of every point with respect to the centre of its set, the two columns of
+    the Jacobian of the residuals (see _distanceResiduals and
+    _distanceJacobian) and the sum of the squares of the residuals of each
+    set.
+    """
+
+    counts = np.diff(offsets)
+    setIndex = np.repeat(np.arange(len(counts)), counts)
+    weightSums = _segmentSums(weights, offsets)
+    rootWeights = np.sqrt(weights)
+
+    distances = np.sqrt((xArray - centerX[setIndex])**2 + \
+                        (yArray - centerY[setIndex])**2)
+    residuals = rootWeights * (distances - (_segmentSums(
+        weights * distances, offsets) / weightSums)[setIndex])
+    unitX = (centerX[setIndex] - xArray) / distances
+    unitY = (centerY[setIndex] - yArray) / distances
+    jacobianX = rootWeights * (unitX - (_segmentSums(
+        weights * unitX, offsets) / weightSums)[setIndex])
+    jacobianY = rootWeights * (unitY - (_segmentSums(
+        weights * unitY, offsets) / weightSums)[setIndex])
+
+    return residuals, jacobianX, jacobianY, \
+           _segmentSums(residuals**2, offsets)
+
+def fitCircles(xArray, yArray, offsets, method='geometric', maxIterations=100,
+               weights=None):
+    """Fit a circle to each of a number of sets of points (e.g. the markers of
+    many tracks) at once. xArray and yArray are the concatenated x and
+    y-coordinates of the points of all the sets and offsets is an array of the
+    indices at which each set starts followed by the total number of points,
+    so that set i consists of the points offsets[i] to offsets[i+1]-1. Each
+    set must contain at least 3 points. method is as for fitCircle except that
+    the 'geometric' and 'hybrid' fits are both started from the Taubin fit and
+    done with vectorized Levenberg-Marquardt steps, for at most maxIterations
+    iterations. weights is an optional array of the weight of each point as
+    for fitCircle. Return a dict with the same keys as the one returned by
+    fitCircle whose values are arrays containing the parameters of the fitted
+    circle of each set. The geometric fits of exactly collinear sets are
+    done as in fitCircle.
+    """
+
+    if method not in METHODS:
+        raise ValueError("Unknown circle fit method: {}".format(method))
+
+    xArray = np.asarray(xArray, dtype=np.float64)
+    yArray = np.asarray(yArray, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.intp)
+
+    # determine the number of points in each set and the index of the set to
+    # which each point belongs
+    counts = np.diff(offsets)
+    if (counts < 3).any():
+        raise ValueError("Each set of points must contain at least 3 points.")
+    setIndex = np.repeat(np.arange(len(counts)), counts)
+
+    # without weights, every point has a weight of 1
+    if weights is None:
+        weights = np.ones(len(xArray))
+    else:
+        weights = np.asarray(weights, dtype=np.float64)
+    weightSums = _segmentSums(weights, offsets)
+
+    def weightedMeans(values):
+        """Return the weighted mean of values over each set."""
+
+        return _segmentSums(weights * values, offsets) / weightSums
+
+    # compute the weighted moments of the points of each set about their
+    # centroid and use them to do the algebraic fits of all the sets at once
+    meanX = weightedMeans(xArray)
+    meanY = weightedMeans(yArray)
+    xShifted = xArray - meanX[setIndex]
+    yShifted = yArray - meanY[setIndex]
+    zShifted = xShifted**2 + yShifted**2
+    moments = (meanX, meanY,
+               weightedMeans(xShifted * xShifted),
+               weightedMeans(xShifted * yShifted),
+               weightedMeans(yShifted * yShifted),
+               weightedMeans(xShifted * zShifted),
+               weightedMeans(yShifted * zShifted),
+               weightedMeans(zShifted * zShifted))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        centerX, centerY, radius = _algebraicCircle(
+            moments, method if method in ('kasa', 'pratt') else 'taubin')
+
+    # exactly collinear sets have no algebraic fit. As in fitCircle, put the
+    # centres of their geometric fits far out on the normals to their lines
+    # and leave them out of the iterations
+    isCollinear = np.zeros(len(counts), dtype=bool)
+    if method in ('geometric', 'hybrid'):
+        isCollinear = ~(np.isfinite(centerX) & np.isfinite(centerY))
+    if isCollinear.any():
+        collinearX, collinearY = _collinearCenter(moments)
+        centerX = np.where(isCollinear, collinearX, centerX)
+        centerY = np.where(isCollinear, collinearY, centerY)
+
+    if method in ('geometric', 'hybrid'):
+        # minimize the sum of the squares of the distance residuals of every
+        # set simultaneously with Levenberg-Marquardt steps. Each set has its
+        # own damping factor and only the sets that haven't converged yet are
+        # processed in each iteration. Start with undamped (Gauss-Newton)
+        # steps since the Taubin fit is already very close to the optimum.
+        # Damping the steps would shorten them along the poorly constrained
+        # direction of nearly straight tracks and stall the fit there
+        damping = np.zeros(len(counts))
+        active = np.flatnonzero(~isCollinear)
+        for iteration in range(maxIterations):
+            if not len(active):
+                break
+
+            # gather the points of the sets that are still being fitted
+            activeCounts = counts[active]
+            activeOffsets = np.concatenate(([0], np.cumsum(activeCounts)))
+            pointIndex = np.repeat(offsets[active] - activeOffsets[:-1],
+                                   activeCounts) + \
+                         np.arange(activeOffsets[-1])
+            activeX = xArray[pointIndex]
+            activeY = yArray[pointIndex]
+            activeWeights = weights[pointIndex]
+            activeCenterX = centerX[active]
+            activeCenterY = centerY[active]
+            activeDamping = damping[active]
+
+            # compute J^T.J and J^T.r for every set
+            residuals, jacobianX, jacobianY, cost = _batchResiduals(
+                activeCenterX, activeCenterY, activeX, activeY, activeOffsets,
+                activeWeights)
+            jtjXX = _segmentSums(jacobianX * jacobianX, activeOffsets)
+            jtjXY = _segmentSums(jacobianX * jacobianY, activeOffsets)
+            jtjYY = _segmentSums(jacobianY * jacobianY, activeOffsets)
+            jtrX = _segmentSums(jacobianX * residuals, activeOffsets)
+            jtrY = _segmentSums(jacobianY * residuals, activeOffsets)
+
+            # solve the damped normal equations for the step of every set
+            dampedXX = jtjXX * (1 + activeDamping)
+            dampedYY = jtjYY * (1 + activeDamping)
+            det = dampedXX * dampedYY - jtjXY**2
+            stepX = -(dampedYY*jtrX - jtjXY*jtrY) / det
+            stepY = -(dampedXX*jtrY - jtjXY*jtrX) / det
+
+            # evaluate the cost after the step and keep the step only where
+            # it did not increase the cost, adjusting the damping accordingly
+            trialCost = _batchResiduals(activeCenterX + stepX,
+                                        activeCenterY + stepY,
+                                        activeX, activeY, activeOffsets,
+                                        activeWeights)[3]
+            improved = trialCost <= cost
+            centerX[active] = np.where(improved, activeCenterX + stepX,
+                                       activeCenterX)
+            centerY[active] = np.where(improved, activeCenterY + stepY,
+                                       activeCenterY)
+
+            # a set has converged once a step no longer changes its cost
+            # significantly. Near the optimum the cost is quadratic in the
+            # centre coordinates and an undamped step goes straight to its
+            # minimum, so the following step only changes the cost by its
+            # round-off error. A set whose cost can't be decreased even by
+            # heavily damped steps has also reached that limit
+            converged = (improved & (cost - trialCost <= 1e-12 * cost)) | \
+                        (~improved & (activeDamping >= 1e6))
+            activeDamping = np.where(improved, activeDamping / 10,
+                                     np.maximum(activeDamping * 10, 1e-3))
+            activeDamping[activeDamping < 1e-3] = 0
+            damping[active] = activeDamping
+            active = active[~converged]
+
+    # multiply the inverse of J^T.J of each set by its 'residual variance',
+    # chi-squared/degrees of freedom, to get the covariance of the centre
+    # coordinates (see fitCircle)
+    residuals, jacobianX, jacobianY, cost = _batchResiduals(
+        centerX, centerY, xArray, yArray, offsets, weights)
+    chi2Dof = cost / (counts - 2)
+    jtjXX = _segmentSums(jacobianX * jacobianX, offsets)
+    jtjXY = _segmentSums(jacobianX * jacobianY, offsets)
+    jtjYY = _segmentSums(jacobianY * jacobianY, offsets)
+    det = jtjXX * jtjYY - jtjXY**2
+
+    fitParams = {}
+    fitParams['centerX'] = centerX
+    fitParams['centerY'] = centerY
+    fitParams['centerXErr'] = np.sqrt(jtjYY / det * chi2Dof)
+    fitParams['centerYErr'] = np.sqrt(jtjXX / det * chi2Dof)
+    fitParams['centerCovXY'] = -jtjXY / det * chi2Dof
+
+    # the radius of each circle is the weighted mean of the distances from
+    # its points to its centre and its error is computed as in fitCircle
+    fitParams['radius'] = weightedMeans(
+        np.sqrt((xArray - centerX[setIndex])**2 + \
+                (yArray - centerY[setIndex])**2))
+    fitParams['radiusErr'] = np.sqrt(
+        ((centerX - meanX) / fitParams['radius'] * \
+         fitParams['centerXErr'])**2 + \
+        ((centerY - meanY) / fitParams['radius'] * \
+         fitParams['centerYErr'])**2)
+
+    # the circles of collinear sets are unconstrained
+    for key in ('centerXErr', 'centerYErr', 'centerCovXY', 'radiusErr'):
+        fitParams[key][isCollinear] = np.inf
+
+    return fitParams
+
+class IncrementalCircleFit(object):
+
+    """Algebraic circle fit that can be updated one point at a time. The
+    object keeps running sums of the powers of the coordinates of the points
+    (relative to the first point added, to limit round-off error) so that
+    adding, moving or removing a point and refitting the circle take a
+    constant time regardless of the number of points.
+    """
+
+    # mask selecting the power sums that are kept, those of order 4 or less
+    _powerMask = np.add.outer(np.arange(5), np.arange(5)) <= 4
+
+    def __init__(self):
+        """Initialize the fit with no points."""
+
+        self.reset()
+
+    def reset(self):
+        """Remove all points from the fit."""
+
+        # the origin is the point relative to which the powers of the
+        # coordinates are summed. It is set when the first point is added
+        self.origin = None
+        self.powerSums = np.zeros((5, 5))
+
+    def _powers(self, x, y):
+        """Return the array of the powers of the coordinates of the point
+        (x, y) relative to the origin that are added to the power sums.
+        """
+
+        powersX = (x - self.origin[0])**np.arange(5)
+        powersY = (y - self.origin[1])**np.arange(5)
+
+        return np.outer(powersX, powersY) * self._powerMask
+
+    def count(self):
+        """Return the number of points in the fit."""
+
+        return int(round(self.powerSums[0, 0]))
+
+    def addPoint(self, x, y):
+        """Add the point (x, y) to the fit."""
+
+        if self.origin is None:
+            self.origin = (x, y)
+        self.powerSums += self._powers(x, y)
+
+    def removePoint(self, x, y):
+        """Remove the point (x, y), which must have been added before, from
+        the fit.
+        """
+
+        self.powerSums -= self._powers(x, y)
+
+        # once the last point is removed, start again from exactly zero so
+        # that round-off errors don't accumulate
+        if self.count() == 0:
+            self.reset()
+
+    def movePoint(self, oldX, oldY, newX, newY):
+        """Move a point of the fit from (oldX, oldY) to (newX, newY)."""
+
+        self.powerSums += self._powers(newX, newY) - self._powers(oldX, oldY)
+
+    def fit(self, method='taubin'):
+        """Fit a circle to the current points using the algebraic fit method,
+        one of 'kasa', 'pratt' or 'taubin', and return a dict containing the
+        coordinates of its centre and its radius, or None if there are fewer
+        than 3 points.
+        """
+
+        if self.count() < 3:
+            return None
+
+        fitParams = {}
+        fitParams['centerX'], fitParams['centerY'], fitParams['radius'] = \
+            _algebraicCircle(_momentsFromPowerSums(self.powerSums,
+                                                   *self.origin), method)
+
+        return fitParams
+
+def fitWindows(xArray, yArray, windowSize, method='taubin'):
+    """Given xArray and yArray, arrays of the x and y-coordinates of a
+    sequence of n points (e.g. track markers ordered along the track), fit a
+    circle to every window of windowSize consecutive points using the
+    algebraic fit method, one of 'kasa', 'pratt' or 'taubin', and return
+    arrays of the coordinates of the centre and the radius of each of the
+    n - windowSize + 1 fitted circles. The power sums of every window are
+    taken as differences of running sums over the sequence, so the cost does
+    not grow with windowSize. A window of exactly collinear points has an
+    infinite radius and a centre far out on the normal to their line (see
+    _collinearCenter).
+    """
+
+    xArray = np.asarray(xArray, dtype=np.float64)
+    yArray = np.asarray(yArray, dtype=np.float64)
+
+    # take the powers relative to the mean of the points to limit round-off
+    # error in the differences of the running sums
+    originX, originY = xArray.mean(), yArray.mean()
+
+    # the powers of the coordinates of every point relative to the origin for
+    # p + q <= 4 (as for IncrementalCircleFit)
+    powersX = (xArray - originX)[:, np.newaxis]**np.arange(5)
+    powersY = (yArray - originY)[:, np.newaxis]**np.arange(5)
+    powers = powersX[:, :, np.newaxis] * powersY[:, np.newaxis, :] * \
+             IncrementalCircleFit._powerMask
+
+    # running sums of the powers, starting with an empty sum, so that the
+    # power sums of the window starting at point i are the difference
+    # between the running sums at i + windowSize and at i
+    runningSums = np.concatenate((np.zeros((1, 5, 5)),
+                                  np.cumsum(powers, axis=0)))
+    windowSums = runningSums[windowSize:] - runningSums[:-windowSize]
+
+    moments = _momentsFromPowerSums(windowSums, originX, originY)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        centerX, centerY, radius = _algebraicCircle(moments, method)
+
+    # the algebraic fits have no solution for collinear windows
+    isCollinear = ~(np.isfinite(centerX) & np.isfinite(centerY))
+    if isCollinear.any():
+        collinearX, collinearY = _collinearCenter(moments)
+        centerX = np.where(isCollinear, collinearX, centerX)
+        centerY = np.where(isCollinear, collinearY, centerY)
+        radius = np.where(isCollinear, np.inf, radius)
+
+    return centerX, centerY, radius
@@ -0,0 +1,314 @@
+# Copyright (C) 2014 Syed Haider Abidi, Nooruddin Ahmed and Christopher Dydula
+#
+# This file is part of traxis.
+#
+# traxis is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# traxis is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with traxis.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+from traxis.calc import anglecalc, circlefit, momentum, optdensity
+
+
+def _markerWeights(uncertainties):
+    """Given an array of the positional uncertainties (in px) of the track
+    markers, or None, return the weights of the markers in the circle fit,
+    the inverse squares of their uncertainties, or None.
+    """
+
+    if uncertainties is None:
+        return None
+    return 1 / np.asarray(uncertainties, dtype=np.float64)**2
+
+def fitTrack(xArray, yArray, startX, startY, endX, endY, method='geometric',
+             uncertainties=None):
+    """Given arrays of the x and y coordinates of the track markers and the
+    coordinates of the track's start and end points, fit a circle to the
+    markers using method and return a dictionary of the fitted circle
+    parameters (see circlefit.fitCircle) along with the start and span angles
+    (in degrees) of the arc covering the track between its start and end
+    points. If uncertainties, an array of the positional uncertainty (in px)
+    of each marker, is given, the markers are weighted by the inverse squares
+    of their uncertainties.
+    """
+
+    # fit a circle to the track markers
+    circleParams = circlefit.fitCircle(xArray, yArray, method,
+                                       _markerWeights(uncertainties))
+
+    # compute the start and span angles of the arc between the start and end
+    # points using the fitted circle center
+    startAngle, spanAngle = anglecalc.arcAngles(circleParams, startX, startY,
+                                                endX, endY)
+
+    return circleParams, startAngle, spanAngle
+
+def fitTrackRobust(xArray, yArray, startX, startY, endX, endY,
+                   uncertainties=None):
+    """As fitTrack, but fit the circle robustly (see
+    circlefit.fitCircleRobust) and also return a boolean array which is True
+    for the markers flagged as outliers.
+    """
+
+    # fit a circle to the track markers, flagging the outliers
+    circleParams, isOutlier = circlefit.fitCircleRobust(
+        xArray, yArray, _markerWeights(uncertainties))
+
+    # compute the start and span angles of the arc between the start and end
+    # points using the fitted circle center
+    startAngle, spanAngle = anglecalc.arcAngles(circleParams, startX, startY,
+                                                endX, endY)
+
+    return circleParams, startAngle, spanAngle, isOutlier
+
+def trackDensity(plane, circleParams, dL, startAngle, spanAngle, cmPerPx,
+                 errCmPerPx, weighting='points', backgroundWidth=0,
+                 workers=1):
+    """Given a blackness plane (see optdensity.calcBlackness), the parameters
+    of the circle fitted to a track, the dL, the start and span angles (in
+    degrees) of the arc covering the track and the px to cm calibration
+    cmPerPx and its error errCmPerPx, return the optical density of the track
+    (in 1/cm) along with its error. weighting is 'points' to count every
+    pixel containing a sample point of the polar rectangle in full (see
+    optdensity.calcBlackness) or 'area' to weight every pixel by the fraction
+    of it covered by the polar rectangle (see optdensity.blacknessCoverage).
+    If backgroundWidth is non-zero, the background measured in polar
+    rectangles of that thickness on either side of the track is subtracted
+    (see optdensity.blacknessBackground). The blackness is summed by a pool
+    of workers threads.
+    """
+
+    if weighting not in ('points', 'area'):
+        raise ValueError("Unknown density weighting: {}".format(weighting))
+
+    # compute the total blackness of the pixels covered by the arc
+    if backgroundWidth:
+        # the sample points of calcBlackness don't give the area of the
+        # pixels they cover, which is needed to subtract the background. For
+        # 'points' weighting, use whole pixels whose centers are in the
+        # polar rectangle instead
+        if weighting == 'area':
+            supersampling = 4
+        else:
+            supersampling = 1
+        blackness, blacknessErr, background, backgroundErr = \
+            optdensity.blacknessBackground(plane, circleParams, dL,
+                                           startAngle, spanAngle,
+                                           backgroundWidth, supersampling,
+                                           workers=workers)
+    elif weighting == 'area':
+        blackness, blacknessErr = optdensity.blacknessCoverage(
+            plane, circleParams, dL, startAngle, spanAngle, workers=workers)
+    else:
+        blackness, blacknessErr = optdensity.calcBlackness(
+            plane, circleParams, dL, startAngle, spanAngle, workers)
+
+    # calculate the length of the arc in cm
+    trackLengthPx, trackLengthCm, trackLengthCmErr = momentum.trackLength(
+        circleParams['radius'], spanAngle, cmPerPx, errCmPerPx)
+
+    # optical density is the total blackness per unit length
+    return optdensity.opticalDensity(blackness, blacknessErr, trackLengthCm,
+                                     trackLengthCmErr)
+
+def trackDensityScan(plane, circleParams, maxDL, startAngle, spanAngle,
+                     cmPerPx, errCmPerPx, weighting='points', workers=1):
+    """Given a blackness plane, the parameters of the circle fitted to a
+    track, the largest dL to consider, the start and span angles (in degrees)
+    of the arc covering the track and the px to cm calibration cmPerPx and
+    its error errCmPerPx, return arrays of the optical density of the track
+    (in 1/cm) and its error for every integer dL from 0 to maxDL, along with
+    the dL at which the optical density reaches its plateau (None if it
+    doesn't). weighting is as for trackDensity, so the optical density for
+    each dL is the one trackDensity gives without background subtraction.
+    The blackness is summed by a pool of workers threads.
+    """
+
+    if weighting not in ('points', 'area'):
+        raise ValueError("Unknown density weighting: {}".format(weighting))
+
+    # compute the total blackness for every dL in one pass
+    if weighting == 'area':
+        blackness, blacknessErr = optdensity.blacknessCoverageScan(
+            plane, circleParams, maxDL, startAngle, spanAngle,
+            workers=workers)
+    else:
+        blackness, blacknessErr = optdensity.blacknessScan(
+            plane, circleParams, maxDL, startAngle, spanAngle, workers)
+
+    # calculate the length of the arc in cm
+    trackLengthPx, trackLengthCm, trackLengthCmErr = momentum.trackLength(
+        circleParams['radius'], spanAngle, cmPerPx, errCmPerPx)
+
+    # optical density is the total blackness per unit length. A dL with no
+    # blackness has an undefined error
+    with np.errstate(divide='ignore', invalid='ignore'):
+        optDensity, optDensityErr = optdensity.opticalDensity(
+            blackness, blacknessErr, trackLengthCm, trackLengthCmErr)
+
+    return optDensity, optDensityErr, optdensity.plateauDL(optDensity)
+
+def trackDensityProfile(plane, circleParams, dL, startAngle, spanAngle,
+                        binLength, cmPerPx, errCmPerPx, workers=1):
+    """Given a blackness plane, the parameters of the circle fitted to a
+    track, the dL, the start and span angles (in degrees) of the arc covering
+    the track, the length (in px) of the segments to divide the arc into and
+    the px to cm calibration cmPerPx and its error errCmPerPx, return the
+    edges of the segments (in px of arc length from the start of the arc)
+    along with arrays of the optical density (in 1/cm) of each segment and
+    its error. The blackness is summed by a pool of workers threads.
+    """
+
+    # compute the total blackness of each segment in one pass
+    binEdges, blackness, blacknessErr = optdensity.blacknessProfile(
+        plane, circleParams, dL, startAngle, spanAngle, binLength, workers)
+
+    # the length of each segment in cm
+    segmentLengthPx = np.diff(binEdges)
+    segmentLengthCm = segmentLengthPx * cmPerPx
+    segmentLengthCmErr = segmentLengthPx * errCmPerPx
+
+    # optical density is the total blackness per unit length. A segment with
+    # no blackness has an undefined error
+    with np.errstate(divide='ignore', invalid='ignore'):
+        optDensity, optDensityErr = optdensity.opticalDensity(
+            blackness, blacknessErr, segmentLengthCm, segmentLengthCmErr)
+
+    return binEdges, optDensity, optDensityErr
+
+def trackAngle(circleParams, startX, startY, refLine):
+    """Given the parameters of the circle fitted to a track, the coordinates
+    of the track's start point and a reference line as an (x1, y1, x2, y2)
+    tuple, return the tangent line to the circle at the start point (as an
+    (x1, y1, x2, y2) tuple), the opening angle between the tangent and the
+    reference line (in degrees) and the error on the angle.
+    """
+
+    # get the tangent line at the start point along with the two lines that
+    # the tangent may lie between within error
+    tangentLine, tangentErrA, tangentErrB = anglecalc.tangentCalc(
+        circleParams, startX, startY)
+
+    # compute the angle between the tangent and the reference line
+    angle, angleErr = anglecalc.openingAngle(tangentLine, tangentErrA,
+                                             tangentErrB, refLine)
+
+    return tangentLine, angle, angleErr
+
+def vertexAngles(circleParams, startX, startY, endX, endY, beamLine=None):
+    """Given a dict of arrays of the parameters of the circles fitted to N
+    tracks leaving a common vertex (as returned by circlefit.fitCircles) and
+    arrays of the coordinates of their start points (at the vertex) and end
+    points, return arrays of the direction (in degrees) in which each track
+    leaves the vertex and its error, along with N x N arrays of the opening
+    angle between every pair of tracks and its error. If beamLine, an
+    (x1, y1, x2, y2) tuple pointing along the beam, is given, its direction
+    is included as an extra, exact track, so the last row of the opening
+    angles holds the angles between the tracks and the beam.
+    """
+
+    # the direction of each track at the vertex
+    directions, directionErrs = anglecalc.trackDirection(
+        circleParams, np.asarray(startX, dtype=np.float64),
+        np.asarray(startY, dtype=np.float64),
+        np.asarray(endX, dtype=np.float64),
+        np.asarray(endY, dtype=np.float64))
+
+    # add the beam direction
+    if beamLine is not None:
+        directions = np.append(directions, anglecalc.pointAngle(
+            beamLine[:2], beamLine[2], beamLine[3]))
+        directionErrs = np.append(directionErrs, 0)
+
+    return (directions, directionErrs) + \
+        anglecalc.openingAngleMatrix(directions, directionErrs)
+
+def momentumProfile(xArray, yArray, circleParams, startX, startY, windowSize,
+                    cmPerPx, errCmPerPx, magneticField, c):
+    """Given arrays of the x and y coordinates of the track markers, the
+    parameters of the circle fitted to all of them, the coordinates of the
+    track's start point, the number of consecutive markers windowSize to fit
+    at a time, the px to cm calibration cmPerPx and its error errCmPerPx, the
+    magnetic field (in kG) and the speed of light (in giga metres per
+    second), fit a circle to every window of windowSize markers ordered along
+    the track and return a dict containing, for each window, the mean arc
+    length of its markers from the start point (in px), the fitted radius (in
+    px) and the momentum (in MeV/c), along with the momentum at the start
+    point extrapolated linearly from the profile. A window of collinear
+    markers has an infinite radius and momentum and is left out of the
+    extrapolation, which is nan if every window is. The dict also contains the
+    center coordinates of each window's circle and the start and span angles
+    (in degrees) of the part of the track it is drawn over.
+    """
+
+    xArray = np.asarray(xArray, dtype=np.float64)
+    yArray = np.asarray(yArray, dtype=np.float64)
+    centerX = circleParams['centerX']
+    centerY = circleParams['centerY']
+
+    # the arc length of every marker from the start point, going
+    # counter-clockwise around the fitted circle as for anglecalc.arcAngles
+    markerArcLengths = circleParams['radius'] * np.radians(
+        anglecalc._angleTo((centerX, centerY, startX, startY),
+                           (centerX, centerY, xArray, yArray)))
+
+    # order the markers along the track
+    order = np.argsort(markerArcLengths, kind='stable')
+    xArray, yArray = xArray[order], yArray[order]
+    markerArcLengths = markerArcLengths[order]
+
+    # fit a circle to every window of consecutive markers
+    windowCenterX, windowCenterY, radii = circlefit.fitWindows(
+        xArray, yArray, windowSize)
+
+    # the position of each window along the track is the mean arc length of
+    # its markers
+    runningLengths = np.concatenate(([0], np.cumsum(markerArcLengths)))
+    arcLengths = (runningLengths[windowSize:] - \
+                  runningLengths[:-windowSize]) / windowSize
+
+    momenta = momentum.trackMomentum(radii, 0, cmPerPx, errCmPerPx,
+                                     magneticField, c)[0]
+
+    # extrapolate the momentum to the start point with a straight line
+    # through the profile, leaving out the windows of collinear markers,
+    # whose momentum is infinite. With a single such window, use its
+    # momentum, and with none, the start momentum is unknown
+    isFinite = np.isfinite(momenta)
+    if isFinite.sum() > 1:
+        startMomentum = np.polyval(np.polyfit(arcLengths[isFinite],
+                                              momenta[isFinite], 1), 0)
+    elif isFinite.any():
+        startMomentum = momenta[isFinite][0]
+    else:
+        startMomentum = np.nan
+
+    # each window is drawn between the markers halfway through it and
+    # halfway through the next window, so that the windows tile the track
+    # from its first marker to its last
+    half = (windowSize - 1) // 2
+    firstMarker = np.arange(len(radii)) + half
+    firstMarker[0] = 0
+    lastMarker = np.append(firstMarker[1:], len(xArray) - 1)
+    startAngles = anglecalc.pointAngle(
+        (windowCenterX, windowCenterY), xArray[firstMarker],
+        yArray[firstMarker])
+    spanAngles = anglecalc._angleTo(
+        (windowCenterX, windowCenterY, xArray[firstMarker],
+         yArray[firstMarker]),
+        (windowCenterX, windowCenterY, xArray[lastMarker],
+         yArray[lastMarker]))
+
+    return {'arcLength': arcLengths, 'radius': radii, 'momentum': momenta,
+            'startMomentum': startMomentum, 'centerX': windowCenterX,
+            'centerY': windowCenterY, 'startAngle': startAngles,
+            'spanAngle': spanAngles}
@@ -0,0 +1,52 @@
+# Copyright (C) 2014 Syed Haider Abidi, Nooruddin Ahmed and Christopher Dydula
+#
+# This file is part of traxis.
+#
+# traxis is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# traxis is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with traxis.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+
+
+def trackMomentum(radius, radiusErr, cmPerPx, errCmPerPx, magneticField, c):
+    """Given the radius of a track and its error (in px), the px to cm
+    calibration cmPerPx and its error errCmPerPx, the magnetic field (in kG)
+    and the speed of light (in giga metres per second), return the momentum
+    of the track in MeV/c along with its statistical error and its
+    calibration error.
+    """
+
+    # given a track radius, R, in cm, a magnetic field, B, in kG and the speed
+    # of light, c, in Giga metres per second, the track momentum in MeV/c can
+    # be computed as p = c*B*R
+    momentum = c * magneticField * radius * cmPerPx
+    momentumStatErr = c * magneticField * radiusErr * cmPerPx
+    momentumCalErr = c * magneticField * radius * errCmPerPx
+
+    return momentum, momentumStatErr, momentumCalErr
+
+def trackLength(radius, spanAngle, cmPerPx, errCmPerPx):
+    """Given the radius of a track (in px), the span angle (in degrees) of the
+    arc covering the track and the px to cm calibration cmPerPx and its error
+    errCmPerPx, return the length of the track in px, its length in cm and
+    the error on its length in cm.
+    """
+
+    # the length of an arc is its radius times its span angle in radians
+    trackLengthPx = radius * np.radians(spanAngle)
+
+    # convert track length from px to cm
+    trackLengthCm = trackLengthPx * cmPerPx
+    trackLengthCmErr = trackLengthPx * errCmPerPx
+
+    return trackLengthPx, trackLengthCm, trackLengthCmErr
@@ -0,0 +1,218 @@
+# Copyright (C) 2014 Syed Haider Abidi, Nooruddin Ahmed and Christopher Dydula
+#
+# This file is part of traxis.
+#
+# traxis is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# traxis is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with traxis.  If not, see <http://www.gnu.org/licenses/>.
+
+import functools
+import concurrent.futures
+import numpy as np
+from traxis.calc import anglecalc, circlefit, measure, momentum, optdensity
+
+# the number of replicas generated from each random seed. The replicas are
+# split into chunks of this size, each with its own seed, so that the
+# results don't depend on how many processes the chunks are spread across
+CHUNKSIZE = 250
+
+# the percentiles of each measured quantity that are reported
+PERCENTILES = (2.5, 16, 50, 84, 97.5)
+
+def _replicaChunk(seedSequence, replicas, xArray, yArray, uncertainties,
+                  startIndex, endIndex, cmPerPx, errCmPerPx, magneticField, c,
+                  refLine, plane, origin, dL, dLErr, weighting,
+                  backgroundWidth):
+    """Generate replicas replicas of a track measurement with the random
+    numbers of seedSequence, a numpy SeedSequence, and return an array with
+    a row for each replica containing the radius (in px), momentum (in
+    MeV/c) and length (in cm) of the track followed by its optical density
+    (in 1/cm) if plane is not None and its opening angle (in degrees) if
+    refLine is not None. The other arguments are as for trackMonteCarlo,
+    except that plane is the part of the blackness plane whose top-left
+    pixel is at origin, an (x, y) tuple.
+    """
+
+    rng = np.random.default_rng(seedSequence)
+    count = len(xArray)
+
+    # smear the marker positions, the calibration and the dL of every replica
+    smearedX = xArray + uncertainties * rng.standard_normal((replicas, count))
+    smearedY = yArray + uncertainties * rng.standard_normal((replicas, count))
+    smearedCmPerPx = cmPerPx + errCmPerPx * rng.standard_normal(replicas)
+    smearedDL = np.maximum(dL + dLErr * rng.standard_normal(replicas), 0)
+
+    # fit the circles of all the replicas at once, weighting the markers by
+    # their uncertainties as the measurement does
+    circleParams = circlefit.fitCircles(
+        smearedX.ravel(), smearedY.ravel(), np.arange(replicas + 1) * count,
+        weights=np.tile(1 / uncertainties**2, replicas))
+    startX, startY = smearedX[:, startIndex], smearedY[:, startIndex]
+    endX, endY = smearedX[:, endIndex], smearedY[:, endIndex]
+    startAngles, spanAngles = anglecalc.arcAngles(circleParams, startX,
+                                                  startY, endX, endY)
+
+    # the momentum and length of every replica
+    radii = circleParams['radius']
+    quantities = [
+        radii,
+        momentum.trackMomentum(radii, 0, smearedCmPerPx, 0, magneticField,
+                               c)[0],
+        momentum.trackLength(radii, spanAngles, smearedCmPerPx, 0)[1]]
+
+    # the optical density of every replica. With 'points' weighting and no
+    # background subtraction, the sample points of the arcs of all the
+    # replicas are generated and summed together. The other weightings
+    # weight every pixel by its own coverage, which is no cheaper for many
+    # arcs at once, so their pixels are summed one replica at a time
+    if plane is not None:
+        arcParams = {'centerX': circleParams['centerX'] - origin[0],
+                     'centerY': circleParams['centerY'] - origin[1],
+                     'radius': radii}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if weighting == 'points' and not backgroundWidth:
+                densities = optdensity.opticalDensity(
+                    optdensity.calcBlacknesses(plane, arcParams, smearedDL,
+                                               startAngles, spanAngles)[0],
+                    0, quantities[2], 0)[0]
+            else:
+                densities = np.empty(replicas)
+                for replica in range(replicas):
+                    densities[replica] = measure.trackDensity(
+                        plane, {key: value[replica] for key, value in
+                                arcParams.items()},
+                        smearedDL[replica], startAngles[replica],
+                        spanAngles[replica], smearedCmPerPx[replica], 0,
+                        weighting, backgroundWidth)[0]
+        quantities.append(densities)
+
+    # the opening angle of every replica
+    if refLine is not None:
+        quantities.append(anglecalc.tangentOpeningAngle(
+            circleParams, startX, startY, refLine)[0])
+
+    return np.column_stack(quantities)
+
+def trackMonteCarlo(xArray, yArray, uncertainties, startIndex, endIndex,
+                    circleParams, startAngle, spanAngle, cmPerPx, errCmPerPx,
+                    magneticField, c, refLine=None, plane=None, dL=0,
+                    dLErr=1, weighting='points', backgroundWidth=0,
+                    replicas=2000, workers=1, seed=0):
+    """Propagate the uncertainties of a track measurement by generating
+    replicas of it in which the marker positions (whose coordinates are in
+    xArray and yArray) are smeared by their uncertainties (scaled, as the
+    covariance of the fit is, so that the fit to the markers has a
+    chi-squared per degree of freedom of 1), the px to cm
+    calibration cmPerPx by its error errCmPerPx and the dL by dLErr (1 px,
+    as assumed by optdensity.calcBlackness). Each replica is measured in the
+    same way as the track: its circle is fitted, its start and end points
+    are the markers with indices startIndex and endIndex and its momentum,
+    length, optical density (if plane, the blackness plane, is given and dL
+    is non-zero, measured with weighting and backgroundWidth as for
+    measure.trackDensity) and opening angle with refLine (if it is given)
+    are computed. circleParams, startAngle and spanAngle are the fitted
+    circle and the arc of the track itself, which are used to find the part
+    of the blackness plane the replicas can cover.
+
+    The replicas are generated in chunks spread across a pool of workers
+    processes, each chunk having its own seed derived from seed. Each step
+    of the measurement is done for all the replicas of a chunk at once,
+    except for the optical density with 'area' weighting or background
+    subtraction, whose pixels are weighted one replica at a time. For a
+    track of 12 markers about 700 px long with a dL of 3, 2000 replicas take
+    about 1 s on one core with 'points' weighting, 2.5 s with 'area'
+    weighting and 4 s with 'area' weighting and the background subtracted.
+    Return a dict containing the names of the measured quantities, the
+    number of replicas, the number of them that failed (e.g. had no optical
+    density), and the mean, standard deviation, covariance matrix and
+    PERCENTILES of the quantities over the other replicas.
+    """
+
+    xArray = np.asarray(xArray, dtype=np.float64)
+    yArray = np.asarray(yArray, dtype=np.float64)
+    uncertainties = np.asarray(uncertainties, dtype=np.float64)
+
+    # the circle fit only uses the relative uncertainties of the markers and
+    # scales its covariance by chi-squared per degree of freedom (see
+    # circlefit.fitCircle), so scale the uncertainties the markers are
+    # smeared by in the same way
+    chi2Dof = (circlefit._distanceResiduals(
+        (circleParams['centerX'], circleParams['centerY']), xArray, yArray,
+        1 / uncertainties**2)**2).sum() / (len(xArray) - 2)
+    uncertainties = uncertainties * np.sqrt(chi2Dof)
+
+    names = ['radius', 'momentum', 'trackLength']
+
+    # only pass the part of the blackness plane that the replicas can cover
+    # to the workers. Allow for the spread of the replica arcs around the
+    # track, including their background rectangles, and for the spread of
+    # their start and end points
+    origin = (0, 0)
+    if plane is not None and dL:
+        names.append('optDensity')
+        margin = dL + 5 * dLErr + backgroundWidth + 2 + \
+                 5 * (uncertainties.max() + circleParams['radiusErr'])
+        anglePad = min(np.degrees(margin / circleParams['radius']), 180)
+        box = optdensity._sectorBox(
+            circleParams, max(circleParams['radius'] - margin, 0),
+            circleParams['radius'] + margin, startAngle - anglePad,
+            min(spanAngle + 2 * anglePad, 360), plane.shape)
+        if box is None:
+            plane = np.zeros((0, 0), dtype=np.float32)
+        else:
+            top, bottom, left, right = box
+            plane = np.array(plane[top:bottom + 1, left:right + 1])
+            origin = (left, top)
+    else:
+        plane = None
+    if refLine is not None:
+        names.append('angle')
+
+    # split the replicas into chunks, each with its own seed
+    chunkSizes = [min(CHUNKSIZE, replicas - start)
+                  for start in range(0, replicas, CHUNKSIZE)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunkSizes))
+    chunk = functools.partial(
+        _replicaChunk, xArray=xArray, yArray=yArray,
+        uncertainties=uncertainties, startIndex=startIndex,
+        endIndex=endIndex, cmPerPx=cmPerPx, errCmPerPx=errCmPerPx,
+        magneticField=magneticField, c=c, refLine=refLine, plane=plane,
+        origin=origin, dL=dL, dLErr=dLErr, weighting=weighting,
+        backgroundWidth=backgroundWidth)
+
+    if workers > 1 and len(chunkSizes) > 1:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            results = np.concatenate(list(executor.map(chunk, seeds,
+                                                       chunkSizes)))
+    else:
+        results = np.concatenate(list(map(chunk, seeds, chunkSizes)))
+
+    # the opening angles of the replicas may wrap around 0 degrees, so
+    # measure them relative to their circular mean
+    if refLine is not None:
+        angles = np.radians(results[:, -1])
+        meanAngle = np.mod(np.degrees(np.arctan2(np.sin(angles).mean(),
+                                                 np.cos(angles).mean())), 360)
+        results[:, -1] = meanAngle + \
+                         np.mod(results[:, -1] - meanAngle + 180, 360) - 180
+
+    # discard the replicas for which a quantity couldn't be computed
+    isValid = np.isfinite(results).all(axis=1)
+    results = results[isValid]
+
+    return {'names': names,
+            'replicas': replicas,
+            'failed': int(replicas - isValid.sum()),
+            'mean': results.mean(axis=0),
+            'std': results.std(axis=0, ddof=1),
+            'covariance': np.atleast_2d(np.cov(results, rowvar=False)),
+            'percentiles': np.percentile(results, PERCENTILES, axis=0)}
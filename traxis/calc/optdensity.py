@@ -15,69 +15,879 @@
 # You should have received a copy of the GNU General Public License
 # along with traxis.  If not, see <http://www.gnu.org/licenses/>.
 
+import concurrent.futures
 import numpy as np
-from PyQt5 import QtGui
 
 
-def calcBlackness(image, circleParams, dL, startAngle, spanAngle):
-    """Given image, a QImage, a circle defined by circleParams (a dict
+# the number of rows of pixels in each of the strips that the pixels near an
+# arc are split into when summing them. The strips are summed separately (in
+# parallel if there are several workers) and then added up in order, so the
+# sums don't depend on the number of workers
+STRIPHEIGHT = 128
+
+# the number of sample points that the arcs measured together by
+# calcBlacknesses are split into chunks of, to bound the memory taken up by
+# the arrays of their points
+SAMPLECHUNK = 2**20
+
+
+def calcBlackness(plane, circleParams, dL, startAngle, spanAngle, workers=1):
+    """Given plane, a 2D array (indexed as [y, x]) containing the blackness of
+    each pixel of an image, a circle defined by circleParams (a dict
     containing the radius and centre coordinates of a circle), a
     startAngle and spanAngle (both in degrees) specifying an arc of that
     circle, and dL, the 'infinitesimal' thickness of a polar rectangle
     surrounding that arc, return the sum of the blackness of all the pixels
-    in image that are contained within the polar rectangle along with an
-    error on the blackness.
+    in the image that are contained within the polar rectangle along with an
+    error on the blackness. The points of each radius are generated by a
+    pool of workers threads (see _parallelMap).
     """
 
     # assume 1 px error on the dL
     dLErr = 1
 
-    # initialize a set of distinct points that are contained within the polar
-    # rectangle surrounding an arc of the circle defined by circleParams
-    # from startAngle to startAngle + spanAngle and with radial thickness
-    # 2*dL+1
-    pointSet = set()
-    # initialize also a set of distinct points that are in the polar rectangles
-    # of thickness dLErr that lie radially just above and just below the
-    # previously defined polar rectangle
-    errPointSet = set()
-
-    # loop over all the points in the combined area of the three polar
-    # rectangles, adding each point to the appropriate set
-    radii = np.linspace(circleParams['radius'] - dL - dLErr,
-                        circleParams['radius'] + dL + dLErr,
-                        2 * (dL + dLErr) + 1)
-    for r in radii:
-        # for the number of angles to generate, use twice the length of the
-        # arc in pixels to ensure every pixel in the region is covered
-        angles = np.linspace(startAngle, startAngle + spanAngle,
-                             int(2 * r * spanAngle * (np.pi / 180)))
-        # compute cos and sin for each angle
-        cosAngles = np.cos(angles * (np.pi / 180))
-        sinAngles = np.sin(angles * (np.pi / 180))
-        for angleIndex in range(len(angles)):
-            # get the x and y coordinates of the point
-            x = circleParams['centerX'] + r * cosAngles[angleIndex]
-            # note: y values increase going down
-            y = circleParams['centerY'] - r * sinAngles[angleIndex]
-            # add the point to the appropriate set
-            if r < (circleParams['radius'] - dL) or r > (circleParams['radius'] + dL):
-                errPointSet.add((int(x), int(y)))
-            else:
-                pointSet.add((int(x), int(y)))
-
-    # sum up the black colour components of pixels located at the points in
-    # pointSet
-    blackness = 0
-    for point in pointSet:
-        pixel = image.pixel(point[0], point[1])
-        blackness += QtGui.QColor(pixel).blackF()
-
-    # sum up the black colour components of pixels located at the points in
-    # errPointSet
-    errBlackness = 0
-    for point in errPointSet:
-        pixel = image.pixel(point[0], point[1])
-        errBlackness += QtGui.QColor(pixel).blackF()
+    # generate the radii of the points covering the combined area of the polar
+    # rectangle surrounding an arc of the circle defined by circleParams from
+    # startAngle to startAngle + spanAngle and with radial thickness 2*dL+1
+    # and the two polar rectangles of thickness dLErr that lie radially just
+    # above and just below it. Generate the offsets of the radii from the
+    # radius of the circle first, so that whether a radius lies in the polar
+    # rectangle is decided without round-off error
+    offsets = np.linspace(-dL - dLErr, dL + dLErr, int(2 * (dL + dLErr) + 1))
+    radii = circleParams['radius'] + offsets
+
+    # points are truncated to the pixels containing them, so the points that
+    # lie in a pixel of the image are those with -1 < x < width and
+    # -1 < y < height. Find the range of angles in which the circles through
+    # the points can cross this region, so that points outside of it (e.g.
+    # on the far side of a very large circle) are never generated
+    visibleAngles = _visibleAngles(circleParams, radii[0], radii[-1],
+                                   (-1, plane.shape[0], -1, plane.shape[1]))
+    if visibleAngles is None:
+        return 0.0, 0.0
+
+    def radiusPixels(r):
+        """Return the pixels containing the points with radius r."""
+
+        return _radiusPixels(plane, circleParams, r, startAngle, spanAngle,
+                             visibleAngles)
+
+    # sort the pixels of each radius into lists of arrays of the pixels
+    # containing the points in the polar rectangle and of the pixels
+    # containing the points in the error polar rectangles
+    pixels, errPixels = [], []
+    for offset, rPixels in zip(offsets, _parallelMap(radiusPixels,
+                                                     list(radii), workers)):
+        if abs(offset) > dL:
+            errPixels.append(rPixels)
+        else:
+            pixels.append(rPixels)
+
+    # sum up the blackness of the distinct pixels containing points of the
+    # polar rectangle and of the error polar rectangles. Only the pixels
+    # themselves are stored, so the cost doesn't depend on the size of their
+    # bounding box. Accumulate in double precision since the plane may be
+    # stored in single precision
+    width = plane.shape[1]
+    pixels = np.unique(np.concatenate(pixels or [np.zeros(0, np.int64)]))
+    errPixels = np.unique(np.concatenate(errPixels or
+                                         [np.zeros(0, np.int64)]))
+    blackness = float(plane[pixels // width, pixels % width].sum(
+        dtype=np.float64))
+    errBlackness = float(plane[errPixels // width, errPixels % width].sum(
+        dtype=np.float64))
 
     return blackness, errBlackness
+
+def _radiusPixels(plane, circleParams, r, startAngle, spanAngle,
+                  visibleAngles):
+    """Given a blackness plane, a circle defined by circleParams, a radius r
+    and an arc from startAngle to startAngle + spanAngle (both in degrees),
+    return the distinct linear indices (y*width + x) of the pixels
+    containing the sample points of calcBlackness with radius r (about the
+    center of the circle) that lie within the range visibleAngles (see
+    _visibleAngles).
+    """
+
+    # for the number of angles to generate, use twice the length of the
+    # arc in pixels to ensure every pixel in the region is covered. Only
+    # the angles that can lie in the image are generated
+    angles = _arcSamples(startAngle, spanAngle,
+                         int(2 * r * spanAngle * (np.pi / 180)),
+                         visibleAngles)
+    # get the x and y coordinates of the points, truncating them to the
+    # coordinates of the pixels containing them
+    x = (circleParams['centerX'] +
+         r * np.cos(angles * (np.pi / 180))).astype(int)
+    # note: y values increase going down
+    y = (circleParams['centerY'] -
+         r * np.sin(angles * (np.pi / 180))).astype(int)
+    # points that lie outside of the image contain no pixels and are
+    # ignored
+    inImage = (x >= 0) & (x < plane.shape[1]) & \
+              (y >= 0) & (y < plane.shape[0])
+    return np.unique(y[inImage] * plane.shape[1] + x[inImage])
+
+def calcBlacknesses(plane, circleParams, dL, startAngle, spanAngle):
+    """Given a blackness plane, the parameters of many circles (a dict as
+    for calcBlackness whose values are arrays) and arrays of the dL and of
+    the start and span angles (in degrees) of an arc of each circle, return
+    arrays of the blackness of the polar rectangle around each arc and of
+    its error, as calcBlackness returns them for one arc. The sample points
+    of all the arcs are generated and summed together with array operations,
+    in chunks of about SAMPLECHUNK points. Arcs so long that most of their
+    sample points would lie off the plane are measured one at a time with
+    calcBlackness, which only generates the points on the plane.
+    """
+
+    # assume 1 px error on the dL, as in calcBlackness
+    dLErr = 1
+
+    centerX, centerY, radius, dL, startAngle, spanAngle = \
+        np.broadcast_arrays(*[np.asarray(value, dtype=np.float64) for value
+                              in (circleParams['centerX'],
+                                  circleParams['centerY'],
+                                  circleParams['radius'], dL, startAngle,
+                                  spanAngle)])
+    arcCount = len(radius)
+    height, width = plane.shape
+    flatPlane = np.ravel(plane)
+
+    # the offsets from the radius of its circle of each radius of the sample
+    # points of every arc, computed as np.linspace computes them in
+    # calcBlackness
+    offsetCounts = (2 * (dL + dLErr) + 1).astype(np.int64)
+    radiusArcs = np.repeat(np.arange(arcCount), offsetCounts)
+    offsetIndices = np.arange(offsetCounts.sum()) - np.repeat(
+        np.cumsum(offsetCounts) - offsetCounts, offsetCounts)
+    firstOffsets, lastOffsets = -dL - dLErr, dL + dLErr
+    offsets = offsetIndices * ((lastOffsets - firstOffsets) /
+                               (offsetCounts - 1))[radiusArcs] + \
+              firstOffsets[radiusArcs]
+    isLast = offsetIndices == offsetCounts[radiusArcs] - 1
+    offsets[isLast] = lastOffsets[radiusArcs[isLast]]
+    radii = radius[radiusArcs] + offsets
+    isErr = np.abs(offsets) > dL[radiusArcs]
+
+    # the number of sample points of each radius, as in _radiusPixels, and
+    # the step between their angles, as in _arcSamples
+    pointCounts = np.maximum(
+        (2 * radii * spanAngle[radiusArcs] * (np.pi / 180)).astype(np.int64),
+        0)
+    stopAngles = startAngle + spanAngle
+    with np.errstate(divide='ignore', invalid='ignore'):
+        steps = np.where(pointCounts > 1,
+                         (stopAngles - startAngle)[radiusArcs] /
+                         (pointCounts - 1), 0)
+
+    # an arc within the plane is shorter than twice its perimeter and has 2
+    # points per px of its length
+    arcPoints = np.bincount(radiusArcs, weights=pointCounts,
+                            minlength=arcCount)
+    isLong = np.bincount(radiusArcs, weights=pointCounts > 8 * (height +
+                                                                width),
+                         minlength=arcCount) > 0
+
+    blackness = np.zeros(arcCount)
+    errBlackness = np.zeros(arcCount)
+    for arc in np.flatnonzero(isLong):
+        blackness[arc], errBlackness[arc] = calcBlackness(
+            plane, {'centerX': centerX[arc], 'centerY': centerY[arc],
+                    'radius': radius[arc]},
+            dL[arc], startAngle[arc], spanAngle[arc])
+
+    # split the other arcs into chunks of about SAMPLECHUNK points
+    arcs = np.flatnonzero(~isLong)
+    chunkIds = np.cumsum(arcPoints[arcs]) // SAMPLECHUNK
+    for chunkArcs in np.split(arcs, np.flatnonzero(np.diff(chunkIds)) + 1):
+        if not len(chunkArcs):
+            continue
+
+        # the radii of the chunk's arcs and the angles of their points
+        isChunkRadius = np.isin(radiusArcs, chunkArcs)
+        chunkCounts = pointCounts[isChunkRadius]
+        pointRadii = np.repeat(np.flatnonzero(isChunkRadius), chunkCounts)
+        pointIndices = np.arange(chunkCounts.sum()) - np.repeat(
+            np.cumsum(chunkCounts) - chunkCounts, chunkCounts)
+        pointArcs = radiusArcs[pointRadii]
+        angles = pointIndices * steps[pointRadii] + startAngle[pointArcs]
+        isLast = (pointIndices == pointCounts[pointRadii] - 1) & \
+                 (pointCounts[pointRadii] > 1)
+        angles[isLast] = stopAngles[pointArcs[isLast]]
+
+        # the pixels containing the points that lie on the plane, as in
+        # _radiusPixels
+        x = (centerX[pointArcs] +
+             radii[pointRadii] * np.cos(angles * (np.pi / 180))).astype(int)
+        # note: y values increase going down
+        y = (centerY[pointArcs] -
+             radii[pointRadii] * np.sin(angles * (np.pi / 180))).astype(int)
+        inImage = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+
+        # sum up the distinct pixels of the polar rectangle and of the error
+        # polar rectangles of every arc. Each (arc, rectangle) pair has a
+        # slot, and the pixels are told apart by their slot and linear index.
+        # Sorting the keys finds the distinct ones much faster than
+        # np.unique's hashing does for this many keys
+        slots = 2 * pointArcs[inImage] + isErr[pointRadii[inImage]]
+        keys = np.sort(slots * (height * width) +
+                       y[inImage] * width + x[inImage])
+        keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+        sums = np.bincount(keys // (height * width),
+                           weights=flatPlane[keys % (height * width)],
+                           minlength=2 * arcCount).reshape(arcCount, 2)
+        blackness[chunkArcs] = sums[chunkArcs, 0]
+        errBlackness[chunkArcs] = sums[chunkArcs, 1]
+
+    return blackness, errBlackness
+
+def _visibleAngles(circleParams, innerRadius, outerRadius, box):
+    """Given a circle defined by circleParams, the inner and outer radii of an
+    annulus around its center and box, a (top, bottom, left, right) tuple of
+    the coordinates of the edges of a rectangle, return the (low, high) range
+    of angles (in degrees, with low <= high) in which the annulus can
+    intersect the rectangle, (-inf, inf) if it can intersect it at any angle
+    (i.e. the center lies in the rectangle) or None if it can't intersect it
+    at all.
+    """
+
+    top, bottom, left, right = box
+    centerX, centerY = circleParams['centerX'], circleParams['centerY']
+
+    # the annulus misses the rectangle if the rectangle lies inside its inner
+    # circle or entirely outside of its outer circle
+    cornerX = np.array([left, right, left, right]) - centerX
+    cornerY = np.array([top, top, bottom, bottom]) - centerY
+    nearestX = np.clip(centerX, left, right) - centerX
+    nearestY = np.clip(centerY, top, bottom) - centerY
+    if np.hypot(nearestX, nearestY) > outerRadius or \
+            np.hypot(cornerX, cornerY).max() < innerRadius:
+        return None
+
+    # if the center lies in the rectangle, the annulus can cross it anywhere
+    if left <= centerX <= right and top <= centerY <= bottom:
+        return -np.inf, np.inf
+
+    # otherwise the rectangle is seen from the center within an angle of
+    # less than 180 degrees, whose edges pass through its corners. Measure
+    # the angles of the corners relative to the first one to avoid wrapping
+    # around at 360 degrees
+    # note: y values increase going down
+    cornerAngles = np.degrees(np.arctan2(-cornerY, cornerX))
+    relativeAngles = np.mod(cornerAngles - cornerAngles[0] + 180, 360) - 180
+
+    return (cornerAngles[0] + relativeAngles.min(),
+            cornerAngles[0] + relativeAngles.max())
+
+def _arcSamples(startAngle, spanAngle, count, visibleAngles):
+    """Given an arc from startAngle to startAngle + spanAngle (both in
+    degrees), return those of the count angles given by
+    np.linspace(startAngle, startAngle + spanAngle, count) that lie within
+    the range visibleAngles (see _visibleAngles), without generating the
+    others. The angles returned are identical to those of np.linspace.
+    """
+
+    stopAngle = startAngle + spanAngle
+    if count <= 1 or visibleAngles == (-np.inf, np.inf):
+        return np.linspace(startAngle, stopAngle, max(count, 0))
+
+    # np.linspace computes the angle with index k as k*step + startAngle,
+    # except for the last one which is exactly stopAngle
+    step = (stopAngle - startAngle) / (count - 1)
+    if step == 0:
+        return np.linspace(startAngle, stopAngle, count)
+
+    # find the indices of the angles in each copy of the visible range
+    # (shifted by multiples of 360 degrees) that overlaps the arc. Widen the
+    # index ranges by one to allow for rounding; the points are checked
+    # against the image afterwards anyway
+    lowAngle, highAngle = visibleAngles
+    indices = []
+    for shift in range(int(np.floor((startAngle - highAngle) / 360)),
+                       int(np.ceil((stopAngle - lowAngle) / 360)) + 1):
+        first = max(int(np.floor((lowAngle + 360 * shift - startAngle) /
+                                 step)) - 1, 0)
+        last = min(int(np.ceil((highAngle + 360 * shift - startAngle) /
+                               step)) + 1, count - 1)
+        if first <= last:
+            indices.append(np.arange(first, last + 1))
+    if not indices:
+        return np.zeros(0)
+    indices = np.unique(np.concatenate(indices))
+
+    angles = indices * step + startAngle
+    angles[indices == count - 1] = stopAngle
+
+    return angles
+
+def _sectorBox(circleParams, innerRadius, outerRadius, startAngle, spanAngle,
+               shape):
+    """Given a circle defined by circleParams, the inner and outer radii of an
+    annular sector around it from startAngle to startAngle + spanAngle (both
+    in degrees) and the shape of an image, return the bounding box of the
+    sector as the (top, bottom, left, right) pixel indices (inclusive),
+    clipped to the image, or None if the sector lies outside the image.
+    """
+
+    # the extreme coordinates of the sector are at the ends of its inner and
+    # outer arcs, at the center (if its inner radius is 0), or where the
+    # outer arc crosses one of the axes through the center. The box only
+    # depends on the size of the sector, not on how far away the center is
+    innerRadius = max(innerRadius, 0)
+    endAngles = np.radians([startAngle, startAngle + spanAngle])
+    axisAngles = np.radians([axisAngle for axisAngle in range(-360, 721, 90)
+                             if startAngle <= axisAngle <=
+                             startAngle + spanAngle])
+    xExtremes = np.concatenate((
+        circleParams['centerX'] + innerRadius * np.cos(endAngles),
+        circleParams['centerX'] + outerRadius * np.cos(endAngles),
+        circleParams['centerX'] + outerRadius * np.cos(axisAngles)))
+    # note: y values increase going down
+    yExtremes = np.concatenate((
+        circleParams['centerY'] - innerRadius * np.sin(endAngles),
+        circleParams['centerY'] - outerRadius * np.sin(endAngles),
+        circleParams['centerY'] - outerRadius * np.sin(axisAngles)))
+
+    # pad by a pixel so that every pixel the sector touches is included
+    top = max(int(np.floor(yExtremes.min())) - 1, 0)
+    bottom = min(int(np.floor(yExtremes.max())) + 1, shape[0] - 1)
+    left = max(int(np.floor(xExtremes.min())) - 1, 0)
+    right = min(int(np.floor(xExtremes.max())) + 1, shape[1] - 1)
+    if top > bottom or left > right:
+        return None
+
+    return top, bottom, left, right
+
+def _annulusPixels(circleParams, innerRadius, outerRadius, box):
+    """Given a circle defined by circleParams, the inner and outer radii of an
+    annulus around its center and box, a (top, bottom, left, right) tuple of
+    inclusive pixel indices, return arrays of the y and x indices of the
+    pixels in box whose centers lie in the annulus. The pixels are found row
+    by row from the intervals where each row crosses the annulus, so the cost
+    is proportional to the number of pixels returned rather than to the area
+    of box.
+    """
+
+    top, bottom, left, right = box
+    centerX = circleParams['centerX']
+    innerRadius = max(innerRadius, 0)
+
+    # the vertical distance from the circle center to each row of pixel
+    # centers. Pixel (i, j) covers [i, i+1) x [j, j+1), so its center is at
+    # (i + 0.5, j + 0.5)
+    rows = np.arange(top, bottom + 1)
+    dy = rows + 0.5 - circleParams['centerY']
+
+    # a pixel center at horizontal distance dx from the circle center lies in
+    # the annulus if innerChord <= |dx| <= outerChord
+    outerChord = np.sqrt(np.maximum(outerRadius**2 - dy**2, 0))
+    innerChord = np.sqrt(np.maximum(innerRadius**2 - dy**2, 0))
+    crossesRow = np.abs(dy) <= outerRadius
+
+    # each row crosses the annulus in a left and a right interval, which
+    # merge into one interval if the row doesn't cross the inner circle
+    hasHole = innerChord > 0
+    rightStart = np.where(hasHole, np.ceil(centerX + innerChord - 0.5),
+                          np.ceil(centerX - outerChord - 0.5))
+    rightEnd = np.floor(centerX + outerChord - 0.5)
+    leftStart = np.ceil(centerX - outerChord - 0.5)
+    leftEnd = np.where(hasHole, np.floor(centerX - innerChord - 0.5),
+                       leftStart - 1)
+
+    # clip the intervals to the box and drop empty ones
+    starts = np.clip(np.concatenate((leftStart, rightStart)), left, right + 1)
+    ends = np.clip(np.concatenate((leftEnd, rightEnd)), left - 1, right)
+    lengths = np.where(np.concatenate((crossesRow, crossesRow)),
+                       ends - starts + 1, 0).astype(np.int64)
+    lengths = np.maximum(lengths, 0)
+    intervalRows = np.concatenate((rows, rows))
+
+    # expand the intervals into pixel indices
+    total = lengths.sum()
+    offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths,
+                                           lengths)
+    xPixels = np.repeat(starts.astype(np.int64), lengths) + offsets
+    yPixels = np.repeat(intervalRows, lengths)
+
+    return yPixels, xPixels
+
+def _parallelMap(function, items, workers):
+    """Given a function, a list of items and a number of worker threads,
+    return the list of the results of calling function on each item, in
+    order. If workers is more than 1 the items are processed by a thread
+    pool. NumPy releases the GIL in its array operations, so the threads run
+    on multiple cores.
+    """
+
+    if workers <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+
+    with concurrent.futures.ThreadPoolExecutor(
+            min(workers, len(items))) as executor:
+        return list(executor.map(function, items))
+
+def _stripSums(function, box, workers):
+    """Given function, which returns a tuple of arrays of sums over the
+    pixels in a (top, bottom, left, right) box of pixel indices (inclusive),
+    a box and a number of worker threads, return the tuple of the sums over
+    all the pixels in box. box is split into strips of STRIPHEIGHT rows that
+    are summed separately by a pool of workers threads (see _parallelMap)
+    and then added up in order, so the sums are the same for any number of
+    workers.
+    """
+
+    top, bottom, left, right = box
+    strips = [(stripTop, min(stripTop + STRIPHEIGHT - 1, bottom), left, right)
+              for stripTop in range(top, bottom + 1, STRIPHEIGHT)]
+
+    stripResults = _parallelMap(function, strips, workers)
+    sums = stripResults[0]
+    for stripResult in stripResults[1:]:
+        sums = tuple(total + part for total, part in zip(sums, stripResult))
+
+    return sums
+
+def _sectorPixels(plane, circleParams, maxDistance, startAngle, spanAngle,
+                  box):
+    """Given a blackness plane, a circle defined by circleParams, a radial
+    distance maxDistance, an arc of the circle from startAngle to
+    startAngle + spanAngle (both in degrees) and box, a (top, bottom, left,
+    right) tuple of inclusive pixel indices, return the blackness of each
+    pixel in box whose center lies within maxDistance of the circle and
+    within the angular range of the arc, along with the signed radial
+    distance of its center from the circle (positive outside) and its angle
+    relative to startAngle (in degrees).
+    """
+
+    yPixels, xPixels = _annulusPixels(
+        circleParams, circleParams['radius'] - maxDistance,
+        circleParams['radius'] + maxDistance, box)
+
+    # the radial distance and the angular coordinate of each pixel center
+    dx = xPixels + 0.5 - circleParams['centerX']
+    # note: y values increase going down
+    dy = circleParams['centerY'] - (yPixels + 0.5)
+    distances = np.hypot(dx, dy) - circleParams['radius']
+    angles = np.mod(np.degrees(np.arctan2(dy, dx)) - startAngle, 360)
+
+    # keep only the pixels within the angular range of the arc
+    inArc = angles <= spanAngle
+    yPixels, xPixels = yPixels[inArc], xPixels[inArc]
+
+    return plane[yPixels, xPixels], distances[inArc], angles[inArc]
+
+def blacknessScan(plane, circleParams, maxDL, startAngle, spanAngle,
+                  workers=1):
+    """Given plane, a blackness plane (see calcBlackness), a circle defined
+    by circleParams, an arc of the circle from startAngle to
+    startAngle + spanAngle (both in degrees) and maxDL, the largest dL to
+    consider, return arrays of the total blackness of the pixels in the polar
+    rectangle around the arc and of its error, for every integer dL from 0 to
+    maxDL. The pixels are those containing the sample points of
+    calcBlackness, so the sums are the ones calcBlackness returns for each
+    dL, but the sample points are generated only once for all the dLs, by a
+    pool of workers threads (see _parallelMap).
+    """
+
+    # assume 1 px error on the dL, as in calcBlackness
+    dLErr = 1
+
+    # for an integer dL, the sample points of calcBlackness lie on the
+    # circles whose radii differ from the radius of the fitted circle by a
+    # whole number of px, up to dL + dLErr. The points of each of these
+    # circles are the same for every dL, so generate them once
+    offsets = np.arange(-maxDL - dLErr, maxDL + dLErr + 1)
+    radii = circleParams['radius'] + offsets
+    visibleAngles = _visibleAngles(circleParams, radii[0], radii[-1],
+                                   (-1, plane.shape[0], -1, plane.shape[1]))
+    if visibleAngles is None:
+        return np.zeros(maxDL + 1), np.zeros(maxDL + 1)
+
+    def radiusPixels(r):
+        """Return the pixels containing the points with radius r."""
+
+        return _radiusPixels(plane, circleParams, r, startAngle, spanAngle,
+                             visibleAngles)
+
+    offsetPixels = _parallelMap(radiusPixels, list(radii), workers)
+
+    def pixelBlackness(pixels):
+        """Return the blackness of each of the pixels with the given linear
+        indices, in double precision since the plane may be stored in single
+        precision.
+        """
+
+        return plane[pixels // plane.shape[1],
+                     pixels % plane.shape[1]].astype(np.float64)
+
+    # a pixel is in the polar rectangle for every dL from the smallest
+    # unsigned offset of the circles with points in it. Find that offset for
+    # every distinct pixel by sorting the pixels by offset within each pixel
+    # and keeping the first of each
+    pixels = np.concatenate(offsetPixels)
+    pixelOffsets = np.repeat(np.abs(offsets),
+                             [len(rPixels) for rPixels in offsetPixels])
+    order = np.lexsort((pixelOffsets, pixels))
+    pixels, pixelOffsets = pixels[order], pixelOffsets[order]
+    isFirst = np.ones(len(pixels), dtype=bool)
+    isFirst[1:] = pixels[1:] != pixels[:-1]
+    pixels, pixelOffsets = pixels[isFirst], pixelOffsets[isFirst]
+
+    # the blackness of the polar rectangle for a dL is the sum over the
+    # pixels whose smallest offset is at most dL
+    blackness = np.cumsum(np.bincount(
+        pixelOffsets, weights=pixelBlackness(pixels),
+        minlength=maxDL + dLErr + 1))[:maxDL + 1]
+
+    # the error polar rectangles for a dL are sampled on the circles with
+    # offsets -(dL + dLErr) and dL + dLErr. As in calcBlackness, their pixels
+    # are summed even if they also contain points of the polar rectangle
+    blacknessErr = np.array([
+        pixelBlackness(np.unique(np.concatenate((
+            offsetPixels[maxDL - dL],
+            offsetPixels[maxDL + 2 * dLErr + dL])))).sum()
+        for dL in range(maxDL + 1)])
+
+    return blackness, blacknessErr
+
+def blacknessCoverageScan(plane, circleParams, maxDL, startAngle, spanAngle,
+                          supersampling=4, workers=1):
+    """As blacknessScan, but with every pixel weighted by the fraction of its
+    area covered by the polar rectangles as in blacknessCoverage, so the sums
+    are the ones blacknessCoverage returns for each dL. All the dLs are
+    found in one pass over the pixels near the arc.
+    """
+
+    # assume 1 px error on the dL, as in calcBlackness
+    dLErr = 1
+
+    # sum up the blackness in the bands of thickness 1 px at every unsigned
+    # distance from the arc. The blackness within a distance of dL + 0.5 is
+    # the cumulative sum up to band dL
+    area, bandBlackness, squaredBlackness = _bandSums(
+        plane, circleParams, np.arange(maxDL + dLErr + 1) + 0.5, startAngle,
+        spanAngle, supersampling, workers)
+    cumulativeBlackness = np.cumsum(bandBlackness)
+
+    blackness = cumulativeBlackness[:maxDL + 1]
+    blacknessErr = cumulativeBlackness[dLErr:] - blackness
+
+    return blackness, blacknessErr
+
+def blacknessProfile(plane, circleParams, dL, startAngle, spanAngle,
+                     binLength, workers=1):
+    """Given plane, a blackness plane (see calcBlackness), a circle defined
+    by circleParams, an arc of the circle from startAngle to
+    startAngle + spanAngle (both in degrees), dL and binLength, return the
+    edges of the bins that divide the arc into segments of length binLength
+    (in px of arc length from the start of the arc; the last segment may be
+    shorter) along with arrays of the total blackness of the polar rectangle
+    around the arc within each bin and of its error, all in one pass over
+    the pixels near the arc. A pixel is in the polar rectangle (of radial
+    thickness 2*dL+1) or in the error polar rectangles (of thickness 1 on
+    either side of it) if its center is. The pixels are summed by a pool of
+    workers threads (see _stripSums).
+    """
+
+    # assume 1 px error on the dL, as in calcBlackness
+    dLErr = 1
+
+    # the edges of the arc length bins
+    arcLength = circleParams['radius'] * np.radians(spanAngle)
+    binCount = max(int(np.ceil(arcLength / binLength)), 1)
+    binEdges = np.minimum(np.arange(binCount + 1) * binLength, arcLength)
+
+    maxDistance = dL + dLErr + 0.5
+
+    def stripProfile(stripBox):
+        """Return the blackness in each bin of the pixels in stripBox that
+        are in the polar rectangle and of those in the error polar
+        rectangles.
+        """
+
+        # get the pixels near the arc along with their radial distances from
+        # it and their angles from the start of the arc
+        pixelBlackness, distances, angles = _sectorPixels(
+            plane, circleParams, maxDistance, startAngle, spanAngle, stripBox)
+
+        # put each pixel in the bin of its arc length along the arc
+        pixelBins = np.minimum(
+            (circleParams['radius'] * np.radians(angles) // binLength).astype(
+                np.int64), binCount - 1)
+
+        # sum up the blackness in each bin of the pixels in the polar
+        # rectangle and of the pixels in the error polar rectangles.
+        # Accumulate in double precision since the plane may be stored in
+        # single precision
+        pixelBlackness = pixelBlackness.astype(np.float64)
+        inBand = np.abs(distances) <= dL + 0.5
+        return (np.bincount(pixelBins[inBand], weights=pixelBlackness[inBand],
+                            minlength=binCount),
+                np.bincount(pixelBins[~inBand],
+                            weights=pixelBlackness[~inBand],
+                            minlength=binCount))
+
+    box = _sectorBox(circleParams, circleParams['radius'] - maxDistance,
+                     circleParams['radius'] + maxDistance, startAngle,
+                     spanAngle, plane.shape)
+    if box is None:
+        blackness, blacknessErr = np.zeros(binCount), np.zeros(binCount)
+    else:
+        blackness, blacknessErr = _stripSums(stripProfile, box, workers)
+
+    return binEdges, blackness, blacknessErr
+
+def _bandCoverage(yPixels, xPixels, circleParams, bandEdges, startAngle,
+                  spanAngle, supersampling):
+    """Given arrays of the y and x indices of pixels, a circle defined by
+    circleParams, an increasing array bandEdges of radial distances from the
+    circle and an arc of the circle from startAngle to startAngle + spanAngle
+    (both in degrees), return an array with a row for each pixel containing
+    the fraction of its area covered by each of the polar rectangles around
+    the arc between the edges (see _bandSums), estimated on a grid of
+    supersampling x supersampling points inside it. Only the pixels cut by
+    an edge or by an end of the arc are sampled on the grid; every point of
+    the grid of any other pixel lies in the same polar rectangle (or outside
+    of them all) as the pixel's center.
+    """
+
+    bandCount = len(bandEdges)
+
+    # the radial distance from the circle and the angle from the start of
+    # the arc of every pixel center
+    dx = xPixels + 0.5 - circleParams['centerX']
+    # note: y values increase going down
+    dy = circleParams['centerY'] - (yPixels + 0.5)
+    centerDistances = np.sqrt(dx * dx + dy * dy)
+    distances = np.abs(centerDistances - circleParams['radius'])
+    angles = np.mod(np.degrees(np.arctan2(dy, dx)) - startAngle, 360)
+
+    # the band of every pixel center, with band k holding the centers at
+    # distances between bandEdges[k-1] (exclusive) and bandEdges[k]
+    # (inclusive). Centers beyond the last edge or outside of the arc are
+    # put in an extra band that is dropped
+    bands = np.searchsorted(bandEdges, distances)
+    bands[angles > spanAngle] = bandCount
+    coverage = np.zeros((len(yPixels), bandCount + 1))
+    coverage[np.arange(len(yPixels)), bands] = 1
+
+    # the grid points of a pixel lie within maxOffset of its center, so a
+    # pixel is cut by an edge if its center lies within maxOffset of it, and
+    # by an end of the arc if its center lies within the angle maxOffset
+    # subtends of it. Allow for round-off error. With a supersampling of 1
+    # the only grid point is the center
+    if supersampling == 1:
+        return coverage[:, :bandCount]
+    maxOffset = np.sqrt(2) * (0.5 - 0.5 / supersampling) + 1e-6
+    with np.errstate(divide='ignore'):
+        maxAngles = np.degrees(maxOffset / np.maximum(
+            centerDistances - maxOffset, 0)) + 1e-9
+    isNearEnd = (angles <= maxAngles) | (angles >= 360 - maxAngles) | \
+                (np.abs(angles - spanAngle) <= maxAngles)
+    isCut = isNearEnd | (np.abs(distances[:, np.newaxis] - bandEdges) <=
+                         maxOffset).any(axis=1)
+
+    # the offsets of the grid points from the center of their pixel, at the
+    # centers of a supersampling x supersampling grid of sub-pixels
+    offsets = (np.arange(supersampling) + 0.5) / supersampling - 0.5
+    xOffsets, yOffsets = np.meshgrid(offsets, offsets)
+    xOffsets, yOffsets = xOffsets.ravel(), yOffsets.ravel()
+
+    # the radial distance from the circle of every grid point of the cut
+    # pixels (one row per pixel). np.hypot is several times slower than this
+    # and the distances only differ in their last bit
+    cut = np.flatnonzero(isCut)
+    dx = dx[cut, np.newaxis] + xOffsets
+    # note: y values increase going down
+    dy = dy[cut, np.newaxis] - yOffsets
+    distances = np.abs(np.sqrt(dx * dx + dy * dy) - circleParams['radius'])
+
+    # the grid points are inside of the arc if their pixel's center is,
+    # except in the pixels near its ends, where the angle from the start of
+    # the arc of every grid point is needed
+    inArc = np.repeat((angles[cut] <= spanAngle)[:, np.newaxis],
+                      len(xOffsets), axis=1)
+    nearEnd = np.flatnonzero(isNearEnd[cut])
+    inArc[nearEnd] = np.mod(np.degrees(np.arctan2(dy[nearEnd], dx[nearEnd]))
+                            - startAngle, 360) <= spanAngle
+
+    # the band of every grid point, as for the pixel centers
+    bands = np.searchsorted(bandEdges, distances)
+    bands[~inArc] = bandCount
+
+    # the fraction of each cut pixel covered by each band
+    pixelIndices = np.repeat(np.arange(len(cut)), len(xOffsets))
+    coverage[cut] = np.bincount(
+        pixelIndices * (bandCount + 1) + bands.ravel(),
+        minlength=len(cut) * (bandCount + 1)).reshape(
+            len(cut), bandCount + 1) / len(xOffsets)
+
+    return coverage[:, :bandCount]
+
+def _bandSums(plane, circleParams, bandEdges, startAngle, spanAngle,
+              supersampling, workers=1):
+    """Given a blackness plane, a circle defined by circleParams, an
+    increasing array bandEdges of radial distances from the circle and an arc
+    of the circle from startAngle to startAngle + spanAngle (both in
+    degrees), return arrays of the area (in px), the blackness and the
+    squared blackness, each summed over the pixels of the polar rectangles
+    around the arc at unsigned distances between 0 and bandEdges[0],
+    bandEdges[0] and bandEdges[1], and so on. Every pixel is weighted by the
+    fraction of its area covered by a polar rectangle, estimated on a grid
+    of supersampling x supersampling points inside it. All the polar
+    rectangles are summed in one pass over the pixels near the arc, by a
+    pool of workers threads (see _stripSums).
+    """
+
+    bandEdges = np.asarray(bandEdges, dtype=np.float64)
+    bandCount = len(bandEdges)
+    zeros = np.zeros(bandCount)
+
+    # any pixel overlapping the polar rectangles has its center within half
+    # a pixel diagonal of them
+    margin = np.sqrt(0.5)
+    maxDistance = bandEdges[-1]
+    box = _sectorBox(circleParams,
+                     circleParams['radius'] - maxDistance - margin,
+                     circleParams['radius'] + maxDistance + margin,
+                     startAngle, spanAngle, plane.shape)
+    if box is None:
+        return zeros, zeros, zeros
+
+    def stripBandSums(stripBox):
+        """Return the area, blackness and squared blackness in each band of
+        the pixels in stripBox.
+        """
+
+        yPixels, xPixels = _annulusPixels(
+            circleParams, circleParams['radius'] - maxDistance - margin,
+            circleParams['radius'] + maxDistance + margin, stripBox)
+
+        # the fraction of each pixel covered by each band
+        coverage = _bandCoverage(yPixels, xPixels, circleParams, bandEdges,
+                                 startAngle, spanAngle, supersampling)
+
+        # sum up the coverage weighted blackness. Accumulate in double
+        # precision since the plane may be stored in single precision
+        pixelBlackness = plane[yPixels, xPixels].astype(np.float64)
+        return (coverage.sum(axis=0), np.dot(pixelBlackness, coverage),
+                np.dot(pixelBlackness**2, coverage))
+
+    area, blackness, squaredBlackness = _stripSums(stripBandSums, box,
+                                                   workers)
+
+    return area, blackness, squaredBlackness
+
+def blacknessCoverage(plane, circleParams, dL, startAngle, spanAngle,
+                      supersampling=4, workers=1):
+    """Given plane, a blackness plane (see calcBlackness), a circle defined
+    by circleParams, an arc of the circle from startAngle to
+    startAngle + spanAngle (both in degrees) and dL, return the blackness of
+    the polar rectangle of radial thickness 2*dL+1 around the arc and its
+    error (the blackness of the two polar rectangles of thickness 1 just
+    above and below it), as in calcBlackness. Here every pixel contributes
+    its blackness weighted by the fraction of its area covered by the polar
+    rectangles, estimated on a grid of supersampling x supersampling points
+    inside it, so pixels cut by the edges of the polar rectangles count only
+    in part. The pixels are summed by a pool of workers threads (see
+    _stripSums).
+    """
+
+    # assume 1 px error on the dL, as in calcBlackness
+    dLErr = 1
+
+    area, blackness, squaredBlackness = _bandSums(
+        plane, circleParams, [dL + 0.5, dL + dLErr + 0.5], startAngle,
+        spanAngle, supersampling, workers)
+
+    return float(blackness[0]), float(blackness[1])
+
+def blacknessBackground(plane, circleParams, dL, startAngle, spanAngle,
+                        backgroundWidth, supersampling=4, workers=1):
+    """Given plane, a blackness plane (see calcBlackness), a circle defined
+    by circleParams, an arc of the circle from startAngle to
+    startAngle + spanAngle (both in degrees), dL and backgroundWidth, return
+    the background subtracted blackness of the polar rectangle of radial
+    thickness 2*dL+1 around the arc along with its error, and the background
+    blackness per px along with its error. The background is the mean
+    blackness of the two polar rectangles of thickness backgroundWidth just
+    outside of the error polar rectangles (see calcBlackness), one on either
+    side of the track, so a background that changes linearly across the
+    track cancels out. The error combines the background subtracted
+    blackness of the error polar rectangles with the statistical error on
+    the background. Pixels are weighted by their area covered by the polar
+    rectangles as in blacknessCoverage; with a supersampling of 1 a pixel is
+    in a polar rectangle if its center is, as in blacknessProfile. The pixels
+    are summed by a pool of workers threads (see _stripSums).
+    """
+
+    # assume 1 px error on the dL, as in calcBlackness
+    dLErr = 1
+
+    # sum up the polar rectangle, the error polar rectangles and the
+    # background polar rectangles in one pass
+    area, blackness, squaredBlackness = _bandSums(
+        plane, circleParams,
+        [dL + 0.5, dL + dLErr + 0.5, dL + dLErr + 0.5 + backgroundWidth],
+        startAngle, spanAngle, supersampling, workers)
+
+    # the mean background per px and its standard error. The background is
+    # undefined (nan) if the background polar rectangles are off the image
+    with np.errstate(divide='ignore', invalid='ignore'):
+        background = blackness[2] / area[2]
+        backgroundVariance = max(squaredBlackness[2] / area[2] -
+                                 background**2, 0)
+        backgroundErr = np.sqrt(backgroundVariance / area[2])
+
+    # subtract the background from the polar rectangle and from the error
+    # polar rectangles
+    subtractedBlackness = blackness[0] - area[0] * background
+    subtractedBlacknessErr = np.hypot(blackness[1] - area[1] * background,
+                                      area[0] * backgroundErr)
+
+    return (float(subtractedBlackness), float(subtractedBlacknessErr),
+            float(background), float(backgroundErr))
+
+def plateauDL(optDensities, tolerance=0.05):
+    """Given an array of optical densities for dL = 0, 1, 2, ..., return the
+    dL at which the optical density reaches its plateau, i.e. the smallest dL
+    from which widening the polar rectangle only adds background. Beyond it,
+    the optical density increases by the background increment (the median of
+    the increments over the last half of the dLs) plus at most tolerance
+    times the largest increment above background. Return None if there are
+    too few dLs or the increments never settle.
+    """
+
+    optDensities = np.asarray(optDensities, dtype=np.float64)
+    if len(optDensities) < 3:
+        return None
+
+    # the increase of the optical density from each dL to the next
+    increments = np.diff(optDensities)
+    background = np.median(increments[len(increments) // 2:])
+    threshold = background + tolerance * (increments.max() - background)
+
+    # the plateau starts after the last dL whose increment is too large.
+    # Undefined (nan) increments are never part of the plateau
+    notFlat = np.flatnonzero(~(increments <= threshold))
+    if not len(notFlat):
+        return 0
+    if notFlat[-1] + 1 >= len(increments):
+        return None
+    return int(notFlat[-1]) + 1
+
+def opticalDensity(blackness, blacknessErr, trackLengthCm, trackLengthCmErr):
+    """Given the total blackness of a track and its error, as returned by
+    calcBlackness, and the length of the track in cm and its error, return
+    the optical density of the track (total blackness per unit length, in
+    1/cm) along with its error.
+    """
+
+    # note: a background subtracted blackness may be negative, but its error
+    # isn't
+    optDensity = blackness / trackLengthCm
+    optDensityErr = abs(optDensity) * (
+            (trackLengthCmErr / trackLengthCm)**2 + \
+            (blacknessErr / blackness)**2)**0.5
+
+    return optDensity, optDensityErr
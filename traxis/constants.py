@@ -15,6 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with traxis.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
 from PyQt5 import QtGui
 
 
@@ -28,10 +29,16 @@ DEFAULTMARKERCOLOR = QtGui.QColor(176, 30, 125)
 STARTMARKERCOLOR = QtGui.QColor(0, 186, 186)
 ENDMARKERCOLOR = QtGui.QColor(34, 197, 25)
 HIGHLIGHTMARKERCOLOR = QtGui.QColor(235, 233, 0)
+OUTLIERMARKERCOLOR = QtGui.QColor(120, 120, 120)
 
 # momentum arc colours
 ARCCOLOR = QtGui.QColor(33, 95, 147)
 
+# momentum profile colours, for the lowest and highest momentum along the
+# track
+PROFILELOWCOLOR = QtGui.QColor(33, 95, 147)
+PROFILEHIGHCOLOR = QtGui.QColor(243, 42, 31)
+
 # reference line colours
 REFLINECOLOR = QtGui.QColor(243, 42, 31)
 
@@ -42,12 +49,45 @@ TANGENTLINECOLOR = QtGui.QColor(0, 0, 0)
 ZOOMINFACTOR = 1.25 # this should be greater than 1
 ZOOMOUTFACTOR = 1/ZOOMINFACTOR
 
+# image cache
+IMAGECACHEMAXBYTES = 8 * 2**30 # the maximum size of the decoded image cache
+                               # on disk
+
+# the maximum number of image tiles kept in memory for display
+TILECACHESIZE = 64
+
+# scan queue
+SCANQUEUEPREFETCH = 3 # the number of frames to load ahead of the current one
+SCANQUEUEMAXBYTES = 2 * 2**30 # the maximum size of the loaded frame cache
+
 # default GUI state variables
 DEFAULTPOINTSIZE = 10
 DEFAULTLINEWIDTH = 2.5
 
+# the number of threads summing the blackness of a track in the GUI
+DENSITYWORKERS = os.cpu_count() or 1
+
+# the largest dL considered by a dL scan
+DLSCANMAX = 20
+
+# the default length (in px) of the segments of an optical density profile
+DEFAULTPROFILEBINLENGTH = 50
+
+# the thickness (in px) of the polar rectangles on either side of a track in
+# which the background blackness is measured
+BACKGROUNDWIDTH = 5
+
 # bubble chamber magnetic field
 MAGNETICFIELD = 15.5 # in kG
 
 # speed of light
 C = 0.3 # in giga metres per second
+
+# the default number of consecutive markers fitted at a time in a momentum
+# profile
+DEFAULTPROFILEWINDOW = 5
+
+# the number of replicas of a track measurement generated to propagate its
+# uncertainties by Monte Carlo and the number of processes generating them
+MCREPLICAS = 2000
+MCWORKERS = os.cpu_count() or 1
@@ -221,6 +221,15 @@ class ReferenceLine(object):
             # set the resized pen as the line's pen
             self.line.setPen(newLinePen)
 
+    def getCoordinates(self):
+        """Return a tuple (x1, y1, x2, y2) containing the coordinates of the
+        initial and final points of the reference line's line.
+        """
+
+        line = self.line.line()
+
+        return line.x1(), line.y1(), line.x2(), line.y2()
+
     def isBeingDrawn(self):
         """Return True if the ReferenceLine object is in the process of being
         drawn, False otherwise.
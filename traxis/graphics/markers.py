@@ -15,8 +15,10 @@
 # You should have received a copy of the GNU General Public License
 # along with traxis.  If not, see <http://www.gnu.org/licenses/>.
 
+import numpy as np
 from PyQt5 import QtWidgets, QtGui, QtCore
 from traxis import constants
+from traxis.calc import circlefit
 
 
 class MarkerList(QtWidgets.QListWidget):
@@ -25,16 +27,26 @@ class MarkerList(QtWidgets.QListWidget):
     widget. This class subclasses QListWidget and is intended to contain
     TrackMarker objects (as opposed to regular QListWidgetItem objects).
     This class implements a number of methods to work with the extra
-    features that TrackMarker adds to QListWidgetItem.
+    features that TrackMarker adds to QListWidgetItem. The list keeps an
+    incremental circle fit of its markers up to date and emits the
+    markersChanged signal whenever a marker is added, moved, deleted or
+    designated as the start or end point.
     """
 
+    markersChanged = QtCore.pyqtSignal()
+
     def __init__(self, parent=None):
 
         super().__init__(parent)
 
-    def addMarker(self, x, y, size, width, scene):
-        """Create a new TrackMarker object at position (x, y) with size size
-        and pen width width. Set this MarkerList as the new marker's parent,
+        # live circle fit to the coordinates of the markers in this list,
+        # updated every time a marker is added, moved or deleted
+        self.liveFit = circlefit.IncrementalCircleFit()
+
+    def addMarker(self, x, y, size, width, scene, uncertainty=None):
+        """Create a new TrackMarker object at position (x, y) with size size,
+        pen width width and positional uncertainty uncertainty (see
+        TrackMarker). Set this MarkerList as the new marker's parent,
         set the new marker as this list's current item and add the new marker's
         ellipse to scene, a QGraphicsScene. Return the TrackMarker object.
         """
@@ -52,7 +64,8 @@ class MarkerList(QtWidgets.QListWidget):
 
         # create the new TrackMarker object, passing this list widget as the
         # parent
-        newMarker = TrackMarker(newMarkerId, x, y, size, width, self)
+        newMarker = TrackMarker(newMarkerId, x, y, size, width, self,
+                                uncertainty)
 
         # set the newly created marker as the current item for this list
         self.setCurrentItem(newMarker)
@@ -60,9 +73,25 @@ class MarkerList(QtWidgets.QListWidget):
         # add the new marker's ellipse to the graphics scene
         scene.addItem(newMarker.ellipse)
 
+        # add the new marker to the live circle fit
+        self.liveFit.addPoint(*newMarker.getCoordinates())
+        self.markersChanged.emit()
+
         # return the new TrackMarker object
         return newMarker
 
+    def moveMarker(self, marker, dx, dy):
+        """Move the TrackMarker object marker from its current position (x, y)
+        to (x+dx, y+dy). dx and dy are floats.
+        """
+
+        oldCoordinates = marker.getCoordinates()
+        marker.move(dx, dy)
+
+        # update the marker's coordinates in the live circle fit
+        self.liveFit.movePoint(*(oldCoordinates + marker.getCoordinates()))
+        self.markersChanged.emit()
+
     def deleteMarker(self, marker):
         """Remove the TrackMarker object marker from this marker list."""
 
@@ -74,6 +103,10 @@ class MarkerList(QtWidgets.QListWidget):
         markerRow = self.row(marker)
         self.takeItem(markerRow)
 
+        # remove the marker from the live circle fit
+        self.liveFit.removePoint(*marker.getCoordinates())
+        self.markersChanged.emit()
+
     def empty(self):
         """Remove all TrackMarker objects from this marker list."""
 
@@ -86,6 +119,10 @@ class MarkerList(QtWidgets.QListWidget):
         # remove all markers from this list
         self.clear()
 
+        # remove all markers from the live circle fit
+        self.liveFit.reset()
+        self.markersChanged.emit()
+
     def rescale(self, size, width):
         """Set the size of each marker's ellipse in this list to size and the
         pen width of each marker's ellipse to width.
@@ -110,6 +147,7 @@ class MarkerList(QtWidgets.QListWidget):
 
         # designate marker as the new start point
         marker.setDesignation('start')
+        self.markersChanged.emit()
 
     def setEndPoint(self, marker):
         """Designate marker as the end point for this list of markers."""
@@ -123,8 +161,22 @@ class MarkerList(QtWidgets.QListWidget):
             oldEndPoint.setDesignation()
             oldEndPoint.recolor()
 
-        # designate marker as the new start point
+        # designate marker as the new end point
         marker.setDesignation('end')
+        self.markersChanged.emit()
+
+    def flagOutliers(self, isOutlier=None):
+        """Flag the markers in this list as outliers of the circle fit
+        according to isOutlier, a sequence of booleans in the order of the
+        markers, and recolour them. If isOutlier is None, clear all the
+        flags.
+        """
+
+        for row in range(self.count()):
+            marker = self.item(row)
+            marker.outlier = bool(isOutlier[row]) if isOutlier is not None \
+                             else False
+            marker.recolor()
 
     def getStartPoint(self):
         """Return the TrackMarker object designated as the start point for this
@@ -160,11 +212,36 @@ class MarkerList(QtWidgets.QListWidget):
         # return None
         return None
 
+    def getCoordinates(self):
+        """Return two numpy arrays, one containing the x-coordinates of the
+        markers in this list and the second the corresponding y-coordinates.
+        """
+
+        # initialize two numpy arrays whose lengths are equal to the number of
+        # markers in this list
+        xArray = np.zeros(self.count())
+        yArray = np.zeros(self.count())
+
+        # loop over each marker, setting the x-coordinate of each marker as an
+        # element of xArray and each y-coordinate as an element of yArray
+        for row in range(self.count()):
+            xArray[row], yArray[row] = self.item(row).getCoordinates()
+
+        return xArray, yArray
+
+    def getUncertainties(self):
+        """Return a numpy array containing the positional uncertainties of
+        the markers in this list.
+        """
+
+        return np.array([self.item(row).uncertainty
+                         for row in range(self.count())], dtype=np.float64)
+
     def highlightCurrent(self):
         """Change the colour of the currently selected marker to the
         highlighted colour and change the colour of the rest of the
         markers to their appropriate non-highlighted colours (default colour,
-        start colour, or end colour).
+        start colour, end colour or outlier colour).
         """
         
         # simply loop over all the markers in this list and call their recolor
@@ -205,11 +282,14 @@ class TrackMarker(QtWidgets.QListWidgetItem):
     identifier for the marker, x and y (floats), the coordinates of the marker,
     size (float), the size of the marker, width (float), the width of the
     pen used to draw the marker, and optionally parent, a MarkerList object to
-    which the marker will be added. This class subclasses QListWidgetItem,
-    adding three attributes (id, designation and a QGraphicsEllipseItem) along
-    with methods for manipulating these attributes."""
+    which the marker will be added, and uncertainty (float), the uncertainty
+    (in px) of the marker's position. This class subclasses QListWidgetItem,
+    adding five attributes (id, designation, outlier, uncertainty and a
+    QGraphicsEllipseItem) along with methods for manipulating these
+    attributes."""
 
-    def __init__(self, markerId, x, y, size, width, parent=None):
+    def __init__(self, markerId, x, y, size, width, parent=None,
+                 uncertainty=None):
 
         # the id attribute is a unique identifier for the marker. It is up to
         # the code that creates the marker to ensure it is passing a unique id.
@@ -226,6 +306,18 @@ class TrackMarker(QtWidgets.QListWidgetItem):
         # that there is only one start point and only one end point.
         self.designation = None
 
+        # the outlier attribute indicates whether the marker was flagged as an
+        # outlier by a robust circle fit. It is set by MarkerList.flagOutliers
+        self.outlier = False
+
+        # the uncertainty attribute is the uncertainty (in px) of the marker's
+        # position, which sets its weight in the circle fit. If it isn't
+        # given, take the position to be uniformly distributed over the
+        # marker's ellipse
+        if uncertainty is None:
+            uncertainty = size / np.sqrt(12)
+        self.uncertainty = uncertainty
+
         # create a unique name for the marker using its id
         markerName = "Point {}".format(self.id)
 
@@ -303,6 +395,10 @@ class TrackMarker(QtWidgets.QListWidgetItem):
         # if the marker is the end point, set pen colour to end colour
         elif self.designation == 'end':
             newPen.setColor(constants.ENDMARKERCOLOR)
+        # if the marker was flagged as an outlier, set pen colour to outlier
+        # colour
+        elif self.outlier:
+            newPen.setColor(constants.OUTLIERMARKERCOLOR)
         # otherwise set pen colour to default marker colour
         else:
             newPen.setColor(constants.DEFAULTMARKERCOLOR)
@@ -323,39 +419,14 @@ class TrackMarker(QtWidgets.QListWidgetItem):
         # set the translated rect as the marker's ellipse's rect
         self.ellipse.setRect(newRect)
 
-    def getAngle(self, origin, referenceMarker=None):
-        """Given an origin - a tuple whose first element is an x-coordinate and
-        whose second element is a y-coordinate (both floats)- , return the
-        marker's angular coordinate in degrees (a float), where origin is the
-        pole in the polar coordinate system. If referenceMarker - a TrackMarker
-        object - is given, return the angle between the line joining the origin
-        to the marker and the line joining the origin to the referenceMarker.
+    def getCoordinates(self):
+        """Return a tuple containing the x and y-coordinates of the center of
+        the marker.
         """
 
-        # define the marker vector, a QLineF object joining the origin to the
-        # center of the marker's ellipse
-        markerX = self.ellipse.rect().center().x()
-        markerY = self.ellipse.rect().center().y()
-        markerVector = QtCore.QLineF(origin[0], origin[1], markerX, markerY)
-
-        # define the reference vector (the vector with respect to which the
-        # angle of the marker vector is to be determined)
-        # if a referenceMarker was given, the reference vector is the line
-        # joining the origin to the center of the reference marker' ellipse
-        if referenceMarker:
-            referenceX = referenceMarker.ellipse.rect().center().x()
-            referenceY = referenceMarker.ellipse.rect().center().y()
-        # otherwise the reference vector is the polar axis (a horizontal line
-        # terminated at the left by the pole)
-        else:
-            referenceX = origin[0] + 1
-            referenceY = origin[1]
-        referenceVector = QtCore.QLineF(origin[0], origin[1], referenceX, referenceY)
-
-        # compute the angular coordinate of the marker
-        angle = referenceVector.angleTo(markerVector)
+        center = self.ellipse.rect().center()
 
-        return angle
+        return center.x(), center.y()
 
     def rescale(self, size, width):
         """Set the width and height of the marker's ellipse's rect to size (a
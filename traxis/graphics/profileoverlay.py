@@ -0,0 +1,119 @@
+# Copyright (C) 2014 Syed Haider Abidi, Nooruddin Ahmed and Christopher Dydula
+#
+# This file is part of traxis.
+#
+# traxis is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# traxis is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with traxis.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+from PyQt5 import QtGui, QtCore
+from traxis import constants
+from traxis.graphics.fittedarc import ArcItem
+
+
+class MomentumProfileOverlay(object):
+
+    """Momentum profile overlay class. This class is a container for the
+    ArcItem objects drawn over a track, one for each window of a momentum
+    profile (see measure.momentumProfile), coloured by the window's momentum
+    from PROFILELOWCOLOR for the lowest momentum along the track to
+    PROFILEHIGHCOLOR for the highest.
+    """
+
+    def __init__(self):
+        """Initialize the overlay with no arcs."""
+
+        self.arcs = []
+
+    def draw(self, profile, width, scene):
+        """First, reset the overlay if it has already been drawn. Then create
+        an ArcItem for each window of profile, a dict as returned by
+        measure.momentumProfile, coloured by its momentum, set each arc's pen
+        width to width and add each arc to scene, a QGraphicsScene. Windows
+        with a non-finite momentum are not drawn.
+        """
+
+        # reset the overlay
+        self.reset()
+
+        # set a minimum pen width
+        if width < 1:
+            width = 1
+
+        # the range of momenta that the colours span, leaving out the
+        # infinite momenta of windows of collinear markers
+        finiteMomenta = [momentum for momentum in profile['momentum'] if
+                         np.isfinite(momentum)]
+        if not finiteMomenta:
+            return
+        lowMomentum = min(finiteMomenta)
+        highMomentum = max(finiteMomenta)
+
+        for centerX, centerY, radius, momentum, startAngle, spanAngle in \
+                zip(profile['centerX'], profile['centerY'],
+                    profile['radius'], profile['momentum'],
+                    profile['startAngle'], profile['spanAngle']):
+
+            # a window of collinear markers has no arc to draw
+            if not np.isfinite(momentum):
+                continue
+
+            # interpolate the colour of the arc between the low and high
+            # momentum colours
+            if highMomentum > lowMomentum:
+                fraction = (momentum - lowMomentum) / \
+                           (highMomentum - lowMomentum)
+            else:
+                fraction = 0.5
+            colour = QtGui.QColor(
+                *[round(low + fraction * (high - low)) for low, high in
+                  zip(constants.PROFILELOWCOLOR.getRgb()[:3],
+                      constants.PROFILEHIGHCOLOR.getRgb()[:3])])
+
+            # create a pen for the arc using the interpolated colour
+            arcPen = QtGui.QPen(colour)
+            arcPen.setWidth(width)
+
+            # create a rect for the arc with the window's center and radius,
+            # moving its center to the desired coordinates as for the
+            # momentum arc
+            rect = QtCore.QRectF(centerX, centerY, 2 * radius, 2 * radius)
+            rect.moveCenter(QtCore.QPointF(centerX, centerY))
+
+            # create the arc, whose angles are in millionths of a degree
+            arc = ArcItem(rect)
+            arc.setStartAngle(1e6 * startAngle)
+            arc.setSpanAngle(1e6 * spanAngle)
+            arc.setPen(arcPen)
+
+            scene.addItem(arc)
+            self.arcs.append(arc)
+
+    def rescale(self, width):
+        """Set the pen width of the arcs to width."""
+
+        # set a minimum pen width
+        if width < 1:
+            width = 1
+
+        for arc in self.arcs:
+            newPen = arc.pen()
+            newPen.setWidth(width)
+            arc.setPen(newPen)
+
+    def reset(self):
+        """Remove the arcs from their graphics scene."""
+
+        for arc in self.arcs:
+            arc.scene().removeItem(arc)
+        self.arcs = []
@@ -0,0 +1,137 @@
+# Copyright (C) 2014 Syed Haider Abidi, Nooruddin Ahmed and Christopher Dydula
+#
+# This file is part of traxis.
+#
+# traxis is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# traxis is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with traxis.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+from PyQt5 import QtWidgets, QtGui, QtCore
+from traxis import constants
+
+
+class ProfilePlot(QtWidgets.QWidget):
+
+    """Widget which plots the optical density profile of a track: the optical
+    density of each segment of the track, with its error, against arc
+    length.
+    """
+
+    def __init__(self, parent=None):
+        """Instantiate an empty ProfilePlot."""
+
+        super().__init__(parent)
+
+        # the profile is None when there is nothing to plot
+        self.binEdges = None
+        self.optDensity = None
+        self.optDensityErr = None
+
+        self.setMinimumSize(200, 150)
+
+    def setProfile(self, binEdges, optDensity, optDensityErr):
+        """Plot the profile given by binEdges, the edges of the segments (in
+        px of arc length) and optDensity and optDensityErr, the optical
+        density of each segment and its error.
+        """
+
+        self.binEdges = np.asarray(binEdges, dtype=np.float64)
+        self.optDensity = np.asarray(optDensity, dtype=np.float64)
+        self.optDensityErr = np.asarray(optDensityErr, dtype=np.float64)
+        self.update()
+
+    def clear(self):
+        """Remove the plotted profile."""
+
+        self.binEdges = None
+        self.optDensity = None
+        self.optDensityErr = None
+        self.update()
+
+    def paintEvent(self, event):
+        """Draw the axes and, if there is a profile, each segment's optical
+        density as a horizontal step with a vertical error bar at its center.
+        """
+
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), QtCore.Qt.white)
+
+        # leave margins for the axis labels
+        metrics = painter.fontMetrics()
+        margin = metrics.height()
+        plotRect = QtCore.QRectF(self.rect()).adjusted(
+            metrics.width("0000.0") + margin / 2, margin / 2,
+            -margin / 2, -2 * margin)
+
+        # draw the axes
+        painter.setPen(QtGui.QPen(QtCore.Qt.black))
+        painter.drawLine(plotRect.bottomLeft(), plotRect.topLeft())
+        painter.drawLine(plotRect.bottomLeft(), plotRect.bottomRight())
+        painter.drawText(
+            QtCore.QRectF(plotRect.left(), plotRect.bottom() + margin,
+                          plotRect.width(), margin),
+            QtCore.Qt.AlignCenter, "Arc length [px]")
+
+        if self.binEdges is None:
+            painter.drawText(plotRect, QtCore.Qt.AlignCenter, "No profile")
+            return
+
+        # the plotted range of arc length and optical density. Segments with
+        # an undefined optical density are not drawn
+        isDefined = np.isfinite(self.optDensity)
+        errors = np.where(np.isfinite(self.optDensityErr),
+                          self.optDensityErr, 0)
+        lowest = min(np.min(self.optDensity[isDefined] - errors[isDefined],
+                            initial=0), 0)
+        highest = np.max(self.optDensity[isDefined] + errors[isDefined],
+                         initial=0)
+        if highest <= lowest:
+            highest = lowest + 1
+        longest = max(self.binEdges[-1], 1)
+
+        def toPlot(arcLength, optDensity):
+            """Return the point in the widget of the given arc length and
+            optical density.
+            """
+
+            return QtCore.QPointF(
+                plotRect.left() + plotRect.width() * arcLength / longest,
+                plotRect.bottom() -
+                plotRect.height() * (optDensity - lowest) / (highest - lowest))
+
+        # label the ends of the axes
+        painter.drawText(
+            QtCore.QRectF(0, plotRect.top() - margin / 2, plotRect.left(),
+                          margin),
+            QtCore.Qt.AlignRight, "{:.1f}".format(highest))
+        painter.drawText(
+            QtCore.QRectF(0, plotRect.bottom() - margin / 2, plotRect.left(),
+                          margin),
+            QtCore.Qt.AlignRight, "{:.1f}".format(lowest))
+        painter.drawText(
+            QtCore.QRectF(plotRect.left(), plotRect.bottom(), plotRect.width(),
+                          margin),
+            QtCore.Qt.AlignRight, "{:.0f}".format(self.binEdges[-1]))
+
+        # draw each segment's optical density and its error bar
+        painter.setPen(QtGui.QPen(constants.ARCCOLOR, 2))
+        for start, end, optDensity, error in zip(
+                self.binEdges[:-1], self.binEdges[1:], self.optDensity,
+                errors):
+            if not np.isfinite(optDensity):
+                continue
+            painter.drawLine(toPlot(start, optDensity),
+                             toPlot(end, optDensity))
+            center = (start + end) / 2
+            painter.drawLine(toPlot(center, optDensity - error),
+                             toPlot(center, optDensity + error))
@@ -0,0 +1,135 @@
+# Copyright (C) 2014 Syed Haider Abidi, Nooruddin Ahmed and Christopher Dydula
+#
+# This file is part of traxis.
+#
+# traxis is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# traxis is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with traxis.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+from PyQt5 import QtWidgets, QtGui, QtCore
+from traxis import constants
+from traxis.imaging import tiles
+
+
+class TiledImageItem(QtWidgets.QGraphicsItem):
+
+    """Graphics item which displays a TiledImage. Instead of holding the whole
+    image as a pixmap, it converts only the tiles that are exposed when
+    painting into pixmaps, keeping the most recently used ones in a cache.
+    When the image is zoomed out, the tiles are taken from the level of the
+    image pyramid that best matches the zoom, so the cost of painting depends
+    on the number of screen pixels rather than the size of the image.
+    """
+
+    def __init__(self):
+        """Instantiate an empty TiledImageItem."""
+
+        super().__init__()
+
+        # the displayed TiledImage, or None if no image has been set
+        self.tiledImage = None
+        # cache of tile pixmaps, keyed by (level, row, column) and ordered from
+        # least to most recently used
+        self.tileCache = collections.OrderedDict()
+
+        # get the exposed rect of the item when painting so that only the
+        # exposed tiles are drawn
+        self.setFlag(QtWidgets.QGraphicsItem.ItemUsesExtendedStyleOption)
+
+    def setTiledImage(self, tiledImage):
+        """Display tiledImage, a TiledImage (or None to display nothing)."""
+
+        self.prepareGeometryChange()
+        self.tiledImage = tiledImage
+        self.tileCache.clear()
+        self.update()
+
+    def isNull(self):
+        """Return True if no image is displayed, otherwise return False."""
+
+        return self.tiledImage is None
+
+    def boundingRect(self):
+        """Return the rect covered by the image."""
+
+        if self.tiledImage is None:
+            return QtCore.QRectF()
+        return QtCore.QRectF(0, 0, self.tiledImage.width(),
+                             self.tiledImage.height())
+
+    def tilePixmap(self, row, column, level):
+        """Return a pixmap of the tile in the given row and column of the given
+        level of the image pyramid, converting the tile if it isn't in the
+        tile cache.
+        """
+
+        key = (level, row, column)
+        if key in self.tileCache:
+            self.tileCache.move_to_end(key)
+            return self.tileCache[key]
+
+        pixmap = QtGui.QPixmap.fromImage(
+            self.tiledImage.tileImage(row, column, level))
+        self.tileCache[key] = pixmap
+
+        # drop the least recently used tiles if the cache is full
+        while len(self.tileCache) > constants.TILECACHESIZE:
+            self.tileCache.popitem(last=False)
+
+        return pixmap
+
+    def paint(self, painter, option, widget=None):
+        """Reimplement the paint method so that only the tiles intersecting
+        the exposed rect are drawn, using the coarsest level of the image
+        pyramid that still has at least one image pixel per screen pixel.
+        """
+
+        if self.tiledImage is None:
+            return
+
+        # the level of detail is the zoom factor of the view. Pick the highest
+        # level whose pixels are no bigger than a screen pixel
+        levelOfDetail = \
+            QtWidgets.QStyleOptionGraphicsItem.levelOfDetailFromTransform(
+                painter.worldTransform())
+        level = 0
+        while level + 1 < len(self.tiledImage.levels) and \
+              levelOfDetail * 2**(level + 1) <= 1:
+            level += 1
+
+        # each pixel of the level covers levelScale x levelScale image pixels.
+        # The last row and column of the level may extend past the image, so
+        # clip to the image
+        levelScale = 2**level
+        tileSpan = tiles.TILESIZE * levelScale
+        if level > 0:
+            painter.setClipRect(self.boundingRect(), QtCore.Qt.IntersectClip)
+
+        # determine the range of tile rows and columns that are exposed
+        exposedRect = option.exposedRect
+        rowCount, columnCount = self.tiledImage.tileGrid(level)
+        firstRow = max(int(exposedRect.top()) // tileSpan, 0)
+        lastRow = min(int(exposedRect.bottom()) // tileSpan, rowCount - 1)
+        firstColumn = max(int(exposedRect.left()) // tileSpan, 0)
+        lastColumn = min(int(exposedRect.right()) // tileSpan,
+                         columnCount - 1)
+
+        # draw each exposed tile, scaled up to cover its part of the image
+        for row in range(firstRow, lastRow + 1):
+            for column in range(firstColumn, lastColumn + 1):
+                pixmap = self.tilePixmap(row, column, level)
+                painter.drawPixmap(
+                    QtCore.QRectF(column * tileSpan, row * tileSpan,
+                                  pixmap.width() * levelScale,
+                                  pixmap.height() * levelScale),
+                    pixmap, QtCore.QRectF(pixmap.rect()))
@@ -17,11 +17,13 @@
 
 import json
 import math
-from PyQt5 import QtWidgets, QtGui, QtCore
+import numpy as np
+from PyQt5 import QtWidgets, QtCore
 from traxis import constants
-from traxis.gui import skeleton
-from traxis.calc import anglecalc, circlefit, optdensity
-from traxis.graphics import tangent
+from traxis.gui import skeleton, workers
+from traxis.calc import anglecalc, measure, momentum, montecarlo
+from traxis.graphics import profileoverlay, tangent
+from traxis.imaging import pyramid, scanqueue, tiles
 
 
 class MainWidget(skeleton.GuiSkeleton):
@@ -44,9 +46,45 @@ class MainWidget(skeleton.GuiSkeleton):
         self.pointSize = constants.DEFAULTPOINTSIZE
         self.lineWidth = constants.DEFAULTLINEWIDTH
         self.imageFileName = None
+        # parameters of the circle fitted by calcTrackMomentum, or None if the
+        # momentum hasn't been calculated for the current track markers
+        self.fittedCircle = None
+        # the optical density profile calculated for the current fitted
+        # circle, or None if it hasn't been calculated
+        self.densityProfile = None
+        # the momentum profile calculated for the current fitted circle, or
+        # None if it hasn't been calculated, and the overlay drawing it on the
+        # track
+        self.momentumProfile = None
+        self.profileOverlay = profileoverlay.MomentumProfileOverlay()
+        # the tracks added to the vertex, each a dict containing the
+        # parameters of the circle fitted to the track and the coordinates of
+        # its start point (at the vertex) and end point
+        self.vertexTracks = []
+        # the scan queue of frames being analysed, or None if no scan queue
+        # has been opened
+        self.scanQueue = None
+
+        # dispatcher which runs the track calculations on a thread pool so
+        # that the GUI stays responsive while they run
+        self.calcDispatcher = workers.CalcDispatcher(self)
+        self.calcDispatcher.resultReady.connect(self.calcFinished)
+        self.calcDispatcher.calcFailed.connect(self.calcFailed)
+        self.calcDispatcher.busyChanged.connect(self.updateProgressBar)
+
+        # dispatcher which prepares images (e.g. builds image pyramids) on a
+        # thread pool. It is kept separate from calcDispatcher so that
+        # cancelling stale calculations doesn't cancel image preparation
+        self.imageDispatcher = workers.CalcDispatcher(self)
+        self.imageDispatcher.resultReady.connect(self.imageTaskFinished)
+        self.imageDispatcher.calcFailed.connect(self.calcFailed)
+        self.imageDispatcher.busyChanged.connect(self.updateProgressBar)
 
         # connect buttons
         self.openImageButton.clicked.connect(self.openImage)
+        self.openScanQueueButton.clicked.connect(self.openScanQueue)
+        self.prevFrameButton.clicked.connect(self.prevFrame)
+        self.nextFrameButton.clicked.connect(self.nextFrame)
         self.saveSessionButton.clicked.connect(self.saveSession)
         self.loadSessionButton.clicked.connect(self.loadSession)
         self.screenshotButton.clicked.connect(self.saveScreenshot)
@@ -55,6 +93,12 @@ class MainWidget(skeleton.GuiSkeleton):
         self.resetButton.clicked.connect(self.reset)
         self.calcMomentumButton.clicked.connect(self.calcTrackMomentum)
         self.calcDensityButton.clicked.connect(self.calcOptDensity)
+        self.dlScanButton.clicked.connect(self.calcDLScan)
+        self.densityProfileButton.clicked.connect(self.calcDensityProfile)
+        self.momentumProfileButton.clicked.connect(self.calcMomentumProfile)
+        self.monteCarloButton.clicked.connect(self.calcMonteCarlo)
+        self.addVertexTrackButton.clicked.connect(self.addVertexTrack)
+        self.clearVertexButton.clicked.connect(self.clearVertex)
         self.calcAngleButton.clicked.connect(self.calcAngle)
         self.placeMarkerButton.clicked.connect(self.placeMarkerButtonFunc)
         self.drawRefButton.clicked.connect(self.drawRefButtonFunc)
@@ -67,6 +111,7 @@ class MainWidget(skeleton.GuiSkeleton):
         # connect other events
         self.dlLineEdit.textEdited.connect(self.dLEdited)
         self.markerList.itemSelectionChanged.connect(self.highlightPoint)
+        self.markerList.markersChanged.connect(self.updateLiveFit)
 
     ##############################
     # Keypress Event Handler
@@ -107,7 +152,7 @@ class MainWidget(skeleton.GuiSkeleton):
                 dx *= self.pointSize / 2
                 dy *= self.pointSize / 2
             if currentPoint:
-                currentPoint.move(dx, dy)
+                self.markerList.moveMarker(currentPoint, dx, dy)
         
         # F/V to select the next or previous marker in the marker list
         elif event.key() == QtCore.Qt.Key_V:
@@ -147,11 +192,14 @@ class MainWidget(skeleton.GuiSkeleton):
         if self.placeMarkerButton.isChecked():
             self.markerList.addMarker(
                 event.pos().x(), event.pos().y(), 
-                self.pointSize, self.lineWidth, self.scene)
+                self.pointSize, self.lineWidth, self.scene,
+                self.placementUncertainty())
 
         # if angle reference drawing mode is selected, set the initial point
         # of the reference line at the location of the mouse press
         elif self.drawRefButton.isChecked():
+            # an angle calculated for the old reference line is out of date
+            self.calcDispatcher.cancel('angle')
             self.angleRefLine.setInitialPoint(
                 event.pos().x(), event.pos().y(),
                 self.pointSize, self.lineWidth, self.scene)
@@ -165,6 +213,16 @@ class MainWidget(skeleton.GuiSkeleton):
             self.sceneView.lastMousePos = self.sceneView.mapFromScene(
                                               event.pos())
 
+    def placementUncertainty(self):
+        """Return the uncertainty (in px) of the position of a marker placed
+        at the current zoom level. The marker is taken to be placed anywhere
+        within its ellipse, whose size is pointSize, and the mouse position
+        to be known to within a pixel of the screen, i.e. 1/zoomFactor px of
+        the image, both uniformly.
+        """
+
+        return math.hypot(self.pointSize, 1 / self.zoomFactor) / math.sqrt(12)
+
     def pixmapMouseRelease(self, event):
         """Set the final point of the angle reference line if it is in the
         process of being drawn. event is a QGraphicsSceneMouseEvent object
@@ -224,27 +282,51 @@ class MainWidget(skeleton.GuiSkeleton):
         if not fileName:
             fileName = QtWidgets.QFileDialog.getOpenFileName(
                 None, "Open File", QtCore.QDir.currentPath(),
-                "Images (*.png *.jpg);;All Files (*)")[0]
+                "Images (*.png *.jpg *.tif *.tiff);;All Files (*)")[0]
 
-        # load the image into sceneImage
+        # load the image into sceneImage. The image is decoded into
+        # memory-mapped cache files (once per image file) along with the
+        # blackness of every pixel, so that only the parts of the image that
+        # are displayed or measured are read into memory. A corrupt or
+        # unsupported image, or a failure of the cache, fails the load
         if not fileName:
             return False # image not loaded successfully
-        else:
-            image = self.sceneImage.load(fileName)
-        if not image:
+        try:
+            tiledImage = tiles.openTiledImage(fileName)
+        except Exception as error:
+            self.displayMessage(
+                "NOTICE: Cannot open file as image: {} ({}: {}).".format(
+                    fileName, type(error).__name__, error))
+            return False # image not loaded successfully
+        if tiledImage is None:
             self.displayMessage(
                 "NOTICE: Cannot open file as image: {}.".format(fileName))
             return False # image not loaded successfully
 
-        # store the image file name
+        # display the image and reset the application
+        self.showImage(tiledImage, fileName)
+
+        # an image was successfully opened
+        return True
+
+    def showImage(self, tiledImage, fileName):
+        """Display tiledImage, a TiledImage loaded from fileName, and reset
+        the application.
+        """
+
+        # store the image and the image file name
+        self.sceneImage = tiledImage
         self.imageFileName = fileName
 
         # resize the graphics scene to the loaded image dimensions
         self.scene.setSceneRect(
             0, 0, self.sceneImage.width(), self.sceneImage.height())
 
-        # create a pixmap from the loaded image
-        self.scenePixmap.setPixmap(QtGui.QPixmap.fromImage(self.sceneImage))
+        # display the loaded image
+        self.scenePixmap.setTiledImage(self.sceneImage)
+
+        # optical density measurements use the blackness plane of the image
+        self.sceneBlackness = self.sceneImage.blackness
 
         # set keyboard focus to the graphics view
         self.sceneView.setFocus()
@@ -252,7 +334,97 @@ class MainWidget(skeleton.GuiSkeleton):
         # reset the application
         self.reset()
 
-        # an image was successfully opened
+        # build the image pyramid used to display the image zoomed out on a
+        # worker thread, unless it has already been built. imageTaskFinished
+        # is called with the result
+        if len(self.sceneImage.levels) == 1:
+            self.imageDispatcher.submit('pyramid', self.sceneImage,
+                                        pyramid.buildPyramid, self.sceneImage)
+
+    def openScanQueue(self, directory=None):
+        """If directory, a string containing the location of a directory of
+        frames is passed, open it as the scan queue. Otherwise have the user
+        select the directory via file dialog. Then open the first frame.
+        """
+
+        # if no directory was given, open file dialog to obtain the directory
+        if not directory:
+            directory = QtWidgets.QFileDialog.getExistingDirectory(
+                None, "Open Scan Queue", QtCore.QDir.currentPath())
+
+        # return if no directory was selected
+        if not directory:
+            return False
+
+        scanQueue = scanqueue.ScanQueue(directory)
+        if not len(scanQueue):
+            self.displayMessage(
+                "NOTICE: No images found in directory: {}.".format(directory))
+            return False
+
+        # replace the previous scan queue and open the first frame
+        if self.scanQueue:
+            self.scanQueue.close()
+        self.scanQueue = scanQueue
+        return self.nextFrame()
+
+    def nextFrame(self):
+        """Open the next frame of the scan queue."""
+
+        # return if no scan queue has been opened
+        if not self.scanQueue:
+            self.displayMessage("NOTICE: Scan queue must be opened first.")
+            return False
+
+        # return if the current frame is the last one
+        if self.scanQueue.index == len(self.scanQueue) - 1:
+            self.displayMessage("NOTICE: This is the last frame.")
+            return False
+
+        return self.showFrame(self.scanQueue.next)
+
+    def prevFrame(self):
+        """Open the previous frame of the scan queue."""
+
+        # return if no scan queue has been opened
+        if not self.scanQueue:
+            self.displayMessage("NOTICE: Scan queue must be opened first.")
+            return False
+
+        # return if the current frame is the first one
+        if not self.scanQueue.index:
+            self.displayMessage("NOTICE: This is the first frame.")
+            return False
+
+        return self.showFrame(self.scanQueue.previous)
+
+    def showFrame(self, moveFrame):
+        """Call moveFrame, the next or previous method of the scan queue, and
+        display the frame it moves to, or print a notice if it couldn't be
+        opened. The scan queue stays on a frame that couldn't be opened, so
+        that it is skipped by moving on again.
+        """
+
+        # a frame that fails to load (e.g. a corrupt image, or a failure of
+        # the image cache) raises its error here, even if it was loaded in
+        # the background
+        try:
+            tiledImage = moveFrame()
+        except Exception as error:
+            self.displayMessage(
+                "NOTICE: Cannot open file as image: {} ({}: {}).".format(
+                    self.scanQueue.fileName(), type(error).__name__, error))
+            return False
+
+        fileName = self.scanQueue.fileName()
+        if tiledImage is None:
+            self.displayMessage(
+                "NOTICE: Cannot open file as image: {}.".format(fileName))
+            return False
+
+        self.showImage(tiledImage, fileName)
+        self.displayMessage("Frame {} of {}: {}".format(
+            self.scanQueue.index + 1, len(self.scanQueue), fileName))
         return True
 
     def saveSession(self):
@@ -261,7 +433,7 @@ class MainWidget(skeleton.GuiSkeleton):
         """
 
         # if no image has been opened, return
-        if self.scenePixmap.pixmap().isNull():
+        if self.scenePixmap.isNull():
             self.displayMessage("NOTICE: Nothing to save.")
             return
 
@@ -292,6 +464,7 @@ class MainWidget(skeleton.GuiSkeleton):
                     pointDict['designation'] = point.designation
                     pointDict['x'] = point.ellipse.rect().center().x()
                     pointDict['y'] = point.ellipse.rect().center().y()
+                    pointDict['uncertainty'] = point.uncertainty
                     points.append(pointDict)
                 saveData["points"] = points
 
@@ -299,6 +472,32 @@ class MainWidget(skeleton.GuiSkeleton):
             if self.dlLineEdit.text() not in ["0", ""]:
                 saveData['dl'] = self.dlLineEdit.text()
 
+            # store the density weighting if it isn't the default
+            if self.areaWeightingCheckBox.isChecked():
+                saveData['densityWeighting'] = 'area'
+
+            # store whether the background is subtracted
+            if self.backgroundCheckBox.isChecked():
+                saveData['densityBackground'] = True
+
+            # store whether the track circle is fitted robustly
+            if self.robustFitCheckBox.isChecked():
+                saveData['robustFit'] = True
+
+            # store the optical density profile if one was calculated for the
+            # current track markers
+            if self.densityProfile:
+                saveData['densityProfile'] = self.densityProfile
+
+            # store the momentum profile if one was calculated for the
+            # current track markers
+            if self.momentumProfile:
+                saveData['momentumProfile'] = self.momentumProfile
+
+            # store the vertex tracks
+            if self.vertexTracks:
+                saveData['vertexTracks'] = self.vertexTracks
+
             # store the coordinates of the initial and final points of the
             # reference line
             if self.angleRefLine.finalPoint:
@@ -365,11 +564,18 @@ class MainWidget(skeleton.GuiSkeleton):
                         pointDesignation = point["designation"]
                         x = point['x']
                         y = point['y']
+                        # markers saved without an uncertainty are given
+                        # that of a marker placed at the current zoom level
+                        uncertainty = point.get('uncertainty',
+                                                self.placementUncertainty())
                         addedMarker = self.markerList.addMarker(
                                           x, y, self.pointSize,
-                                          self.lineWidth, self.scene)
+                                          self.lineWidth, self.scene,
+                                          uncertainty)
                         # set the appropriate designation for each marker
                         addedMarker.setDesignation(pointDesignation)
+                    # show the live fit to the loaded markers
+                    self.updateLiveFit()
 
                 # get the dl data from the saved session
                 dl = loadData.get('dl')
@@ -380,6 +586,27 @@ class MainWidget(skeleton.GuiSkeleton):
                 except (ValueError, TypeError):
                     pass
 
+                # set the area weighting check box from the saved density
+                # weighting
+                self.areaWeightingCheckBox.setChecked(
+                    loadData.get('densityWeighting') == 'area')
+                self.backgroundCheckBox.setChecked(
+                    bool(loadData.get('densityBackground')))
+                self.robustFitCheckBox.setChecked(
+                    bool(loadData.get('robustFit')))
+
+                # use the bin length of the saved optical density profile
+                densityProfile = loadData.get('densityProfile')
+                if densityProfile and densityProfile.get('binLength'):
+                    self.binLengthLineEdit.setText(
+                        str(densityProfile['binLength']))
+
+                # use the window size of the saved momentum profile
+                momentumProfile = loadData.get('momentumProfile')
+                if momentumProfile and momentumProfile.get('windowSize'):
+                    self.profileWindowLineEdit.setText(
+                        str(momentumProfile['windowSize']))
+
                 # get the data for the initial and final points for the
                 # reference line
                 refInitialPoint = loadData.get('refInitialPoint')
@@ -397,13 +624,19 @@ class MainWidget(skeleton.GuiSkeleton):
                         refFinalPoint['x'], refFinalPoint['y'],
                         self.pointSize, self.lineWidth, self.scene)
 
+                # restore the vertex tracks and calculate their opening angles
+                vertexTracks = loadData.get('vertexTracks')
+                if vertexTracks:
+                    self.vertexTracks = vertexTracks
+                    self.calcVertexAngles()
+
     def saveScreenshot(self):
         """Save the currently visible part of the graphics scene to an
         image.
         """
 
         # if no image has been opened, return
-        if self.scenePixmap.pixmap().isNull():
+        if self.scenePixmap.isNull():
             self.displayMessage(
                 "NOTICE: There is nothing to take screenshot of.")
             return
@@ -457,6 +690,7 @@ class MainWidget(skeleton.GuiSkeleton):
         # using the updated point size and line width
         self.markerList.rescale(self.pointSize, self.lineWidth)
         self.momentumArc.rescale(self.lineWidth)
+        self.profileOverlay.rescale(self.lineWidth)
         self.angleRefLine.rescale(self.pointSize, self.lineWidth)
         if self.tangentLine:
             self.tangentLine.rescale(self.lineWidth)
@@ -493,9 +727,45 @@ class MainWidget(skeleton.GuiSkeleton):
             self.tangentLine.scene().removeItem(self.tangentLine)
             self.tangentLine = None
 
-        # fit a circle to the track markers and store the fit parameters
-        # in the fittedCircle attribute
-        self.fittedCircle = circlefit.fitCircle(self.markerList)
+        # fit a circle to the track markers (robustly if the robust fit check
+        # box is checked) and compute the start and span angles of the
+        # momentum arc from the start and end markers on a worker thread,
+        # using snapshots of the marker coordinates. momentumCalculated is
+        # called with the result
+        # The markers are weighted by their positional uncertainties
+        fitArgs = self.markerList.getCoordinates() + \
+                  self.markerList.getStartPoint().getCoordinates() + \
+                  self.markerList.getEndPoint().getCoordinates()
+        if self.robustFitCheckBox.isChecked():
+            self.calcDispatcher.submit(
+                'momentum', None, measure.fitTrackRobust,
+                *(fitArgs + (self.markerList.getUncertainties(),)))
+        else:
+            self.calcDispatcher.submit(
+                'momentum', None, measure.fitTrack,
+                *(fitArgs + ('geometric',
+                             self.markerList.getUncertainties())))
+
+    def momentumCalculated(self, result):
+        """Store the parameters of the circle fitted by calcTrackMomentum and
+        print them to the console along with the momentum computed from them.
+        Draw the momentum arc using the fit parameters and print its length to
+        the console. result is the (circleParams, startAngle, spanAngle) tuple
+        returned by measure.fitTrack, or the tuple returned by
+        measure.fitTrackRobust, in which case the outlying markers are flagged.
+        """
+
+        # store the fit parameters in the fittedCircle attribute
+        self.fittedCircle, startAngle, spanAngle = result[:3]
+
+        # flag the outlying markers of a robust fit
+        if len(result) > 3:
+            isOutlier = result[3]
+            self.markerList.flagOutliers(isOutlier)
+            self.displayMessage("---Robust Fit---")
+            self.displayMessage(
+                "Outlying markers:\t{} of {}".format(isOutlier.sum(),
+                                                     len(isOutlier)))
 
         # print the fit parameters to the console
         self.displayMessage("---Fitted Circle---")
@@ -519,28 +789,15 @@ class MainWidget(skeleton.GuiSkeleton):
                 self.fittedCircle['radius']*constants.ERRCMPERPX))
 
         # compute the track momentum from the track radius and print to
-        # console. Given a track radius, R, in cm, a magnetic field, B,
-        # in kG and the speed of light, c, in Giga metres per second, the
-        # track momentum in MeV/c can be computed as p = c*B*R
+        # console
         self.displayMessage("---Track Momentum---")
         self.displayMessage(
             "Track Momentum:\t{:.5f} +/- {:.5f} (Stat) +/- {:.5f} (Cal) [MeV/c]".format(
-                constants.C*constants.MAGNETICFIELD* \
-                self.fittedCircle['radius']*constants.CMPERPX,
-                constants.C*constants.MAGNETICFIELD* \
-                self.fittedCircle['radiusErr']*constants.CMPERPX, 
-                constants.C*constants.MAGNETICFIELD* \
-                self.fittedCircle['radius']*constants.ERRCMPERPX))
-
-        # compute the start and span angles of the momentum arc using the start
-        # and end markers and the fitted circle center
-        startAngle = self.markerList.getStartPoint().getAngle(
-                         (self.fittedCircle['centerX'],
-                          self.fittedCircle['centerY']))
-        spanAngle = self.markerList.getEndPoint().getAngle(
-                        (self.fittedCircle['centerX'], 
-                         self.fittedCircle['centerY']), 
-                        self.markerList.getStartPoint())
+                *momentum.trackMomentum(
+                    self.fittedCircle['radius'],
+                    self.fittedCircle['radiusErr'],
+                    constants.CMPERPX, constants.ERRCMPERPX,
+                    constants.MAGNETICFIELD, constants.C)))
 
         # get the dL value from the dL text box. If the box is empty, use
         # a value of 0
@@ -556,15 +813,13 @@ class MainWidget(skeleton.GuiSkeleton):
             self.fittedCircle['radius'], startAngle, spanAngle, dl,
             self.lineWidth, self.scene)
 
-        # calculate the length of the momentum arc in px
+        # calculate the length of the momentum arc in px and cm
         # note: ArcItems have start and span angles in units of millionths of a
         # degree, so divide them by 1e6
-        trackLengthPx = self.fittedCircle['radius'] * \
-                 self.momentumArc.centralArc.spanAngle() / 1e6 * (math.pi / 180)
-
-        # convert track length from px to cm
-        trackLengthCm = trackLengthPx * constants.CMPERPX
-        trackLengthCmErr = trackLengthPx * constants.ERRCMPERPX
+        trackLengthPx, trackLengthCm, trackLengthCmErr = momentum.trackLength(
+            self.fittedCircle['radius'],
+            self.momentumArc.centralArc.spanAngle() / 1e6,
+            constants.CMPERPX, constants.ERRCMPERPX)
 
         # print the track length to the console
         self.displayMessage("---Track Length---")
@@ -579,8 +834,9 @@ class MainWidget(skeleton.GuiSkeleton):
         covered by the momentum arc and print it to the console.
         """
 
-        # return if track momentum has not yet been calculated
-        if not self.momentumArc.centralArc:
+        # return if track momentum has not yet been calculated for the
+        # current track markers
+        if not self.momentumArc.centralArc or self.fittedCircle is None:
             self.displayMessage(
                 "NOTICE: Track momentum must be calculated first.")
             return
@@ -597,34 +853,348 @@ class MainWidget(skeleton.GuiSkeleton):
             self.displayMessage("NOTICE: dL must be non-zero.")
             return
 
-        # compute the total blackness of all the pixels contained within the
-        # portion of the sceneImage that is covered by the momentum arc
+        # weight the pixels by their area covered by the polar rectangle if
+        # area weighting is checked
+        if self.areaWeightingCheckBox.isChecked():
+            weighting = 'area'
+        else:
+            weighting = 'points'
+
+        # subtract the background measured on either side of the track if
+        # background subtraction is checked
+        if self.backgroundCheckBox.isChecked():
+            backgroundWidth = constants.BACKGROUNDWIDTH
+        else:
+            backgroundWidth = 0
+
+        # compute the optical density of the portion of the sceneImage that is
+        # covered by the momentum arc on a worker thread, using snapshots of
+        # the blackness plane and the fit parameters. densityCalculated is
+        # called with the result
         # note: ArcItems have start and span angles in units of millionths of a
         # degree, so divide them by 1e6
-        blackness, blacknessErr = optdensity.calcBlackness(
-            self.sceneImage, self.fittedCircle, dl,
+        self.calcDispatcher.submit(
+            'density', (dl, weighting, backgroundWidth), measure.trackDensity,
+            self.sceneBlackness, dict(self.fittedCircle), dl,
             self.momentumArc.centralArc.startAngle() / 1e6,
-            self.momentumArc.centralArc.spanAngle() / 1e6)
-
-        # calculate the length of the momentum arc in px
-        trackLengthPx = self.fittedCircle['radius'] * \
-                 self.momentumArc.centralArc.spanAngle() / 1e6 * (math.pi / 180)
-
-        # convert track length from px to cm
-        trackLengthCm = trackLengthPx * constants.CMPERPX
-        trackLengthCmErr = trackLengthPx * constants.ERRCMPERPX
+            self.momentumArc.centralArc.spanAngle() / 1e6,
+            constants.CMPERPX, constants.ERRCMPERPX, weighting,
+            backgroundWidth, constants.DENSITYWORKERS)
+
+    def densityCalculated(self, dl, weighting, backgroundWidth, result):
+        """Print the optical density calculated by calcOptDensity with the
+        given dl, weighting and backgroundWidth to the console. result is the
+        (optDensity, optDensityErr) tuple returned by measure.trackDensity.
+        """
 
-        # calculate optical density - total blackness per unit length
-        optDensity = blackness / trackLengthCm
-        optDensityErr = optDensity * (
-                (trackLengthCmErr / trackLengthCm)**2 + \
-                (blacknessErr / blackness)**2)**0.5
+        optDensity, optDensityErr = result
 
         # print the optical density to the console
         self.displayMessage("---Optical Density---")
+        if weighting == 'area':
+            dlText = "dL={}, area weighted".format(dl)
+        else:
+            dlText = "dL={}".format(dl)
+        if backgroundWidth:
+            dlText += ", background subtracted"
         self.displayMessage(
-            "Optical density:\t{:.5f} +/- {:.5f} [1/cm] (with dL={})".format(
-                optDensity, optDensityErr, dl))
+            "Optical density:\t{:.5f} +/- {:.5f} [1/cm] (with {})".format(
+                optDensity, optDensityErr, dlText))
+
+    def calcDLScan(self):
+        """Calculate the optical density of the portion of a track that is
+        covered by the momentum arc for every integer dL up to
+        constants.DLSCANMAX and print them to the console along with the dL
+        at which the optical density reaches its plateau.
+        """
+
+        # return if track momentum has not yet been calculated for the
+        # current track markers
+        if not self.momentumArc.centralArc or self.fittedCircle is None:
+            self.displayMessage(
+                "NOTICE: Track momentum must be calculated first.")
+            return
+
+        # weight the pixels as Calculate Optical Density does, so that the
+        # optical density for each dL is the one it gives for that dL
+        if self.areaWeightingCheckBox.isChecked():
+            weighting = 'area'
+        else:
+            weighting = 'points'
+
+        # the scan doesn't subtract the background
+        if self.backgroundCheckBox.isChecked():
+            self.displayMessage(
+                "NOTICE: The dL scan is done without background "
+                "subtraction.")
+
+        # compute the optical densities on a worker thread, using snapshots
+        # of the blackness plane and the fit parameters. dLScanCalculated is
+        # called with the result
+        # note: ArcItems have start and span angles in units of millionths of a
+        # degree, so divide them by 1e6
+        self.calcDispatcher.submit(
+            'dlscan', None, measure.trackDensityScan,
+            self.sceneBlackness, dict(self.fittedCircle), constants.DLSCANMAX,
+            self.momentumArc.centralArc.startAngle() / 1e6,
+            self.momentumArc.centralArc.spanAngle() / 1e6,
+            constants.CMPERPX, constants.ERRCMPERPX, weighting,
+            constants.DENSITYWORKERS)
+
+    def dLScanCalculated(self, result):
+        """Print the optical densities calculated by calcDLScan to the
+        console. result is the (optDensity, optDensityErr, plateauDL) tuple
+        returned by measure.trackDensityScan.
+        """
+
+        optDensity, optDensityErr, plateauDL = result
+
+        # print the optical density for each dL to the console
+        self.displayMessage("---dL Scan---")
+        for dl in range(len(optDensity)):
+            self.displayMessage(
+                "dL={}:\t{:.5f} +/- {:.5f} [1/cm]".format(
+                    dl, optDensity[dl], optDensityErr[dl]))
+
+        # print the start of the plateau
+        if plateauDL is None:
+            self.displayMessage(
+                "No optical density plateau up to dL={}".format(
+                    len(optDensity) - 1))
+        else:
+            self.displayMessage(
+                "Optical density plateau from dL={}".format(plateauDL))
+
+    def calcDensityProfile(self):
+        """Calculate the optical density of each segment of the profile bin
+        length along the portion of a track that is covered by the momentum
+        arc and plot them in the profile side panel.
+        """
+
+        # return if track momentum has not yet been calculated for the
+        # current track markers
+        if not self.momentumArc.centralArc or self.fittedCircle is None:
+            self.displayMessage(
+                "NOTICE: Track momentum must be calculated first.")
+            return
+
+        # get the dL value from the dL text box. If the box is empty, use
+        # a value of zero
+        if self.dlLineEdit.text():
+            dl = float(self.dlLineEdit.text())
+        else:
+            dl = 0
+
+        # if the dl is 0, return
+        if dl == 0:
+            self.displayMessage("NOTICE: dL must be non-zero.")
+            return
+
+        # get the bin length from the bin length text box, returning if it is
+        # empty or 0
+        if self.binLengthLineEdit.text():
+            binLength = float(self.binLengthLineEdit.text())
+        else:
+            binLength = 0
+        if binLength == 0:
+            self.displayMessage("NOTICE: Profile bin length must be non-zero.")
+            return
+
+        # compute the profile on a worker thread, using snapshots of the
+        # blackness plane and the fit parameters. densityProfileCalculated is
+        # called with the result
+        # note: ArcItems have start and span angles in units of millionths of a
+        # degree, so divide them by 1e6
+        self.calcDispatcher.submit(
+            'profile', (dl, binLength), measure.trackDensityProfile,
+            self.sceneBlackness, dict(self.fittedCircle), dl,
+            self.momentumArc.centralArc.startAngle() / 1e6,
+            self.momentumArc.centralArc.spanAngle() / 1e6,
+            binLength, constants.CMPERPX, constants.ERRCMPERPX,
+            constants.DENSITYWORKERS)
+
+    def densityProfileCalculated(self, dl, binLength, result):
+        """Store the optical density profile calculated by calcDensityProfile
+        with the given dl and binLength, plot it in the profile side panel
+        and print the number of segments to the console. result is the
+        (binEdges, optDensity, optDensityErr) tuple returned by
+        measure.trackDensityProfile.
+        """
+
+        binEdges, optDensity, optDensityErr = result
+
+        # store the profile so that it can be saved with the session. JSON
+        # has no nan, so undefined values are stored as None
+        self.densityProfile = {
+            'dl': dl,
+            'binLength': binLength,
+            'binEdges': binEdges.tolist(),
+            'optDensity': [value if math.isfinite(value) else None
+                           for value in optDensity.tolist()],
+            'optDensityErr': [value if math.isfinite(value) else None
+                              for value in optDensityErr.tolist()]}
+
+        # plot the profile in the side panel
+        self.profilePlot.setProfile(binEdges, optDensity, optDensityErr)
+        self.profileWidget.setVisible(True)
+
+        self.displayMessage("---Optical Density Profile---")
+        self.displayMessage(
+            "{} segments of {} px (with dL={})".format(len(optDensity),
+                                                       binLength, dl))
+
+    def calcMomentumProfile(self):
+        """Calculate the momentum along a track by fitting circles to windows
+        of the profile window number of consecutive track markers, draw it
+        as a colour-coded overlay on the track and print it to the console.
+        """
+
+        # return if track momentum has not yet been calculated for the
+        # current track markers
+        if not self.momentumArc.centralArc or self.fittedCircle is None:
+            self.displayMessage(
+                "NOTICE: Track momentum must be calculated first.")
+            return
+
+        # get the window size from the profile window text box, returning if
+        # it is too small to fit a circle or larger than the number of markers
+        if self.profileWindowLineEdit.text():
+            windowSize = int(self.profileWindowLineEdit.text())
+        else:
+            windowSize = 0
+        if windowSize < 3:
+            self.displayMessage(
+                "NOTICE: Profile window must be at least 3 markers.")
+            return
+        if windowSize > self.markerList.count():
+            self.displayMessage(
+                "NOTICE: Profile window must not exceed the number of "
+                "markers.")
+            return
+
+        # compute the profile on a worker thread, using snapshots of the
+        # marker coordinates and the fit parameters.
+        # momentumProfileCalculated is called with the result
+        self.calcDispatcher.submit(
+            'momentumprofile', (windowSize,), measure.momentumProfile,
+            *(self.markerList.getCoordinates() + (dict(self.fittedCircle),) +
+              self.markerList.getStartPoint().getCoordinates() +
+              (windowSize, constants.CMPERPX, constants.ERRCMPERPX,
+               constants.MAGNETICFIELD, constants.C)))
+
+    def momentumProfileCalculated(self, windowSize, result):
+        """Store the momentum profile calculated by calcMomentumProfile with
+        the given windowSize, draw it over the track and print it to the
+        console. result is the dict returned by measure.momentumProfile.
+        """
+
+        # store the profile as plain floats so that it can be saved with the
+        # session
+        self.momentumProfile = {'windowSize': windowSize}
+        for key, value in result.items():
+            self.momentumProfile[key] = np.asarray(value).tolist()
+
+        # draw the colour-coded overlay on the track
+        self.profileOverlay.draw(result, self.lineWidth, self.scene)
+
+        self.displayMessage("---Momentum Profile---")
+        self.displayMessage(
+            "Arc Length (px)\tMomentum [MeV/c] (windows of {} markers)".format(
+                windowSize))
+        for arcLength, windowMomentum in zip(result['arcLength'],
+                                             result['momentum']):
+            self.displayMessage(
+                "{:.1f}\t{:.5f}".format(arcLength, windowMomentum))
+        self.displayMessage(
+            "Start Momentum:\t{:.5f} [MeV/c]".format(
+                result['startMomentum']))
+
+    def calcMonteCarlo(self):
+        """Propagate the uncertainties of the track measurement by Monte
+        Carlo: measure MCREPLICAS replicas of the track with smeared marker
+        positions, calibration and dL and print the spread of the measured
+        quantities to the console. The optical density is included if the dL
+        is non-zero and the opening angle if the angle reference line has
+        been drawn.
+        """
+
+        # return if track momentum has not yet been calculated for the
+        # current track markers
+        if not self.momentumArc.centralArc or self.fittedCircle is None:
+            self.displayMessage(
+                "NOTICE: Track momentum must be calculated first.")
+            return
+
+        # get the dL value from the dL text box. If the box is empty, use
+        # a value of zero
+        if self.dlLineEdit.text():
+            dl = float(self.dlLineEdit.text())
+        else:
+            dl = 0
+
+        # get the reference line if it has been drawn
+        if self.angleRefLine.finalPoint:
+            refLine = self.angleRefLine.getCoordinates()
+        else:
+            refLine = None
+
+        # measure the optical density of the replicas in the same way as the
+        # optical density of the track
+        if self.areaWeightingCheckBox.isChecked():
+            weighting = 'area'
+        else:
+            weighting = 'points'
+        if self.backgroundCheckBox.isChecked():
+            backgroundWidth = constants.BACKGROUNDWIDTH
+        else:
+            backgroundWidth = 0
+
+        # generate the replicas on a worker thread, which spreads them
+        # across MCWORKERS processes, using snapshots of the markers, the fit
+        # parameters and the blackness plane. monteCarloCalculated is called
+        # with the result. The dL of the replicas is smeared by 1 px
+        # note: ArcItems have start and span angles in units of millionths of a
+        # degree, so divide them by 1e6
+        self.calcDispatcher.submit(
+            'montecarlo', None, montecarlo.trackMonteCarlo,
+            *self.markerList.getCoordinates(),
+            self.markerList.getUncertainties(),
+            self.markerList.row(self.markerList.getStartPoint()),
+            self.markerList.row(self.markerList.getEndPoint()),
+            dict(self.fittedCircle),
+            self.momentumArc.centralArc.startAngle() / 1e6,
+            self.momentumArc.centralArc.spanAngle() / 1e6,
+            constants.CMPERPX, constants.ERRCMPERPX,
+            constants.MAGNETICFIELD, constants.C, refLine,
+            self.sceneBlackness, dl, 1, weighting, backgroundWidth,
+            constants.MCREPLICAS, constants.MCWORKERS)
+
+    def monteCarloCalculated(self, result):
+        """Print the Monte Carlo uncertainties calculated by calcMonteCarlo to
+        the console. result is the dict returned by
+        montecarlo.trackMonteCarlo.
+        """
+
+        self.displayMessage("---Monte Carlo Errors---")
+        self.displayMessage("{} replicas ({} failed)".format(
+            result['replicas'], result['failed']))
+
+        # the mean, standard deviation and percentiles of each quantity
+        self.displayMessage("Quantity\tMean +/- Std\tPercentiles {}".format(
+            "/".join("{:g}".format(percentile)
+                     for percentile in montecarlo.PERCENTILES)))
+        for index, name in enumerate(result['names']):
+            self.displayMessage("{}:\t{:.5f} +/- {:.5f}\t{}".format(
+                name, result['mean'][index], result['std'][index],
+                " ".join("{:.5f}".format(value)
+                         for value in result['percentiles'][:, index])))
+
+        # the covariance matrix of the quantities, one row per quantity
+        self.displayMessage("Covariance ({}):".format(
+            ", ".join(result['names'])))
+        for row in result['covariance']:
+            self.displayMessage(
+                "\t".join("{:.5g}".format(value) for value in row))
 
     def calcAngle(self):
         """Calculate the angle between the reference line and the tangent to
@@ -632,8 +1202,9 @@ class MainWidget(skeleton.GuiSkeleton):
         console.
         """
 
-        # return if track momentum has not yet been calculated
-        if not self.momentumArc.centralArc:
+        # return if track momentum has not yet been calculated for the
+        # current track markers
+        if not self.momentumArc.centralArc or self.fittedCircle is None:
             self.displayMessage(
                 "NOTICE: Track momentum must be calculated first.")
             return
@@ -650,29 +1221,198 @@ class MainWidget(skeleton.GuiSkeleton):
                 "NOTICE: Angle Reference Line must be drawn first.")
             return
 
-        # get the tangent line to the fitted circle at the start point along
-        # with the two lines that the tangent may lie between within error
-        tangentLine, tangentErrA, tangentErrB = anglecalc.tangentCalc(
-                          self.fittedCircle, self.markerList.getStartPoint())
+        # compute the tangent line to the fitted circle at the start point and
+        # the angle between it and the reference line on a worker thread,
+        # using snapshots of the fit parameters and the coordinates.
+        # angleCalculated is called with the result
+        self.calcDispatcher.submit(
+            'angle', None, measure.trackAngle, dict(self.fittedCircle),
+            *self.markerList.getStartPoint().getCoordinates(),
+            self.angleRefLine.getCoordinates())
+
+    def angleCalculated(self, result):
+        """Draw the tangent line calculated by calcAngle and print the opening
+        angle to the console. result is the (tangentLine, angle, angleErr)
+        tuple returned by measure.trackAngle.
+        """
+
+        tangentLine, angle, angleErr = result
 
         # if a tangent line has been drawn before, remove the old tangent
         if self.tangentLine:
             self.tangentLine.scene().removeItem(self.tangentLine)
         # add the new tangent line to the graphics scene
-        self.tangentLine = tangent.TangentLine(tangentLine,
+        self.tangentLine = tangent.TangentLine(QtCore.QLineF(*tangentLine),
                                                self.lineWidth, self.scene)
 
-        # compute the angle between the tangent line and the reference line
-        # along with the error on the angle
-        angle, angleErr = anglecalc.openingAngle(tangentLine,
-                                                 tangentErrA, tangentErrB,
-                                                 self.angleRefLine)
-
         # print the opening angle to the console
         self.displayMessage("---Opening Angle---")
         self.displayMessage("Opening Angle:\t{:.5f} +/- {:.5f}".format(angle,
                                                                      angleErr))
 
+    def addVertexTrack(self):
+        """Add the track whose momentum has been calculated to the vertex at
+        its start point, remove its markers so that the next track leaving
+        the vertex can be marked and calculate the opening angles between all
+        the vertex tracks.
+        """
+
+        # return if track momentum has not yet been calculated for the
+        # current track markers
+        if not self.momentumArc.centralArc or self.fittedCircle is None:
+            self.displayMessage(
+                "NOTICE: Track momentum must be calculated first.")
+            return
+
+        # store the fit parameters and the start and end points of the track.
+        # The circle parameters are stored as plain floats so that they can
+        # be saved with the session
+        self.vertexTracks.append({
+            'circle': {key: float(value)
+                       for key, value in self.fittedCircle.items()},
+            'startPoint': self.markerList.getStartPoint().getCoordinates(),
+            'endPoint': self.markerList.getEndPoint().getCoordinates()})
+        self.displayMessage(
+            "Track {} added to vertex.".format(len(self.vertexTracks)))
+
+        # remove the markers and the momentum arc of the track
+        self.markerList.empty()
+        self.momentumArc.reset()
+
+        self.calcVertexAngles()
+
+    def calcVertexAngles(self):
+        """Calculate the direction of every vertex track at the vertex and
+        the opening angles between every pair of them and between each of
+        them and the angle reference line (the beam direction), if it has
+        been drawn, and show them in the vertex side panel.
+        """
+
+        if not self.vertexTracks:
+            return
+
+        # collect the parameters of the circles fitted to the vertex tracks
+        # into arrays, as returned by circlefit.fitCircles
+        circleParams = {
+            key: np.array([track['circle'].get(key, 0)
+                           for track in self.vertexTracks])
+            for key in ('centerX', 'centerY', 'centerXErr', 'centerYErr',
+                        'centerCovXY')}
+        startX, startY = np.array([track['startPoint']
+                                   for track in self.vertexTracks]).T
+        endX, endY = np.array([track['endPoint']
+                               for track in self.vertexTracks]).T
+
+        # the beam direction is given by the angle reference line
+        labels = ["Track {}".format(i + 1)
+                  for i in range(len(self.vertexTracks))]
+        if self.angleRefLine.finalPoint:
+            beamLine = self.angleRefLine.getCoordinates()
+            labels.append("Beam")
+        else:
+            beamLine = None
+
+        # the angles take no time to compute for the few tracks at a vertex,
+        # so compute them directly rather than on a worker thread, where they
+        # would be discarded along with the track calculations whenever the
+        # markers change
+        self.showVertexAngles(labels, measure.vertexAngles(
+            circleParams, startX, startY, endX, endY, beamLine))
+
+    def showVertexAngles(self, labels, result):
+        """Show the opening angles calculated by calcVertexAngles in the
+        vertex side panel and print the track directions to the console.
+        labels are the names of the tracks (and of the beam) and result is
+        the (directions, directionErrs, angles, angleErrs) tuple returned by
+        measure.vertexAngles.
+        """
+
+        directions, directionErrs, angles, angleErrs = result
+
+        # fill the table with the opening angle between every pair
+        self.vertexTable.clear()
+        self.vertexTable.setRowCount(len(labels))
+        self.vertexTable.setColumnCount(len(labels))
+        self.vertexTable.setHorizontalHeaderLabels(labels)
+        self.vertexTable.setVerticalHeaderLabels(labels)
+        for row in range(len(labels)):
+            for column in range(len(labels)):
+                cellText = "{:.2f} +/- {:.2f}".format(angles[row, column],
+                                                      angleErrs[row, column])
+                self.vertexTable.setItem(row, column,
+                                         QtWidgets.QTableWidgetItem(cellText))
+        self.vertexTable.resizeColumnsToContents()
+        self.vertexWidget.setVisible(True)
+
+        # print the direction of each track to the console
+        self.displayMessage("---Vertex Tracks---")
+        for label, direction, directionErr in zip(labels, directions,
+                                                  directionErrs):
+            self.displayMessage("{} direction:\t{:.5f} +/- {:.5f}".format(
+                label, direction, directionErr))
+
+    def clearVertex(self):
+        """Remove all the vertex tracks and hide the vertex side panel."""
+
+        self.vertexTracks = []
+        self.vertexTable.clear()
+        self.vertexTable.setRowCount(0)
+        self.vertexTable.setColumnCount(0)
+        self.vertexWidget.setVisible(False)
+
+    def calcFinished(self, taskName, context, result):
+        """Pass the result of a calculation that finished on a worker thread
+        to the handler for its task. context is the value that was submitted
+        along with the calculation.
+        """
+
+        if taskName == 'momentum':
+            self.momentumCalculated(result)
+        elif taskName == 'density':
+            self.densityCalculated(*(context + (result,)))
+        elif taskName == 'dlscan':
+            self.dLScanCalculated(result)
+        elif taskName == 'profile':
+            self.densityProfileCalculated(*(context + (result,)))
+        elif taskName == 'momentumprofile':
+            self.momentumProfileCalculated(*(context + (result,)))
+        elif taskName == 'montecarlo':
+            self.monteCarloCalculated(result)
+
+        elif taskName == 'angle':
+            self.angleCalculated(result)
+
+    def imageTaskFinished(self, taskName, context, result):
+        """Handle the result of an image preparation task that finished on a
+        worker thread. context is the TiledImage the task was submitted for.
+        """
+
+        # ignore results for images that are no longer displayed
+        if context is not self.sceneImage:
+            return
+
+        # add the levels of the image pyramid to the image and repaint it so
+        # that they are used
+        if taskName == 'pyramid':
+            self.sceneImage.levels = [self.sceneImage.pixels] + result
+            self.scenePixmap.update()
+
+    def updateProgressBar(self):
+        """Show the progress bar while any calculations or image preparation
+        tasks are running in the background, otherwise hide it.
+        """
+
+        self.calcProgressBar.setVisible(self.calcDispatcher.isBusy() or
+                                        self.imageDispatcher.isBusy())
+
+    def calcFailed(self, taskName, errorMessage):
+        """Print the error message of a calculation that failed on a worker
+        thread to the console.
+        """
+
+        self.displayMessage("NOTICE: Calculation failed ({}):\n{}".format(
+            taskName, errorMessage))
+
     ##############################
     # Mode Change Event Handlers
     ##############################
@@ -707,6 +1447,71 @@ class MainWidget(skeleton.GuiSkeleton):
         dl = float(newDL)
         self.momentumArc.updateArcs(dl)
 
+    def updateLiveFit(self):
+        """Refit a circle to the track markers using the marker list's live
+        (incremental) circle fit, redraw the momentum arc using it if the
+        start and end points have been selected, and show its radius and the
+        corresponding momentum in the live fit label. Any full fit done by
+        calcTrackMomentum no longer matches the markers, so discard it.
+        """
+
+        # the full fit and the tangent line computed from it are out of date,
+        # as are any calculations still running for the old markers and the
+        # optical density profile
+        self.calcDispatcher.cancel()
+        self.fittedCircle = None
+        self.densityProfile = None
+        self.profilePlot.clear()
+        self.momentumProfile = None
+        self.profileOverlay.reset()
+        self.markerList.flagOutliers()
+        if self.tangentLine:
+            self.tangentLine.scene().removeItem(self.tangentLine)
+            self.tangentLine = None
+
+        # fit a circle to the markers. This takes the same time regardless of
+        # the number of markers
+        liveCircle = self.markerList.liveFit.fit()
+
+        # if there are too few markers (or they lie on a line), remove the
+        # momentum arc since it no longer matches the markers
+        if liveCircle is None or not math.isfinite(liveCircle['radius']):
+            self.liveFitLabel.setText("Live Fit: -")
+            self.momentumArc.reset()
+            return
+
+        self.liveFitLabel.setText(
+            "Live Fit: R = {:.1f} px, p = {:.2f} MeV/c".format(
+                liveCircle['radius'],
+                momentum.trackMomentum(liveCircle['radius'], 0,
+                                       constants.CMPERPX, constants.ERRCMPERPX,
+                                       constants.MAGNETICFIELD,
+                                       constants.C)[0]))
+
+        # redraw the momentum arc between the start and end points if they
+        # have been selected
+        startPoint = self.markerList.getStartPoint()
+        endPoint = self.markerList.getEndPoint()
+        if not (startPoint and endPoint):
+            self.momentumArc.reset()
+            return
+
+        startAngle, spanAngle = anglecalc.arcAngles(
+            liveCircle,
+            *(startPoint.getCoordinates() + endPoint.getCoordinates()))
+
+        # get the dL value from the dL text box. If the box is empty, use
+        # a value of 0
+        if self.dlLineEdit.text():
+            dl = float(self.dlLineEdit.text())
+        else:
+            dl = 0
+
+        self.momentumArc.draw(
+            liveCircle['centerX'], liveCircle['centerY'],
+            liveCircle['radius'], startAngle, spanAngle, dl,
+            self.lineWidth, self.scene)
+
     def highlightPoint(self):
         """Highlight the track marker that is currently selected."""
 
@@ -720,10 +1525,17 @@ class MainWidget(skeleton.GuiSkeleton):
         messages from the console, reset image zoom and reset dL.
         """
 
+        # discard any calculations that are still running
+        self.calcDispatcher.cancel()
+
+        # remove the vertex tracks
+        self.clearVertex()
+
         # remove all points, arcs and lines from the graphics scene
         self.markerList.empty()
         self.angleRefLine.reset()
         self.momentumArc.reset()
+        self.profileOverlay.reset()
         if self.tangentLine:
             self.tangentLine.scene().removeItem(self.tangentLine)
             self.tangentLine = None
@@ -739,7 +1551,7 @@ class MainWidget(skeleton.GuiSkeleton):
 
         # scale the image so that it fills as much of the graphics view as it
         # can without requiring scroll bars
-        if not self.sceneImage.isNull():
+        if self.sceneImage is not None:
             # determine how many times smaller (or larger) the graphics view
             # height is than the image height. Same for the widths.
             # note: the graphics view object has 2 extra pixels of height and
@@ -18,7 +18,9 @@
 import sys
 import os
 from PyQt5 import QtCore, QtGui, QtWidgets
-from traxis.graphics import markers, angleref, fittedarc
+from traxis import constants
+from traxis.graphics import markers, angleref, fittedarc, tiledimage, \
+                            profileplot
 
 
 class GuiSkeleton(QtWidgets.QWidget):
@@ -134,6 +136,49 @@ class GuiSkeleton(QtWidgets.QWidget):
         self.calcDensityButton.setToolTip("Calculate Optical Density")
         self.calcDensityButton.setShortcut(QtGui.QKeySequence("N"))
 
+        # dL scan button widget
+        self.dlScanButton = QtWidgets.QPushButton(self)
+        self.techButtonLayout.addWidget(self.dlScanButton)
+        # don't focus on this widget when clicked
+        self.dlScanButton.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.dlScanButton.setText("Scan dL")
+        self.dlScanButton.setToolTip(
+            "Calculate Optical Density for every dL and find its plateau")
+        self.dlScanButton.setShortcut(QtGui.QKeySequence("J"))
+
+        # optical density profile button widget
+        self.densityProfileButton = QtWidgets.QPushButton(self)
+        self.techButtonLayout.addWidget(self.densityProfileButton)
+        # don't focus on this widget when clicked
+        self.densityProfileButton.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.densityProfileButton.setText("Optical Density Profile")
+        self.densityProfileButton.setToolTip(
+            "Calculate Optical Density along the track in segments of the "
+            "profile bin length")
+        self.densityProfileButton.setShortcut(QtGui.QKeySequence("K"))
+
+        # momentum profile button widget
+        self.momentumProfileButton = QtWidgets.QPushButton(self)
+        self.techButtonLayout.addWidget(self.momentumProfileButton)
+        # don't focus on this widget when clicked
+        self.momentumProfileButton.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.momentumProfileButton.setText("Momentum Profile")
+        self.momentumProfileButton.setToolTip(
+            "Calculate momentum along the track by fitting windows of "
+            "consecutive markers")
+        self.momentumProfileButton.setShortcut(QtGui.QKeySequence("U"))
+
+        # Monte Carlo errors button widget
+        self.monteCarloButton = QtWidgets.QPushButton(self)
+        self.techButtonLayout.addWidget(self.monteCarloButton)
+        # don't focus on this widget when clicked
+        self.monteCarloButton.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.monteCarloButton.setText("Monte Carlo Errors")
+        self.monteCarloButton.setToolTip(
+            "Propagate the marker, calibration and dL uncertainties through "
+            "the whole measurement with smeared replicas of the track")
+        self.monteCarloButton.setShortcut(QtGui.QKeySequence("E"))
+
         # calculate angle button widget
         self.calcAngleButton = QtWidgets.QPushButton(self)
         self.techButtonLayout.addWidget(self.calcAngleButton)
@@ -143,6 +188,45 @@ class GuiSkeleton(QtWidgets.QWidget):
         self.calcAngleButton.setToolTip("Calculate Opening Angle")
         self.calcAngleButton.setShortcut(QtGui.QKeySequence("B"))
 
+        # add track to vertex button widget
+        self.addVertexTrackButton = QtWidgets.QPushButton(self)
+        self.techButtonLayout.addWidget(self.addVertexTrackButton)
+        # don't focus on this widget when clicked
+        self.addVertexTrackButton.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.addVertexTrackButton.setText("Add Track to Vertex")
+        self.addVertexTrackButton.setToolTip(
+            "Add the fitted track to the vertex at its start point and "
+            "calculate the opening angles between all the vertex tracks and "
+            "the angle reference line")
+        self.addVertexTrackButton.setShortcut(QtGui.QKeySequence("T"))
+
+        # clear vertex button widget
+        self.clearVertexButton = QtWidgets.QPushButton(self)
+        self.techButtonLayout.addWidget(self.clearVertexButton)
+        # don't focus on this widget when clicked
+        self.clearVertexButton.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.clearVertexButton.setText("Clear Vertex")
+        self.clearVertexButton.setToolTip("Remove all the vertex tracks")
+        self.clearVertexButton.setShortcut(QtGui.QKeySequence("Y"))
+
+        # live fit label, showing the radius and momentum of a circle fitted
+        # to the track markers as they are placed or moved
+        self.liveFitLabel = QtWidgets.QLabel(self)
+        self.techButtonLayout.addWidget(self.liveFitLabel)
+        self.liveFitLabel.setText("Live Fit: -")
+        self.liveFitLabel.setToolTip(
+            "Live circle fit to the track markers (no errors, press "
+            "Calculate Track Momentum for the full fit)")
+
+        # calculation progress bar widget, shown (as a busy indicator) while
+        # calculations are running in the background
+        self.calcProgressBar = QtWidgets.QProgressBar(self)
+        self.techButtonLayout.addWidget(self.calcProgressBar)
+        self.calcProgressBar.setRange(0, 0)
+        self.calcProgressBar.setTextVisible(False)
+        self.calcProgressBar.setToolTip("Calculating...")
+        self.calcProgressBar.setVisible(False)
+
         # add stretch to segment to keep widgets together
         self.techButtonLayout.addStretch(0)
 
@@ -170,6 +254,39 @@ class GuiSkeleton(QtWidgets.QWidget):
         self.openImageButton.setToolTip("Open image for analysis")
         self.openImageButton.setShortcut(QtGui.QKeySequence("O"))
 
+        # open scan queue button widget
+        self.openScanQueueButton = QtWidgets.QPushButton(self)
+        self.userSelectionLayout.addWidget(self.openScanQueueButton)
+        # don't focus on this widget when clicked
+        self.openScanQueueButton.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.openScanQueueButton.setText("Open Scan Queue")
+        self.openScanQueueButton.setToolTip(
+            "Open a directory of frames to analyse one after another")
+        self.openScanQueueButton.setShortcut(QtGui.QKeySequence("Q"))
+
+        # horizontal layout for previous and next frame buttons
+        self.frameLayout = QtWidgets.QHBoxLayout()
+        self.userSelectionLayout.addLayout(self.frameLayout)
+
+        # previous frame button widget
+        self.prevFrameButton = QtWidgets.QPushButton(self)
+        self.frameLayout.addWidget(self.prevFrameButton)
+        # don't focus on this widget when clicked
+        self.prevFrameButton.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.prevFrameButton.setText("Prev Frame")
+        self.prevFrameButton.setToolTip("Open the previous frame of the scan "
+                                        "queue")
+        self.prevFrameButton.setShortcut(QtGui.QKeySequence("PgUp"))
+
+        # next frame button widget
+        self.nextFrameButton = QtWidgets.QPushButton(self)
+        self.frameLayout.addWidget(self.nextFrameButton)
+        # don't focus on this widget when clicked
+        self.nextFrameButton.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.nextFrameButton.setText("Next Frame")
+        self.nextFrameButton.setToolTip("Open the next frame of the scan queue")
+        self.nextFrameButton.setShortcut(QtGui.QKeySequence("PgDown"))
+
         # horizontal layout for save and load buttons
         self.saveLayout = QtWidgets.QHBoxLayout()
         self.userSelectionLayout.addLayout(self.saveLayout)
@@ -252,6 +369,76 @@ class GuiSkeleton(QtWidgets.QWidget):
         self.dlLineEdit.setValidator(
             QtGui.QRegExpValidator(QtCore.QRegExp('[0-9]+\.?[0-9]*')))
 
+        # profile bin length label
+        self.binLengthLabel = QtWidgets.QLabel(self)
+        self.dlFormLayout.setWidget(
+            1, QtWidgets.QFormLayout.LabelRole, self.binLengthLabel)
+        self.binLengthLabel.setText("Profile Bin [px]")
+
+        # profile bin length text box (line edit) widget
+        self.binLengthLineEdit = QtWidgets.QLineEdit(self)
+        # fix the size of the text box
+        self.binLengthLineEdit.setSizePolicy(
+            QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Fixed)
+        self.dlFormLayout.setWidget(
+            1, QtWidgets.QFormLayout.FieldRole, self.binLengthLineEdit)
+        # set the default bin length
+        self.binLengthLineEdit.setText(str(constants.DEFAULTPROFILEBINLENGTH))
+        # validate the contents of the text box so that only floats can
+        # be entered
+        self.binLengthLineEdit.setValidator(
+            QtGui.QRegExpValidator(QtCore.QRegExp('[0-9]+\.?[0-9]*')))
+
+        # area weighting check box widget
+        self.areaWeightingCheckBox = QtWidgets.QCheckBox(self)
+        self.dlFormLayout.setWidget(
+            2, QtWidgets.QFormLayout.SpanningRole, self.areaWeightingCheckBox)
+        self.areaWeightingCheckBox.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.areaWeightingCheckBox.setText("Area Weighted dL")
+        self.areaWeightingCheckBox.setToolTip(
+            "Weight each pixel in the optical density calculation by the "
+            "fraction of it covered by the dL region.")
+
+        # background subtraction check box widget
+        self.backgroundCheckBox = QtWidgets.QCheckBox(self)
+        self.dlFormLayout.setWidget(
+            3, QtWidgets.QFormLayout.SpanningRole, self.backgroundCheckBox)
+        self.backgroundCheckBox.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.backgroundCheckBox.setText("Subtract Background")
+        self.backgroundCheckBox.setToolTip(
+            "Subtract the background blackness measured on either side of "
+            "the track from the optical density.")
+
+        # momentum profile window label
+        self.profileWindowLabel = QtWidgets.QLabel(self)
+        self.dlFormLayout.setWidget(
+            4, QtWidgets.QFormLayout.LabelRole, self.profileWindowLabel)
+        self.profileWindowLabel.setText("Profile Window [markers]")
+
+        # momentum profile window text box (line edit) widget
+        self.profileWindowLineEdit = QtWidgets.QLineEdit(self)
+        # fix the size of the text box
+        self.profileWindowLineEdit.setSizePolicy(
+            QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Fixed)
+        self.dlFormLayout.setWidget(
+            4, QtWidgets.QFormLayout.FieldRole, self.profileWindowLineEdit)
+        # set the default window size
+        self.profileWindowLineEdit.setText(str(constants.DEFAULTPROFILEWINDOW))
+        # validate the contents of the text box so that only integers can
+        # be entered
+        self.profileWindowLineEdit.setValidator(
+            QtGui.QRegExpValidator(QtCore.QRegExp('[0-9]+')))
+
+        # robust fit check box widget
+        self.robustFitCheckBox = QtWidgets.QCheckBox(self)
+        self.dlFormLayout.setWidget(
+            5, QtWidgets.QFormLayout.SpanningRole, self.robustFitCheckBox)
+        self.robustFitCheckBox.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.robustFitCheckBox.setText("Robust Fit")
+        self.robustFitCheckBox.setToolTip(
+            "Fit the track circle so that outlying markers don't pull it, "
+            "and flag the outliers.")
+
         # add stretch to segment to keep widgets together
         self.userSelectionLayout.addStretch(0)
 
@@ -306,11 +493,49 @@ class GuiSkeleton(QtWidgets.QWidget):
         self.sceneView.setMinimumWidth(900)
         self.sceneView.setMinimumHeight(400)
 
-        # instantiate QImage and PixmapItem
-        self.sceneImage = QtGui.QImage()
-        self.scenePixmap = QtWidgets.QGraphicsPixmapItem()
+        # optical density profile side panel, shown once a profile has been
+        # calculated
+        self.profileWidget = QtWidgets.QWidget(self)
+        self.bottomUiLayout.addWidget(self.profileWidget)
+        self.profileLayout = QtWidgets.QVBoxLayout(self.profileWidget)
+        self.profileLayout.setContentsMargins(0, 0, 0, 0)
+        self.profileLabel = QtWidgets.QLabel(self)  # profile label
+        self.profileLayout.addWidget(self.profileLabel)
+        self.profileLabel.setText("Optical Density Profile [1/cm]")
+        self.profilePlot = profileplot.ProfilePlot(self)  # profile plot
+        self.profileLayout.addWidget(self.profilePlot)
+        self.profileWidget.setFixedWidth(300)
+        self.profileWidget.setVisible(False)
+
+        # vertex opening angle side panel, shown once tracks have been added
+        # to the vertex
+        self.vertexWidget = QtWidgets.QWidget(self)
+        self.bottomUiLayout.addWidget(self.vertexWidget)
+        self.vertexLayout = QtWidgets.QVBoxLayout(self.vertexWidget)
+        self.vertexLayout.setContentsMargins(0, 0, 0, 0)
+        self.vertexLabel = QtWidgets.QLabel(self)  # vertex label
+        self.vertexLayout.addWidget(self.vertexLabel)
+        self.vertexLabel.setText("Vertex Opening Angles [deg]")
+        # vertex opening angle table, read only
+        self.vertexTable = QtWidgets.QTableWidget(self)
+        self.vertexLayout.addWidget(self.vertexTable)
+        self.vertexTable.setEditTriggers(
+            QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.vertexTable.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.vertexWidget.setFixedWidth(300)
+        self.vertexWidget.setVisible(False)
+
+        # the loaded image is a TiledImage, which is set to None while no image
+        # is loaded, and is displayed by a TiledImageItem
+        self.sceneImage = None
+        self.scenePixmap = tiledimage.TiledImageItem()
         self.scene.addItem(self.scenePixmap)
 
+        # the blackness plane is a (memory-mapped) numpy array containing the
+        # blackness of each pixel of sceneImage. It is set to None while no
+        # image is loaded
+        self.sceneBlackness = None
+
         # instantiate reference line and momentum arc objects
         self.angleRefLine = angleref.ReferenceLine()
         self.momentumArc = fittedarc.MomentumArc()
@@ -0,0 +1,184 @@
+# Copyright (C) 2014 Syed Haider Abidi, Nooruddin Ahmed and Christopher Dydula
+#
+# This file is part of traxis.
+#
+# traxis is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# traxis is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with traxis.  If not, see <http://www.gnu.org/licenses/>.
+
+import traceback
+from PyQt5 import QtCore
+
+
+class CalcWorker(QtCore.QRunnable):
+
+    """Subclass of QRunnable which runs a single calculation on a thread pool
+    thread. The calculation is given snapshots of all its inputs, so that it
+    never touches GUI objects, and its result is posted back to the
+    dispatcher that started it.
+    """
+
+    def __init__(self, dispatcher, taskName, requestId, context, function,
+                 args):
+        """Store the dispatcher that the result should be posted to, the name
+        of the task, the id of the request, the context to post back along
+        with the result, the function to run and the arguments to call it
+        with.
+        """
+
+        super().__init__()
+
+        self.dispatcher = dispatcher
+        self.taskName = taskName
+        self.requestId = requestId
+        self.context = context
+        self.function = function
+        self.args = args
+
+    def run(self):
+        """Run the calculation and post the result (or the error message if
+        the calculation failed) back to the dispatcher. The dispatcher's
+        signal is emitted from the worker thread, so it is queued and
+        delivered on the GUI thread. If the request was superseded or
+        cancelled while it was waiting in the pool's queue, return without
+        running the calculation.
+        """
+
+        if self.dispatcher.isStale(self.taskName, self.requestId):
+            return
+
+        try:
+            result = self.function(*self.args)
+        except Exception:
+            self.dispatcher.workerDone.emit(self.taskName, self.requestId,
+                                            self.context, False,
+                                            traceback.format_exc())
+        else:
+            self.dispatcher.workerDone.emit(self.taskName, self.requestId,
+                                            self.context, True, result)
+
+
+class CalcDispatcher(QtCore.QObject):
+
+    """Subclass of QObject which runs named calculation tasks on a thread pool.
+    Only the latest request for each task is kept: submitting a new request
+    for a task supersedes any older request for it, and the results of
+    superseded or cancelled requests are discarded when they arrive.
+    """
+
+    # signal emitted with the task name, the context and the result of its
+    # latest request
+    resultReady = QtCore.pyqtSignal(str, object, object)
+    # signal emitted with the task name and an error message when the latest
+    # request for a task fails
+    calcFailed = QtCore.pyqtSignal(str, str)
+    # signal emitted when the dispatcher starts or stops having requests in
+    # progress
+    busyChanged = QtCore.pyqtSignal(bool)
+    # signal emitted by workers with the task name, the request id, the
+    # context, whether the calculation succeeded and its result
+    workerDone = QtCore.pyqtSignal(str, int, object, bool, object)
+
+    def __init__(self, parent=None):
+        """Create the thread pool and the bookkeeping for the requests in
+        progress.
+        """
+
+        super().__init__(parent)
+
+        self.threadPool = QtCore.QThreadPool(self)
+        # the id of the latest request for each task in progress
+        self.latestRequest = {}
+        # the id of the last request submitted
+        self.requestCount = 0
+
+        self.workerDone.connect(self.collect)
+
+    def isBusy(self):
+        """Return True if any requests are in progress, otherwise return
+        False.
+        """
+
+        return bool(self.latestRequest)
+
+    def isStale(self, taskName, requestId):
+        """Return True if the request with id requestId for taskName has been
+        superseded or cancelled, otherwise return False. This is called from
+        worker threads, so it only reads latestRequest.
+        """
+
+        return self.latestRequest.get(taskName) != requestId
+
+    def submit(self, taskName, context, function, *args):
+        """Cancel any request in progress for taskName and start a new request
+        which calls function with args on the thread pool. context is passed
+        back unchanged along with the result. Return the id of the new
+        request.
+        """
+
+        wasBusy = self.isBusy()
+
+        # supersede any older request for this task
+        self.cancel(taskName, notify=False)
+
+        self.requestCount += 1
+        self.latestRequest[taskName] = self.requestCount
+        # the thread pool takes ownership of the worker and deletes it once it
+        # has run
+        self.threadPool.start(CalcWorker(self, taskName, self.requestCount,
+                                         context, function, args))
+
+        if not wasBusy:
+            self.busyChanged.emit(True)
+
+        return self.requestCount
+
+    def cancel(self, taskName=None, notify=True):
+        """Cancel the request in progress for taskName, or all requests in
+        progress if taskName is None. Requests that haven't started yet are
+        skipped when the thread pool gets to them; the results of requests
+        that are already running are discarded when they arrive. If notify is
+        True, emit busyChanged if no requests are left in progress.
+        """
+
+        wasBusy = self.isBusy()
+
+        if taskName is None:
+            taskNames = list(self.latestRequest)
+        else:
+            taskNames = [taskName]
+
+        for name in taskNames:
+            self.latestRequest.pop(name, None)
+
+        if notify and wasBusy and not self.isBusy():
+            self.busyChanged.emit(False)
+
+    def collect(self, taskName, requestId, context, succeeded, result):
+        """Receive the result of a request from a worker. Discard it if the
+        request has been superseded or cancelled, otherwise emit resultReady
+        (or calcFailed if the calculation failed).
+        """
+
+        # discard stale results
+        if self.isStale(taskName, requestId):
+            return
+
+        del self.latestRequest[taskName]
+
+        if not self.isBusy():
+            self.busyChanged.emit(False)
+
+        if succeeded:
+            self.resultReady.emit(taskName, context, result)
+        else:
+            self.calcFailed.emit(taskName, result)
@@ -0,0 +1,79 @@
+# Copyright (C) 2014 Syed Haider Abidi, Nooruddin Ahmed and Christopher Dydula
+#
+# This file is part of traxis.
+#
+# traxis is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# traxis is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with traxis.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+from PyQt5 import QtGui
+
+
+def rgb32Image(image):
+    """Given image, a QImage, return it converted so that its pixels are
+    stored as 32 bit RGB, i.e. every pixel is a single 0xAARRGGBB integer. If
+    the image is already in this format, no conversion (or copy) takes place.
+    """
+
+    if image.format() in (QtGui.QImage.Format_RGB32,
+                          QtGui.QImage.Format_ARGB32):
+        return image
+    return image.convertToFormat(QtGui.QImage.Format_RGB32)
+
+def pixelView(image):
+    """Given image, a QImage returned by rgb32Image, return a 2D uint32 numpy
+    array (indexed as [y, x]) viewing its pixels without copying them. The
+    array is only valid for as long as image is.
+    """
+
+    # view the image buffer as an array of 32 bit integers. Each scan line may
+    # be padded at its end, so reshape using the number of bytes per line and
+    # then drop the padding
+    pixelPtr = image.constBits()
+    pixelPtr.setsize(image.byteCount())
+    return np.frombuffer(pixelPtr, np.uint32).reshape(
+        image.height(), image.bytesPerLine() // 4)[:, :image.width()]
+
+def blacknessFromPixels(pixels, plane=None):
+    """Given pixels, a 2D uint32 numpy array of 0xAARRGGBB integers, return a
+    float32 array of the same shape containing the blackness of every pixel
+    (see blacknessPlane). If plane, an array of the right shape and type (e.g.
+    a memory-mapped file), is given, the blackness is written into it.
+    """
+
+    if plane is None:
+        plane = np.empty(pixels.shape, dtype=np.float32)
+
+    # the black component of a colour in the CMYK model is 1 minus the largest
+    # of its red, green and blue components (all taken between 0 and 1).
+    # Compute it one scan line block at a time to avoid creating full size
+    # integer temporaries for large images
+    blockSize = 256
+    for top in range(0, pixels.shape[0], blockSize):
+        block = pixels[top:top + blockSize]
+        maxComponent = np.maximum(np.maximum((block >> 16) & 0xff,
+                                             (block >> 8) & 0xff),
+                                  block & 0xff)
+        plane[top:top + blockSize] = (255 - maxComponent) / np.float32(255)
+
+    return plane
+
+def blacknessPlane(image):
+    """Given image, a QImage, return a 2D float32 numpy array (indexed as
+    [y, x]) containing the blackness of every pixel of the image. The
+    blackness of a pixel is the same as that returned by
+    QtGui.QColor(pixel).blackF().
+    """
+
+    image = rgb32Image(image)
+    return blacknessFromPixels(pixelView(image))
@@ -0,0 +1,92 @@
+# Copyright (C) 2014 Syed Haider Abidi, Nooruddin Ahmed and Christopher Dydula
+#
+# This file is part of traxis.
+#
+# traxis is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# traxis is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with traxis.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import numpy as np
+from traxis.imaging import tiles
+
+
+def downsample(pixels, out=None):
+    """Given pixels, a 2D uint32 numpy array of 0xAARRGGBB integers, return an
+    array half its size (rounded up) in each dimension in which each pixel is
+    the average of the corresponding 2x2 block of pixels. The last row and
+    column are repeated if the size of pixels is odd. If out, an array of the
+    right shape and type (e.g. a memory-mapped file), is given, the result is
+    written into it.
+    """
+
+    height, width = pixels.shape
+    if out is None:
+        out = np.empty(((height + 1) // 2, (width + 1) // 2), dtype=np.uint32)
+
+    # average one block of output rows at a time to avoid creating full size
+    # temporaries for large images
+    blockSize = 256
+    for top in range(0, out.shape[0], blockSize):
+        block = pixels[2 * top:2 * (top + blockSize)]
+
+        # repeat the last row and column if there is an odd number of them
+        if block.shape[0] % 2:
+            block = np.concatenate((block, block[-1:]), axis=0)
+        if width % 2:
+            block = np.concatenate((block, block[:, -1:]), axis=1)
+
+        # average the red, green and blue components separately, rounding to
+        # the nearest integer, and make the result opaque
+        result = np.full((block.shape[0] // 2, block.shape[1] // 2),
+                         0xff000000, dtype=np.uint32)
+        for shift in (16, 8, 0):
+            component = (block >> shift) & 0xff
+            componentSum = component[0::2, 0::2] + component[1::2, 0::2] + \
+                           component[0::2, 1::2] + component[1::2, 1::2]
+            result |= ((componentSum + 2) // 4) << shift
+        out[top:top + blockSize] = result
+
+    return out
+
+def buildPyramid(tiledImage):
+    """Given tiledImage, a TiledImage, return a list of the pixels of each
+    level of its image pyramid above level 0, i.e. of the image successively
+    halved in size until it fits in a single tile. If the image is cached,
+    the levels are written to (or, if already built, read from) its cache
+    files and returned as memory-mapped arrays.
+    """
+
+    levels = []
+    previous = tiledImage.pixels
+    while max(previous.shape) > tiles.TILESIZE:
+        shape = ((previous.shape[0] + 1) // 2, (previous.shape[1] + 1) // 2)
+
+        # without a cache, keep the levels in memory
+        if tiledImage.cachePath is None:
+            levels.append(downsample(previous))
+            previous = levels[-1]
+            continue
+
+        # build the level into the cache unless it has already been built.
+        # Cache files are moved into place once complete, so an existing level
+        # file is always complete
+        levelPath = "{}.level{}".format(tiledImage.cachePath, len(levels) + 1)
+        if not os.path.exists(levelPath):
+            tiles.writeCacheArray(os.path.dirname(levelPath), levelPath, shape,
+                                  np.uint32,
+                                  lambda level: downsample(previous, level))
+
+        levels.append(np.memmap(levelPath, np.uint32, 'r', shape=shape))
+        previous = levels[-1]
+
+    return levels
@@ -0,0 +1,215 @@
+# Copyright (C) 2014 Syed Haider Abidi, Nooruddin Ahmed and Christopher Dydula
+#
+# This file is part of traxis.
+#
+# traxis is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# traxis is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with traxis.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import collections
+import concurrent.futures
+from traxis import constants
+from traxis.imaging import pyramid, tiles
+
+
+# the file extensions of the images that are included in a scan queue
+IMAGEEXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff')
+
+
+def loadFrame(fileName):
+    """Given the file name of an image, return a TiledImage of it with its
+    blackness plane and image pyramid built, or None if the file can't be
+    opened as an image.
+    """
+
+    tiledImage = tiles.openTiledImage(fileName)
+    if tiledImage is not None:
+        tiledImage.levels = [tiledImage.pixels] + \
+                            pyramid.buildPyramid(tiledImage)
+    return tiledImage
+
+def frameBytes(tiledImage):
+    """Given a TiledImage, return the number of bytes taken up by its pixels,
+    blackness plane and image pyramid.
+    """
+
+    return tiledImage.blackness.nbytes + \
+           sum(level.nbytes for level in tiledImage.levels)
+
+
+class ScanQueue(object):
+
+    """A directory of scanned frames which are analysed one after another.
+    While the current frame is being analysed, the next few frames are
+    loaded (decoded, with their blackness planes and image pyramids built) on
+    a thread pool, so that moving to the next frame doesn't have to wait for
+    the frame to load. Loaded frames are kept in a least recently used cache
+    bounded in bytes.
+    """
+
+    def __init__(self, directory, prefetchCount=None, maxBytes=None):
+        """Instantiate a ScanQueue object with the frames in directory, in
+        file name order. prefetchCount is the number of frames after the
+        current one to load in the background and maxBytes the maximum size
+        of the cache of loaded frames (constants.SCANQUEUEPREFETCH and
+        constants.SCANQUEUEMAXBYTES if None).
+        """
+
+        self.directory = directory
+        self.fileNames = sorted(
+            os.path.join(directory, entryName)
+            for entryName in os.listdir(directory)
+            if os.path.splitext(entryName)[1].lower() in IMAGEEXTENSIONS)
+
+        if prefetchCount is None:
+            prefetchCount = constants.SCANQUEUEPREFETCH
+        if maxBytes is None:
+            maxBytes = constants.SCANQUEUEMAXBYTES
+        self.prefetchCount = prefetchCount
+        self.maxBytes = maxBytes
+
+        # the index of the current frame in fileNames, or None before the
+        # first frame has been requested
+        self.index = None
+
+        # loaded frames, keyed by file name and ordered from least to most
+        # recently used, along with their total size
+        self.cache = collections.OrderedDict()
+        self.cacheBytes = 0
+
+        # futures of the frames being loaded, keyed by file name
+        self.pending = {}
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max(prefetchCount, 1))
+
+    def __len__(self):
+        """Return the number of frames in the queue."""
+
+        return len(self.fileNames)
+
+    def fileName(self):
+        """Return the file name of the current frame, or None if there isn't
+        one.
+        """
+
+        if self.index is None:
+            return None
+        return self.fileNames[self.index]
+
+    def frame(self, index):
+        """Make the frame at index the current frame and return it as a
+        TiledImage (None if it can't be opened as an image). If the frame
+        hasn't been loaded yet, wait for it to load. Then start loading the
+        frames following it. An error raised while loading the frame is
+        raised again here, with the frame still made the current one and the
+        following frames still loaded.
+        """
+
+        self.index = index
+        fileName = self.fileNames[index]
+
+        # collect the frames that finished loading in the background
+        self.collect()
+
+        try:
+            if fileName in self.cache:
+                self.cache.move_to_end(fileName)
+                tiledImage = self.cache[fileName]
+            else:
+                # wait for the frame if it is being loaded, otherwise load it
+                # now
+                future = self.pending.pop(fileName, None)
+                if future is not None:
+                    tiledImage = future.result()
+                else:
+                    tiledImage = loadFrame(fileName)
+                self.store(fileName, tiledImage)
+        finally:
+            self.prefetch()
+
+        return tiledImage
+
+    def next(self):
+        """Move to the next frame and return it (see frame). Return None if
+        the current frame is the last one.
+        """
+
+        if self.index is None:
+            index = 0
+        else:
+            index = self.index + 1
+        if index >= len(self.fileNames):
+            return None
+        return self.frame(index)
+
+    def previous(self):
+        """Move to the previous frame and return it (see frame). Return None
+        if the current frame is the first one.
+        """
+
+        if not self.index:
+            return None
+        return self.frame(self.index - 1)
+
+    def prefetch(self):
+        """Start loading the frames following the current frame that are
+        neither loaded nor being loaded.
+        """
+
+        for fileName in self.fileNames[self.index + 1:
+                                       self.index + 1 + self.prefetchCount]:
+            if fileName not in self.cache and fileName not in self.pending:
+                self.pending[fileName] = self.executor.submit(loadFrame,
+                                                              fileName)
+
+    def collect(self):
+        """Move the frames that finished loading in the background into the
+        cache. Frames that failed to load are dropped, so that they are loaded
+        again (and the error raised) if they are requested.
+        """
+
+        for fileName, future in list(self.pending.items()):
+            if future.done():
+                del self.pending[fileName]
+                if future.exception() is None:
+                    self.store(fileName, future.result())
+
+    def store(self, fileName, tiledImage):
+        """Add tiledImage, the loaded frame with fileName, to the cache and
+        remove the least recently used frames (other than the current frame)
+        until the cache is within its size limit. Frames that couldn't be
+        opened are not cached.
+        """
+
+        if tiledImage is None:
+            return
+
+        self.cache[fileName] = tiledImage
+        self.cacheBytes += frameBytes(tiledImage)
+
+        for cachedFileName in list(self.cache):
+            if self.cacheBytes <= self.maxBytes:
+                break
+            if cachedFileName == self.fileName():
+                continue
+            self.cacheBytes -= frameBytes(self.cache.pop(cachedFileName))
+
+    def close(self):
+        """Stop loading frames in the background and empty the cache."""
+
+        for future in self.pending.values():
+            future.cancel()
+        self.executor.shutdown(wait=False)
+        self.pending.clear()
+        self.cache.clear()
+        self.cacheBytes = 0
@@ -0,0 +1,102 @@
+# Copyright (C) 2014 Syed Haider Abidi, Nooruddin Ahmed and Christopher Dydula
+#
+# This file is part of traxis.
+#
+# traxis is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# traxis is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with traxis.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import numpy as np
+
+# tifffile is an optional dependency, only needed for reading high bit depth
+# TIFF images
+try:
+    import tifffile
+except ImportError:
+    tifffile = None
+
+
+# the file extensions of TIFF images
+TIFFEXTENSIONS = ('.tif', '.tiff')
+
+
+def readGray16(fileName):
+    """Given the file name of an image, return a 2D uint16 numpy array (indexed
+    as [y, x]) of its raw intensities along with a boolean which is True if 0
+    is white (rather than black) in the image, if it is a 16 bit grayscale
+    TIFF. The array is memory-mapped if the image is stored uncompressed.
+    Otherwise (or if tifffile isn't installed) return None.
+    """
+
+    if tifffile is None or \
+       os.path.splitext(fileName)[1].lower() not in TIFFEXTENSIONS:
+        return None
+
+    try:
+        with tifffile.TiffFile(fileName) as tiffFile:
+            page = tiffFile.pages[0]
+            if page.dtype != np.uint16 or len(page.shape) != 2:
+                return None
+            minIsWhite = page.photometric == tifffile.PHOTOMETRIC.MINISWHITE
+            if page.is_memmappable:
+                return tifffile.memmap(fileName, page=0, mode='r'), minIsWhite
+            return page.asarray(), minIsWhite
+    except (OSError, ValueError, tifffile.TiffFileError):
+        return None
+
+def blacknessFromGray16(intensities, minIsWhite, plane=None):
+    """Given intensities, a 2D uint16 numpy array of grayscale intensities,
+    and minIsWhite, True if 0 is white, return a float32 array of the same
+    shape containing the blackness of every pixel, between 0 (white) and 1
+    (black), at the full 16 bit precision. If plane, an array of the right
+    shape and type (e.g. a memory-mapped file), is given, the blackness is
+    written into it.
+    """
+
+    if plane is None:
+        plane = np.empty(intensities.shape, dtype=np.float32)
+
+    # compute one scan line block at a time so that only a block of a
+    # memory-mapped image is read at once
+    blockSize = 256
+    for top in range(0, intensities.shape[0], blockSize):
+        block = intensities[top:top + blockSize].astype(np.float32)
+        if minIsWhite:
+            plane[top:top + blockSize] = block / np.float32(65535)
+        else:
+            plane[top:top + blockSize] = 1 - block / np.float32(65535)
+
+    return plane
+
+def previewFromGray16(intensities, minIsWhite, pixels=None):
+    """Given intensities, a 2D uint16 numpy array of grayscale intensities,
+    and minIsWhite, True if 0 is white, return a uint32 array of the same
+    shape of 8 bit grayscale 0xAARRGGBB pixels for displaying the image. If
+    pixels, an array of the right shape and type (e.g. a memory-mapped file),
+    is given, the preview is written into it.
+    """
+
+    if pixels is None:
+        pixels = np.empty(intensities.shape, dtype=np.uint32)
+
+    # keep the most significant 8 bits of each intensity, and use them for
+    # the red, green and blue components of an opaque pixel
+    blockSize = 256
+    for top in range(0, intensities.shape[0], blockSize):
+        gray = (intensities[top:top + blockSize] >> 8).astype(np.uint32)
+        if minIsWhite:
+            gray = 255 - gray
+        pixels[top:top + blockSize] = 0xff000000 | (gray << 16) | \
+                                      (gray << 8) | gray
+
+    return pixels
@@ -0,0 +1,284 @@
+# Copyright (C) 2014 Syed Haider Abidi, Nooruddin Ahmed and Christopher Dydula
+#
+# This file is part of traxis.
+#
+# traxis is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# traxis is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with traxis.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import glob
+import json
+import hashlib
+import tempfile
+import numpy as np
+from PyQt5 import QtGui, QtCore
+from traxis import constants
+from traxis.imaging import planes, tiff
+
+
+# the width and height of the square tiles that images are served in
+TILESIZE = 512
+
+
+class TiledImage(object):
+
+    """An image whose pixels (as 0xAARRGGBB integers) and blackness plane are
+    kept in memory-mapped cache files rather than in memory. Only the parts of
+    the image that are actually accessed (e.g. the tiles on screen or the
+    pixels under a measured arc) are read from disk. The image may also have
+    a pyramid of successively halved copies of its pixels (see
+    pyramid.buildPyramid) for displaying it zoomed out.
+    """
+
+    def __init__(self, pixels, blackness, cachePath=None):
+        """Instantiate a TiledImage object with pixels, a 2D uint32 array
+        (indexed as [y, x]) of the image's pixels and blackness, a float32
+        array of the same shape containing the blackness of each pixel (see
+        planes.blacknessPlane). cachePath is the path (without extension) of
+        the image's cache files, or None if it isn't cached.
+        """
+
+        self.pixels = pixels
+        self.blackness = blackness
+        self.cachePath = cachePath
+
+        # the pixels of each level of the image pyramid. Level 0 is the image
+        # itself and level k is 2**k times smaller in each dimension
+        self.levels = [pixels]
+
+    def width(self):
+        """Return the width of the image in px."""
+
+        return self.pixels.shape[1]
+
+    def height(self):
+        """Return the height of the image in px."""
+
+        return self.pixels.shape[0]
+
+    def tileGrid(self, level=0):
+        """Return the number of rows and columns of tiles covering the given
+        level of the image pyramid.
+        """
+
+        height, width = self.levels[level].shape
+        return (-(-height // TILESIZE), -(-width // TILESIZE))
+
+    def tileImage(self, row, column, level=0):
+        """Return a QImage of the tile in the given row and column of the
+        given level of the image pyramid. Tiles on the bottom and right edges
+        of the image may be smaller than TILESIZE.
+        """
+
+        # copy the tile's pixels out of the memory-mapped file
+        tilePixels = np.ascontiguousarray(
+            self.levels[level][row * TILESIZE:(row + 1) * TILESIZE,
+                               column * TILESIZE:(column + 1) * TILESIZE])
+
+        # the QImage doesn't own the array's buffer, so return a copy of it
+        return QtGui.QImage(tilePixels.data, tilePixels.shape[1],
+                            tilePixels.shape[0], tilePixels.strides[0],
+                            QtGui.QImage.Format_RGB32).copy()
+
+
+def cacheDirectory():
+    """Return the directory in which decoded images are cached, creating it if
+    it doesn't exist. The directory is private to the user (in the user's
+    cache location, e.g. ~/.cache/traxis), so that no one else can read the
+    cached images or plant cache files in it. Raise OSError if it is not
+    owned by the user.
+    """
+
+    # the user's cache location, falling back to ~/.cache
+    baseDir = QtCore.QStandardPaths.writableLocation(
+        QtCore.QStandardPaths.GenericCacheLocation)
+    if not baseDir:
+        baseDir = os.path.join(os.path.expanduser('~'), '.cache')
+    cacheDir = os.path.join(baseDir, 'traxis')
+    os.makedirs(cacheDir, mode=0o700, exist_ok=True)
+
+    # an existing directory must belong to the user and be kept private
+    if hasattr(os, 'getuid'):
+        dirStat = os.stat(cacheDir)
+        if dirStat.st_uid != os.getuid():
+            raise OSError(
+                "Image cache directory is not owned by the user: {}".format(
+                    cacheDir))
+        if dirStat.st_mode & 0o077:
+            os.chmod(cacheDir, 0o700)
+
+    return cacheDir
+
+def cacheKey(fileName):
+    """Given the file name of an image, return the name (without extension)
+    of its cache files. The name changes whenever the image file is modified.
+    """
+
+    fileStat = os.stat(fileName)
+    fileId = "{}|{}|{}".format(os.path.abspath(fileName), fileStat.st_size,
+                               fileStat.st_mtime_ns)
+    return hashlib.sha1(fileId.encode('utf-8')).hexdigest()
+
+def _writeCacheFile(cacheDir, path, data):
+    """Write data, a bytes object or a contiguous array, to the raw file path
+    in cacheDir atomically, so that processes reading the cache never see a
+    partially written file.
+    """
+
+    fileDescriptor, tempPath = tempfile.mkstemp(dir=cacheDir)
+    try:
+        with os.fdopen(fileDescriptor, 'wb') as tempFile:
+            tempFile.write(memoryview(data))
+        os.replace(tempPath, path)
+    except BaseException:
+        os.remove(tempPath)
+        raise
+
+def writeCacheArray(cacheDir, path, shape, dtype, fill):
+    """Create the raw file path in cacheDir holding an array with the given
+    shape and dtype, whose contents are written by calling fill with the
+    array memory-mapped. The file is written to a temporary file first and
+    moved into place once complete, so that processes reading the cache
+    never see a partially written file.
+    """
+
+    fileDescriptor, tempPath = tempfile.mkstemp(dir=cacheDir)
+    os.close(fileDescriptor)
+    try:
+        array = np.memmap(tempPath, dtype, 'w+', shape=shape)
+        fill(array)
+        array.flush()
+        del array
+        os.replace(tempPath, path)
+    except BaseException:
+        os.remove(tempPath)
+        raise
+
+def openTiledImage(fileName, cacheDir=None):
+    """Given the file name of an image, return a TiledImage of it, or None if
+    the file can't be opened as an image. The first time an image is opened
+    it is decoded and its pixels and blackness plane are written to raw cache
+    files in cacheDir (cacheDirectory() if None); after that it is opened by
+    memory-mapping the cache files without decoding it.
+    """
+
+    if cacheDir is None:
+        cacheDir = cacheDirectory()
+
+    try:
+        key = cacheKey(fileName)
+    except OSError:
+        return None
+    headerPath = os.path.join(cacheDir, key + '.json')
+    pixelsPath = os.path.join(cacheDir, key + '.pixels')
+    blacknessPath = os.path.join(cacheDir, key + '.blackness')
+
+    # try to open the cached image. The header is written last, so if it
+    # exists the other cache files are complete
+    try:
+        with open(headerPath, 'r') as headerFile:
+            shape = tuple(json.load(headerFile)['shape'])
+        tiledImage = TiledImage(
+            np.memmap(pixelsPath, np.uint32, 'r', shape=shape),
+            np.memmap(blacknessPath, np.float32, 'r', shape=shape),
+            os.path.join(cacheDir, key))
+        # mark the cache entry as recently used
+        os.utime(headerPath)
+        return tiledImage
+    except (OSError, ValueError, KeyError):
+        pass
+
+    # 16 bit grayscale TIFF images are read (memory-mapped if possible) with
+    # tifffile. Their blackness is computed from the raw 16 bit intensities,
+    # and only the displayed pixels are reduced to 8 bits
+    gray16 = tiff.readGray16(fileName)
+    if gray16 is not None:
+        intensities, minIsWhite = gray16
+        shape = intensities.shape
+        writeCacheArray(cacheDir, pixelsPath, shape, np.uint32,
+                         lambda pixels: tiff.previewFromGray16(
+                             intensities, minIsWhite, pixels))
+        writeCacheArray(cacheDir, blacknessPath, shape, np.float32,
+                         lambda plane: tiff.blacknessFromGray16(
+                             intensities, minIsWhite, plane))
+        del intensities, gray16
+
+    # other images are decoded with Qt
+    else:
+        image = QtGui.QImage()
+        if not image.load(fileName):
+            return None
+        image = planes.rgb32Image(image)
+        pixels = planes.pixelView(image)
+        shape = pixels.shape
+
+        # write the pixels and the blackness plane to the cache
+        _writeCacheFile(cacheDir, pixelsPath, np.ascontiguousarray(pixels))
+        _writeCacheFile(cacheDir, blacknessPath,
+                        planes.blacknessFromPixels(pixels))
+
+        # free the decoded image before mapping the cache files
+        del pixels, image
+
+    # write the header last, marking the cache entry as complete
+    _writeCacheFile(cacheDir, headerPath, json.dumps(
+        {'fileName': os.path.abspath(fileName),
+         'shape': shape}).encode('utf-8'))
+
+    # keep the cache within its size limit, leaving the new entry in place
+    pruneCache(cacheDir, constants.IMAGECACHEMAXBYTES, keep=key)
+
+    return TiledImage(np.memmap(pixelsPath, np.uint32, 'r', shape=shape),
+                      np.memmap(blacknessPath, np.float32, 'r', shape=shape),
+                      os.path.join(cacheDir, key))
+
+def pruneCache(cacheDir, maxBytes, keep=None):
+    """Remove the least recently used images from the cache in cacheDir until
+    its cache files take up at most maxBytes, never removing the image whose
+    cache key is keep.
+    """
+
+    # collect the size and last use time of each cached image
+    entries = []
+    totalBytes = 0
+    for entryName in os.listdir(cacheDir):
+        key, extension = os.path.splitext(entryName)
+        if extension != '.json':
+            continue
+        # the header comes first so that it is removed first
+        headerPath = os.path.join(cacheDir, entryName)
+        paths = [headerPath] + [
+            path for path in glob.glob(os.path.join(cacheDir,
+                                                    glob.escape(key) + '.*'))
+            if path != headerPath]
+        try:
+            lastUsed = os.stat(paths[0]).st_mtime
+            entryBytes = sum(os.path.getsize(path) for path in paths
+                             if os.path.exists(path))
+        except OSError:
+            continue
+        totalBytes += entryBytes
+        entries.append((lastUsed, key, paths, entryBytes))
+
+    # remove the least recently used images first
+    for lastUsed, key, paths, entryBytes in sorted(entries):
+        if totalBytes <= maxBytes:
+            break
+        if key == keep:
+            continue
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        totalBytes -= entryBytes